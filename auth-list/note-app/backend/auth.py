@@ -9,6 +9,7 @@ from fastapi.security import OAuth2PasswordBearer
 
 from models import TokenData
 from database import get_user_by_id
+import metrics
 
 # Configuration
 SECRET_KEY = "your-secret-key-change-in-production"
@@ -53,6 +54,7 @@ def decode_token(token: str) -> Optional[TokenData]:
         return None
 
 
+@metrics.timed_auth
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
     """Dependency to get the current authenticated user."""
     credentials_exception = HTTPException(
@@ -1,11 +1,39 @@
 """Database initialization and helper functions for TinyDB."""
 
 from tinydb import TinyDB, Query
+from tinydb.storages import JSONStorage
 from typing import Optional
+import orjson
+import os
 import uuid
 
+import metrics
+
+
+class ORJSONStorage(JSONStorage):
+    """TinyDB JSON storage encoded with orjson (same file format, much faster)."""
+
+    def __init__(self, path: str, create_dirs=False, access_mode="rb+", **kwargs):
+        # Binary mode: orjson reads and writes UTF-8 bytes directly
+        super().__init__(path, create_dirs=create_dirs, access_mode=access_mode, **kwargs)
+
+    def read(self) -> Optional[dict]:
+        self._handle.seek(0, os.SEEK_END)
+        if not self._handle.tell():
+            return None
+        self._handle.seek(0)
+        return orjson.loads(self._handle.read())
+
+    def write(self, data: dict):
+        self._handle.seek(0)
+        self._handle.write(orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS))
+        self._handle.flush()
+        os.fsync(self._handle.fileno())
+        self._handle.truncate()
+
+
 # Initialize TinyDB
-db = TinyDB("db.json")
+db = TinyDB("db.json", storage=ORJSONStorage)
 
 # Tables
 users_table = db.table("users")
@@ -105,3 +133,7 @@ def delete_note(note_id: str) -> bool:
     """Delete a note by ID."""
     result = notes_table.remove(Note.id == note_id)
     return len(result) > 0
+
+
+# Opt-in timing of the helpers above (METRICS=1)
+metrics.instrument_functions(globals())
@@ -3,6 +3,7 @@
 from datetime import datetime, timezone
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
 
 from models import UserCreate, UserRead, Token, NoteCreate, NoteRead, NoteShare
@@ -12,8 +13,9 @@ from database import (
     create_note, get_notes_for_user, get_note_by_id,
     share_note, unshare_note
 )
+import metrics
 
-app = FastAPI(title="Note Personali API")
+app = FastAPI(title="Note Personali API", default_response_class=ORJSONResponse)
 
 # CORS middleware
 app.add_middleware(
@@ -24,6 +26,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Server-Timing, /metrics and per-helper timings with METRICS=1
+metrics.install(app)
+
 
 @app.post("/register", response_model=UserRead)
 async def register(user: UserCreate):
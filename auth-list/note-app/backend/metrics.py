@@ -0,0 +1,253 @@
+"""
+Opt-in request instrumentation (``METRICS=1``).
+
+Records per-route latency histograms, the time spent in the database.py
+helpers and in authentication, and the TinyDB table scans with the rows
+they visit. Each response carries a ``Server-Timing`` header with the
+figures of that request; /metrics serves the totals in Prometheus text
+format.
+
+A subset of lupus-in-tabula/backend/metrics.py (no named spans beyond
+auth, module functions instead of Database methods): the two apps ship
+separately, so fixes to the shared parts (the TinyDB patches, the
+histogram, the exposition format) go to both files.
+
+When disabled nothing is patched, wrapped or mounted.
+"""
+from __future__ import annotations
+
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+ENABLED = os.getenv("METRICS", "0") == "1"
+
+# Latency histogram buckets (seconds)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Per request: {"auth": s, "db": s, "db_calls": n, "scans": n, "rows": n, "scope": asgi scope}
+_current: ContextVar[dict | None] = ContextVar("metrics_request", default=None)
+_local = threading.local()  # helper call depth: nested calls count once
+_lock = threading.Lock()
+
+# Totals since startup
+_latency: dict[tuple[str, str], list] = {}           # (method, route) -> [buckets..., sum, count]
+_db: dict[str, list] = defaultdict(lambda: [0, 0.0])  # function -> [calls, seconds]
+_scans: dict[tuple[str, str], list] = defaultdict(lambda: [0, 0])  # (route, table) -> [scans, rows]
+
+
+def timed_auth(fn):
+    """Add the time spent in an async auth dependency to the ``auth`` span."""
+    if not ENABLED:
+        return fn
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            stats = _current.get()
+            if stats is not None:
+                stats["auth"] += time.perf_counter() - start
+    return wrapper
+
+
+def _timed_call(name: str, fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        depth = getattr(_local, "depth", 0)
+        _local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            _local.depth = depth
+            with _lock:
+                _db[name][0] += 1
+                _db[name][1] += elapsed
+            stats = _current.get()
+            if stats is not None and depth == 0:
+                stats["db"] += elapsed
+                stats["db_calls"] += 1
+    return wrapper
+
+
+def instrument_functions(namespace: dict):
+    """Time every public function defined in a module (pass its ``globals()``)."""
+    if not ENABLED:
+        return
+    for name, fn in list(namespace.items()):
+        if (not name.startswith("_") and inspect.isfunction(fn)
+                and fn.__module__ == namespace["__name__"]):
+            namespace[name] = _timed_call(name, fn)
+
+
+# ── TinyDB scans (same patches as the lupus backend) ───
+
+def _record_scan(table: str, rows: int):
+    stats = _current.get()
+    route = ""
+    if stats is not None:
+        stats["scans"] += 1
+        stats["rows"] += rows
+        route = _route(stats["scope"])
+    with _lock:
+        _scans[(route, table)][0] += 1
+        _scans[(route, table)][1] += rows
+
+
+_tinydb_patched = False
+
+
+def _patch_tinydb():
+    """Count full-table passes: searches missing the query cache, iteration
+    (``all()``), lookups by condition and the table rebuild behind every write."""
+    global _tinydb_patched
+    if _tinydb_patched:
+        return
+    _tinydb_patched = True
+    from tinydb.table import Table
+
+    read_table, search, iterate, get, update_table = (
+        Table._read_table, Table.search, Table.__iter__, Table.get, Table._update_table)
+
+    def _read_table(self):
+        table = read_table(self)
+        _local.reads = getattr(_local, "reads", 0) + 1
+        _local.size = len(table)
+        return table
+
+    def _search(self, cond):
+        reads = getattr(_local, "reads", 0)
+        result = search(self, cond)
+        if getattr(_local, "reads", 0) != reads:  # not served by the query cache
+            _record_scan(self.name, _local.size)
+        return result
+
+    def _iter(self):
+        rows = 0
+        try:
+            for doc in iterate(self):
+                rows += 1
+                yield doc
+        finally:
+            _record_scan(self.name, rows)
+
+    def _get(self, cond=None, doc_id=None, doc_ids=None):
+        result = get(self, cond, doc_id, doc_ids)
+        if cond is not None and doc_id is None and doc_ids is None:
+            _record_scan(self.name, _local.size)
+        return result
+
+    def _update_table(self, updater):
+        def counted(table: dict):
+            _record_scan(self.name, len(table))
+            updater(table)
+        update_table(self, counted)
+
+    Table._read_table = _read_table
+    Table.search = _search
+    Table.__iter__ = _iter
+    Table.get = _get
+    Table._update_table = _update_table
+
+
+# ── Middleware and endpoint ────────────────────────────
+
+class MetricsMiddleware:
+    """ASGI middleware: Server-Timing and latency histograms."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = {"auth": 0.0, "db": 0.0, "db_calls": 0, "scans": 0, "rows": 0, "scope": scope}
+        token = _current.set(stats)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                timing = (f"app;dur={(time.perf_counter() - start) * 1000:.2f}, "
+                          f"auth;dur={stats['auth'] * 1000:.2f}, "
+                          f'db;dur={stats["db"] * 1000:.2f};desc="{stats["db_calls"]} calls", '
+                          f'tinydb;desc="{stats["scans"]} scans, {stats["rows"]} rows"')
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (b"server-timing", timing.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            _observe(scope["method"], _route(scope) or "<unmatched>",
+                     time.perf_counter() - start)
+
+
+def _route(scope: dict) -> str:
+    """Path template of the matched route ("/notes/{note_id}"), or ""."""
+    route = scope.get("route")
+    return route.path if route else ""
+
+
+def _observe(method: str, route: str, seconds: float):
+    with _lock:
+        h = _latency.get((method, route))
+        if h is None:
+            h = _latency[(method, route)] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                h[i] += 1
+        h[-2] += seconds
+        h[-1] += 1
+
+
+def render() -> str:
+    """All totals in Prometheus text exposition format."""
+    out = [
+        "# HELP http_request_duration_seconds Request latency by route.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    with _lock:
+        for (method, route), h in sorted(_latency.items()):
+            labels = f'method="{method}",route="{route}"'
+            for bound, count in zip(BUCKETS, h):
+                out.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            out.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {h[-1]}')
+            out.append(f"http_request_duration_seconds_sum{{{labels}}} {h[-2]:.6f}")
+            out.append(f"http_request_duration_seconds_count{{{labels}}} {h[-1]}")
+        out += ["# HELP db_calls_total Database helper calls.",
+                "# TYPE db_calls_total counter"]
+        out += [f'db_calls_total{{function="{f}"}} {c}' for f, (c, _) in sorted(_db.items())]
+        out += ["# HELP db_call_seconds_total Time spent in each database helper.",
+                "# TYPE db_call_seconds_total counter"]
+        out += [f'db_call_seconds_total{{function="{f}"}} {s:.6f}' for f, (_, s) in sorted(_db.items())]
+        out += ["# HELP tinydb_scans_total Full TinyDB table passes by route and table.",
+                "# TYPE tinydb_scans_total counter"]
+        out += [f'tinydb_scans_total{{route="{r}",table="{t}"}} {n}'
+                for (r, t), (n, _) in sorted(_scans.items())]
+        out += ["# HELP tinydb_rows_scanned_total Rows visited by those passes.",
+                "# TYPE tinydb_rows_scanned_total counter"]
+        out += [f'tinydb_rows_scanned_total{{route="{r}",table="{t}"}} {rows}'
+                for (r, t), (_, rows) in sorted(_scans.items())]
+    return "\n".join(out) + "\n"
+
+
+def install(app: FastAPI):
+    """Instrument ``app`` if enabled; otherwise do nothing."""
+    if not ENABLED:
+        return
+    _patch_tinydb()
+    app.add_middleware(MetricsMiddleware)
+    app.add_api_route("/metrics", lambda: PlainTextResponse(
+        render(), media_type="text/plain; version=0.0.4"), methods=["GET"], include_in_schema=False)
@@ -0,0 +1,110 @@
+"""
+Archive of finished games: one gzip JSON-lines file per month.
+
+Each game is written as its own gzip member (``{"game", "players",
+"guesses", "events"}`` on one line), so a month file still decompresses
+with ``zcat`` as a whole, while ``index.jsonl`` records where each member
+starts and a single game is read with one seek instead of a scan.
+"""
+from __future__ import annotations
+
+import gzip
+import os
+import threading
+import time
+
+import orjson
+
+from cache import TTLCache
+
+
+class GameArchive:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._index: dict[str, tuple[str, int, int]] = {}  # id -> (file, offset, length)
+        self._index_pos = 0  # bytes of index.jsonl already loaded
+        self._lock = threading.Lock()
+        # Archived games never change: keep the last ones read
+        self._cache = TTLCache(maxsize=256, ttl=float("inf"))
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _refresh(self):
+        """Load index lines appended since the last call (possibly by another process)."""
+        try:
+            f = open(self._path("index.jsonl"), "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(self._index_pos)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # being written: read it next time
+                self._index_pos += len(line)
+                entry = orjson.loads(line)
+                self._index[entry["id"]] = (entry["file"], entry["offset"], entry["length"])
+
+    def __contains__(self, game_id: str) -> bool:
+        with self._lock:
+            if game_id not in self._index:
+                self._refresh()
+            return game_id in self._index
+
+    def add(self, record: dict, when: float):
+        """Append a finished game to the file of the month of ``when``."""
+        game_id = record["game"]["id"]
+        name = time.strftime("%Y-%m", time.localtime(when)) + ".jsonl.gz"
+        member = gzip.compress(orjson.dumps(record) + b"\n")
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path(name), "ab") as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(member)
+                f.flush()
+                os.fsync(f.fileno())
+            # The index line goes last: a crash in between leaves unindexed
+            # bytes, never an entry pointing at a partial member
+            entry = {"id": game_id, "file": name, "offset": offset, "length": len(member)}
+            with open(self._path("index.jsonl"), "ab") as f:
+                f.write(orjson.dumps(entry) + b"\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._index[game_id] = (name, offset, len(member))
+
+    def get(self, game_id: str) -> dict | None:
+        record = self._cache.get(game_id)
+        if record is not None:
+            return record
+        with self._lock:
+            if game_id not in self._index:
+                self._refresh()
+            location = self._index.get(game_id)
+        if location is None:
+            return None
+        name, offset, length = location
+        with open(self._path(name), "rb") as f:
+            f.seek(offset)
+            record = orjson.loads(gzip.decompress(f.read(length)))
+        self._cache.put(game_id, record)
+        return record
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._refresh()
+            months: dict[str, int] = {}
+            for name, _, _ in self._index.values():
+                months[name] = months.get(name, 0) + 1
+        return {"games": sum(months.values()), "files": months}
+
+    def clear(self):
+        with self._lock:
+            self._refresh()
+            for name in {name for name, _, _ in self._index.values()} | {"index.jsonl"}:
+                try:
+                    os.remove(self._path(name))
+                except FileNotFoundError:
+                    pass
+            self._index.clear()
+            self._index_pos = 0
+        self._cache.clear()
@@ -0,0 +1,48 @@
+"""
+Archive finished games by hand and compact the database.
+
+    python archive_games.py [--days 30] [--sqlite] [path]
+
+The backend does the same every hour (``LUPUS_ARCHIVE_DAYS``). With
+TinyDB run it only while the backend is stopped: the server keeps
+``db.json`` in memory and would overwrite the compacted file.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+
+from database import Database
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archivia le partite finite e compatta il database")
+    parser.add_argument("path", nargs="?", default=None,
+                        help="database (default: db.json, o lupus.sqlite con --sqlite)")
+    parser.add_argument("--sqlite", action="store_true",
+                        default=os.getenv("LUPUS_DB", "tinydb") == "sqlite",
+                        help="usa il backend SQLite (default: da LUPUS_DB)")
+    parser.add_argument("--days", type=float, default=30,
+                        help="archivia le partite finite da più di N giorni (default: 30)")
+    args = parser.parse_args()
+
+    if args.sqlite:
+        from sqlite_db import SQLiteDatabase
+        db = SQLiteDatabase(args.path or "lupus.sqlite")
+    else:
+        db = Database(args.path or "db.json", flush_every=0, flush_interval_ms=0)
+    try:
+        total = 0
+        while n := db.archive_finished_games(time.time() - args.days * 86400):
+            total += n
+        db.compact()
+        print(f"archiviate {total} partite")
+        for name, n in sorted(db.archive.stats()["files"].items()):
+            print(f"{name:20} {n}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,593 @@
+"""
+Benchmark harness for the Lupus backend.
+
+    python bench.py load  [--games 10 --players 8 --duration 120]
+    python bench.py micro [--sizes 1000,10000,100000 --backend tinydb]
+    python bench.py json  [db.json]
+
+``load`` simulates whole classes of players: they register, create and
+join games, poll ``/game_state`` (with ``If-None-Match``), submit night
+actions, votes and guesses. By default the app runs in-process with a
+fresh database in a temp dir and short phases (``--phase-seconds``);
+with ``--url`` it targets a running server instead. It reports p50/p95/p99
+latency per endpoint, throughput and the growth of the database files.
+
+``micro`` times ``night.resolve_night`` (pure), ``_resolve_night``
+(with the diff applied), ``_check_win``, one /game_state poll
+(``_build_game_state`` for a Lupo at night, cached and rebuilt) and the
+``Database``
+methods one by one, on databases pre-filled with N rows per table
+(``--sizes 1000,10000,100000,1000000`` for the full range).
+
+``json`` compares the stdlib stack (``json`` storage, ``jsonable_encoder``
+plus ``JSONResponse``) with orjson (``ORJSONStorage``, ``ORJSONResponse``)
+on a real db.json: load, flush, and rendering pages of each table as
+responses. Without the file it generates one (``--rows`` per table).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from models import IDLE_ROLES
+
+PASSWORD = "benchpw"
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _size(path: str) -> int:
+    if os.path.isdir(path):
+        return sum(_size(os.path.join(path, f)) for f in os.listdir(path))
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+# ═══════════════════════════════════════════════════════
+#  LOAD TEST
+# ═══════════════════════════════════════════════════════
+
+class Recorder:
+    """Latency samples per endpoint, shared by all player threads."""
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.not_modified = 0
+        self._lock = threading.Lock()
+
+    def call(self, label: str, fn, *args, **kwargs):
+        start = time.perf_counter()
+        r = fn(*args, **kwargs)
+        ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.samples[label].append(ms)
+            if r.status_code == 304:
+                self.not_modified += 1
+            elif r.status_code >= 400:
+                self.errors[label] += 1
+        return r
+
+
+class SimPlayer:
+    def __init__(self, client, name: str, rec: Recorder):
+        self.client = client
+        self.name = name
+        self.rec = rec
+        self.etag: str | None = None
+        self.state: dict | None = None
+        self.done: set[tuple] = set()  # (phase, turn, kind) already submitted
+
+    def register(self):
+        r = self.rec.call("POST /register", self.client.post, "/register",
+                          json={"username": self.name, "password": PASSWORD})
+        if r.status_code == 400:  # reused server: already registered
+            self.rec.call("POST /login", self.client.post, "/login",
+                          json={"username": self.name, "password": PASSWORD})
+
+    def poll(self, game_id: str, use_etag: bool) -> dict | None:
+        headers = {"If-None-Match": self.etag} if use_etag and self.etag else {}
+        r = self.rec.call("GET /game_state", self.client.get,
+                          f"/game_state/{game_id}", headers=headers)
+        if r.status_code == 200:
+            self.etag = r.headers.get("etag")
+            self.state = r.json()
+        return self.state
+
+    def act(self, game_id: str, role_actions: dict[str, list[str]]):
+        st = self.state
+        me = st and st.get("me")
+        if not me or not me["is_alive"] or st["state"] not in ("NIGHT", "DAY"):
+            return
+        phase, turn = st["state"], st["turn_number"]
+        others = [p["id"] for p in st["players"] if p["is_alive"] and p["id"] != me["id"]]
+        if not others:
+            return
+        target = random.choice(others)
+
+        if phase == "NIGHT" and (phase, turn, "action") not in self.done:
+            actions = [a for a in role_actions.get(me["role"], [])
+                       if a != "EXPLODE" and (a != "COPY" or turn == 2)]
+            if actions:
+                self.done.add((phase, turn, "action"))
+                self.rec.call("POST /action", self.client.post, f"/action/{game_id}",
+                              json={"target_id": target, "action_type": actions[0]})
+        if phase == "DAY" and (phase, turn, "vote") not in self.done:
+            self.done.add((phase, turn, "vote"))
+            self.rec.call("POST /vote", self.client.post, f"/vote/{game_id}",
+                          json={"target_id": target})
+        if me["role"] in IDLE_ROLES and (phase, turn, "guess") not in self.done:
+            self.done.add((phase, turn, "guess"))
+            role = random.choice(list((st.get("roles_in_game") or {"Villico": 1}).keys()))
+            self.rec.call("POST /guess", self.client.post, f"/guess/{game_id}",
+                          json={"target_id": target, "guessed_role": role})
+
+
+def _run_game(players: list[SimPlayer], args, role_actions, deadline: float) -> bool:
+    """Set up one game and play it until GAME_OVER or the deadline."""
+    for p in players:
+        p.register()
+    host = players[0]
+    r = host.rec.call("POST /create_game", host.client.post, "/create_game",
+                      json={"target_players": len(players)})
+    game_id = r.json()["game_id"]
+    for p in players[1:]:
+        p.rec.call("GET /games", p.client.get, "/games")
+        p.rec.call("POST /join_game", p.client.post, f"/join_game/{game_id}")
+
+    while time.time() < deadline:
+        tick = time.perf_counter()
+        over = True
+        for p in players:
+            st = p.poll(game_id, not args.no_etag)
+            p.act(game_id, role_actions)
+            over = over and st is not None and st["state"] == "GAME_OVER"
+        if over:
+            for p in players:
+                p.rec.call("GET /history", p.client.get, "/history")
+            return True
+        time.sleep(max(0.0, args.poll_interval - (time.perf_counter() - tick)))
+    return False
+
+
+def run_load(args) -> dict:
+    random.seed(args.seed)
+    work = None
+    if args.url:
+        import httpx
+        make_client = lambda: httpx.Client(base_url=args.url, timeout=30)
+        db_paths = list(args.db_path or [])
+        app_ctx = None
+        role_actions = _role_actions()
+    else:
+        work = tempfile.mkdtemp(prefix="lupus-bench-")
+        os.environ["LUPUS_DB_PATH"] = os.path.join(
+            work, "lupus.sqlite" if os.getenv("LUPUS_DB") == "sqlite" else "db.json")
+        import main
+        from fastapi.testclient import TestClient
+        main.NIGHT_DURATION = main.DAY_DURATION = main.REVEAL_DURATION = args.phase_seconds
+        make_client = lambda: TestClient(main.app)
+        db_paths = [work]
+        app_ctx = TestClient(main.app)
+        app_ctx.__enter__()  # runs the lifespan: scheduler, hasher, sweeper
+        role_actions = _role_actions()
+
+    rec = Recorder()
+    tag = f"{random.randrange(36 ** 4):04x}"
+    games = [
+        [SimPlayer(make_client(), f"b{tag}g{g}p{i}", rec) for i in range(args.players)]
+        for g in range(args.games)
+    ]
+
+    sizes: list[tuple[float, int]] = []
+    stop = threading.Event()
+
+    def sample_size():
+        while not stop.is_set():
+            sizes.append((time.time(), sum(_size(p) for p in db_paths)))
+            stop.wait(1)
+
+    sampler = threading.Thread(target=sample_size, daemon=True)
+    sampler.start()
+    start = time.time()
+    deadline = start + args.duration
+    try:
+        with ThreadPoolExecutor(args.games) as pool:
+            finished = sum(pool.map(
+                lambda players: _run_game(players, args, role_actions, deadline), games))
+    finally:
+        elapsed = time.time() - start
+        stop.set()
+        sampler.join()
+        sizes.append((time.time(), sum(_size(p) for p in db_paths)))
+        if app_ctx is not None:
+            app_ctx.__exit__(None, None, None)
+        if work and not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+    total = sum(len(v) for v in rec.samples.values())
+    return {
+        "games": args.games, "players": args.players, "finished": finished,
+        "seconds": round(elapsed, 2), "requests": total,
+        "throughput": round(total / elapsed, 1) if elapsed else 0.0,
+        "not_modified": rec.not_modified,
+        "endpoints": {
+            label: {
+                "count": len(v), "errors": rec.errors.get(label, 0),
+                "p50": _percentile(v, 0.50), "p95": _percentile(v, 0.95),
+                "p99": _percentile(v, 0.99), "max": max(v),
+            }
+            for label, v in sorted(rec.samples.items())
+        },
+        "db_bytes": {"start": sizes[0][1] if sizes else 0,
+                     "end": sizes[-1][1] if sizes else 0,
+                     "peak": max((s for _, s in sizes), default=0)},
+    }
+
+
+def print_load(res: dict):
+    print(f"{res['games']} partite x {res['players']} giocatori, "
+          f"{res['finished']} concluse in {res['seconds']} s")
+    print(f"{res['requests']} richieste, {res['throughput']} req/s, "
+          f"{res['not_modified']} risposte 304")
+    print(f"\n{'endpoint':22} {'count':>7} {'err':>5} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'max ms':>8}")
+    for label, e in res["endpoints"].items():
+        print(f"{label:22} {e['count']:7} {e['errors']:5} {e['p50']:8.2f} {e['p95']:8.2f} "
+              f"{e['p99']:8.2f} {e['max']:8.2f}")
+    b = res["db_bytes"]
+    print(f"\ndatabase: {b['start'] / 1024:.1f} KiB -> {b['end'] / 1024:.1f} KiB "
+          f"(picco {b['peak'] / 1024:.1f} KiB)")
+
+
+def _role_actions() -> dict[str, list[str]]:
+    from models import ROLE_ACTIONS
+    return ROLE_ACTIONS
+
+
+# ═══════════════════════════════════════════════════════
+#  MICRO BENCHMARKS
+# ═══════════════════════════════════════════════════════
+
+def _fill_tables(n: int) -> dict[str, dict[str, dict]]:
+    """Raw TinyDB tables with ``n`` rows each (games: one per 8 players)."""
+    now = time.time()
+    states = ["GAME_OVER"] * 8 + ["LOBBY", "NIGHT"]
+    n_games = max(1, n // 8)
+    games = {
+        str(i + 1): {
+            "id": f"G{i:07d}", "state": states[i % len(states)], "creator_id": f"u{i * 8:09d}",
+            "target_players": 8, "turn_number": 1, "phase_end_time": 0,
+            "roles_in_game": {}, "winners": "", "winner_detail": "",
+            "last_day_burned_nick": "", "last_day_burned_role": "",
+            "night_deaths": [], "day_deaths": [], "created_at": now,
+        }
+        for i in range(n_games)
+    }
+    tables = {"users": {}, "sessions": {}, "players": {},
+              "actions": {}, "votes": {}, "guesses": {}, "games": games}
+    for i in range(n):
+        k, uid, gid, pid = str(i + 1), f"u{i:09d}", f"G{(i // 8) % n_games:07d}", f"p{i:09d}"
+        tid = f"p{(i // 8) * 8 + (i + 1) % 8:09d}"
+        tables["users"][k] = {
+            "id": uid, "username": f"user{i}", "password_hash": "", "salt": "",
+            "created_at": now, "stats": {"games": 0, "wins": 0, "wolf_wins": 0, "village_wins": 0},
+        }
+        tables["sessions"][k] = {"id": f"s{i:09d}", "user_id": uid,
+                                 "created_at": now, "expires_at": now + 86400}
+        tables["players"][k] = {
+            "id": pid, "game_id": gid, "user_id": uid, "nickname": f"user{i}",
+            "role": "Villico", "original_role": "Villico", "is_alive": True, "attributes": {},
+        }
+        tables["actions"][k] = {"game_id": gid, "player_id": pid,
+                                "target_id": tid, "action_type": "KILL"}
+        tables["votes"][k] = {"game_id": gid, "player_id": pid, "target_id": tid}
+        tables["guesses"][k] = {"game_id": gid, "player_id": pid,
+                                "target_id": tid, "guessed_role": "Lupo"}
+    return tables
+
+
+def _open_db(backend: str, work: str, tables: dict):
+    if backend == "sqlite":
+        from sqlite_db import SQLiteDatabase
+        db = SQLiteDatabase(os.path.join(work, "bench.sqlite"), flush_on_transition=False)
+        db.import_tables(tables)
+        return db
+    from database import Database
+    path = os.path.join(work, "db.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(tables, f)
+    # No background flushes: time the in-memory operations only
+    return Database(path, flush_every=0, flush_interval_ms=0, flush_on_transition=False)
+
+
+def _time_op(fn, ops: int, budget: float) -> float:
+    """Median microseconds per call, over at most ``ops`` calls or ``budget`` s."""
+    times = []
+    end = time.perf_counter() + budget
+    for i in range(ops):
+        start = time.perf_counter()
+        fn(i)
+        times.append(time.perf_counter() - start)
+        if time.perf_counter() > end:
+            break
+    return _percentile(times, 0.5) * 1e6
+
+
+def _db_ops(db, n: int) -> dict:
+    n_games = max(1, n // 8)
+    r = random.Random(0)
+    user = lambda: f"u{r.randrange(n):09d}"
+    game = lambda: f"G{r.randrange(n_games):07d}"
+    player = lambda: f"p{r.randrange(n):09d}"
+    return {
+        "get_user": lambda i: db.get_user(user()),
+        "get_user_by_username": lambda i: db.get_user_by_username(f"user{r.randrange(n)}"),
+        "get_session": lambda i: db.get_session(f"s{r.randrange(n):09d}"),
+        "get_game": lambda i: db.get_game(game()),
+        "get_game_players": lambda i: db.get_game_players(game()),
+        "get_player_in_game": lambda i: db.get_player_in_game(game(), user()),
+        "get_actions": lambda i: db.get_actions(game()),
+        "get_votes": lambda i: db.get_votes(game()),
+        "get_guesses": lambda i: db.get_guesses(game()),
+        "get_events": lambda i: list(db.get_events(game())),
+        "list_open_games": lambda i: db.list_open_games(),
+        "list_running_games": lambda i: db.list_running_games(),
+        "find_active_game_for_user": lambda i: db.find_active_game_for_user(user()),
+        "list_finished_games_for_user": lambda i: db.list_finished_games_for_user(user()),
+        "load_game": lambda i: (db.load_game(game()), db._active.clear()),
+        "update_game": lambda i: db.update_game(game(), {"turn_number": i}),
+        "update_user_stats": lambda i: db.update_user_stats(user(), "games"),
+        "upsert_action": lambda i: db.upsert_action(game(), player(), player(), "KILL"),
+        "upsert_vote": lambda i: db.upsert_vote(game(), player(), player()),
+        "upsert_guess": lambda i: db.upsert_guess(game(), player(), player(), "Lupo"),
+        "add_event": lambda i: db.add_event(game(), 1, "NIGHT", "bench", "x"),
+        "create_session": lambda i: db.create_session(user()),
+        "add_player": lambda i: db.add_player(game(), user(), "bench"),
+    }
+
+
+def _sample_game(n_players: int, seed: int):
+    """An ActiveGame at night 2 with random roles and one action per actor."""
+    from tinydb.table import Document
+    from game import ActiveGame, PlayerRecord
+    from models import ROLE_ACTIONS, get_role_distribution
+    r = random.Random(seed)
+    roles = get_role_distribution(n_players)
+    r.shuffle(roles)
+    players = [
+        PlayerRecord(doc_id=i + 1, id=f"p{i}", game_id="BENCH", user_id=f"u{i}",
+                     nickname=f"user{i}", role=role.value, original_role=role.value)
+        for i, role in enumerate(roles)
+    ]
+    actions = []
+    for p in players:
+        allowed = [a for a in ROLE_ACTIONS.get(p.role, []) if a != "EXPLODE"]
+        if allowed:
+            target = r.choice([q for q in players if q is not p])
+            actions.append({"game_id": "BENCH", "player_id": p.id,
+                            "target_id": target.id, "action_type": allowed[0]})
+    game = Document({"id": "BENCH", "state": "NIGHT", "turn_number": 2,
+                     "phase_end_time": 0, "night_deaths": []}, doc_id=1)
+    return ActiveGame(game, players, actions, [])
+
+
+def _poll_game(db, n_players: int, seed: int) -> tuple[str, str]:
+    """Store a sample NIGHT game; return its id and the user id of a Lupo."""
+    ag = _sample_game(n_players, seed)
+    game_id = db.create_game("bench", n_players)["id"]
+    ids, wolf = {}, ""
+    for p in ag.all_players():
+        ids[p.id] = db.add_player(game_id, p.user_id, p.nickname)["id"]
+        db.update_player(ids[p.id], {"role": p.role, "original_role": p.role})
+        if p.role == "Lupo":
+            wolf = p.user_id
+    for a in ag.actions:
+        db.upsert_action(game_id, ids[a["player_id"]], ids[a["target_id"]], a["action_type"])
+    db.update_game(game_id, {"state": "NIGHT", "turn_number": 2,
+                             "phase_end_time": time.time() + 3600})
+    return game_id, wolf
+
+
+def _night_arrays(ag) -> tuple:
+    """``night.resolve_night`` arguments for a sample game."""
+    from models import ACTION_CODE, ROLE_CODE
+    players = ag.all_players()
+    index = {p.id: i for i, p in enumerate(players)}
+    return (ag.turn, [ROLE_CODE[p.role] for p in players], [p.is_alive for p in players],
+            [p.nickname for p in players],
+            [(index[a["player_id"]], index[a["target_id"]], ACTION_CODE[a["action_type"]])
+             for a in ag.actions])
+
+
+def run_micro(args) -> dict:
+    work = tempfile.mkdtemp(prefix="lupus-bench-")
+    os.environ.setdefault("LUPUS_DB_PATH", os.path.join(work, "app.json"))
+    results: dict[str, dict] = {"game_logic": {}, "database": {}}
+    try:
+        import main
+        from night import resolve_night
+        for n_players in (8, 16, 30):
+            samples = [_sample_game(n_players, s) for s in range(args.ops)]
+            arrays = [_night_arrays(ag) for ag in samples]
+            results["game_logic"][n_players] = {
+                "resolve_night": _time_op(lambda i: resolve_night(*arrays[i]),
+                                          args.ops, args.budget),
+                "_resolve_night": _time_op(lambda i: main._resolve_night(samples[i]),
+                                           args.ops, args.budget),
+                "_check_win": _time_op(lambda i: main._check_win(samples[i]),
+                                       args.ops, args.budget),
+            }
+            game_id, wolf = _poll_game(main.db, n_players, n_players)
+            results["game_logic"][n_players]["poll (Lupo, notte)"] = _time_op(
+                lambda i: main._build_game_state(game_id, wolf), args.ops, args.budget)
+
+            def cold_poll(i):
+                main._public_cache.clear()
+                main._state_cache.clear()
+                main._build_game_state(game_id, wolf)
+            results["game_logic"][n_players]["poll senza cache"] = _time_op(
+                cold_poll, args.ops, args.budget)
+        for n in args.sizes:
+            sub = os.path.join(work, str(n))
+            os.makedirs(sub)
+            t = time.perf_counter()
+            db = _open_db(args.backend, sub, _fill_tables(n))
+            load_s = time.perf_counter() - t
+            try:
+                row = {"(open, ms)": load_s * 1000}
+                for name, fn in _db_ops(db, n).items():
+                    row[name] = _time_op(fn, args.ops, args.budget)
+                results["database"][n] = row
+            finally:
+                db.close()
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return results
+
+
+def print_micro(res: dict, backend: str):
+    print("game logic (µs/call, mediana)")
+    counts = list(res["game_logic"])
+    print(f"{'giocatori':28}" + "".join(f"{c:>12}" for c in counts))
+    for fn in ("resolve_night", "_resolve_night", "_check_win",
+               "poll (Lupo, notte)", "poll senza cache"):
+        print(f"{fn:28}" + "".join(f"{res['game_logic'][c][fn]:12.1f}" for c in counts))
+    print(f"\nDatabase [{backend}] (µs/call, mediana; apertura e indici in ms)")
+    sizes = list(res["database"])
+    print(f"{'righe per tabella':28}" + "".join(f"{s:>12}" for s in sizes))
+    for name in next(iter(res["database"].values()), {}):
+        print(f"{name:28}" + "".join(f"{res['database'][s][name]:12.1f}" for s in sizes))
+
+
+# ═══════════════════════════════════════════════════════
+
+def run_json(args) -> dict:
+    import orjson
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    from storage import ORJSONStorage
+
+    class StdlibStorage(ORJSONStorage):
+        # Benchmark only: nothing else touches ``data`` while it is encoded
+        def dumps(self, data: dict) -> bytes:
+            return json.dumps(data).encode()
+
+    work = tempfile.mkdtemp(prefix="lupus-bench-")
+    try:
+        path = args.path
+        if not os.path.exists(path):
+            print(f"{path} non trovato: genero {args.rows} righe per tabella")
+            path = os.path.join(work, "db.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(_fill_tables(args.rows), f)
+        with open(path, "rb") as f:
+            raw = f.read()
+        data = json.loads(raw)
+        out = os.path.join(work, "flush.json")
+        std, fast = StdlibStorage(out), ORJSONStorage(out)
+
+        def best_ms(fn) -> float:
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                fn()
+                times.append(time.perf_counter() - start)
+            return min(times) * 1000
+
+        res = {
+            "file": path, "bytes": len(raw),
+            "db.json (ms)": {
+                "load": (best_ms(lambda: json.loads(raw)), best_ms(lambda: orjson.loads(raw))),
+                "flush": (best_ms(lambda: std.write(data)), best_ms(lambda: fast.write(data))),
+            },
+            "risposte (µs)": {},
+        }
+        for table, docs in data.items():
+            page = list(docs.values())[:args.page]
+            if not page:
+                continue
+            res["risposte (µs)"][f"{table} x{len(page)}"] = (
+                _time_op(lambda i: JSONResponse(jsonable_encoder(page)), 200, 2.0),
+                _time_op(lambda i: ORJSONResponse(page), 200, 2.0),
+            )
+        return res
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def print_json(res: dict):
+    print(f"{res['file']}: {res['bytes'] / 1e6:.1f} MB")
+    for section in ("db.json (ms)", "risposte (µs)"):
+        print(f"\n{section:28}{'json':>12}{'orjson':>12}{'x':>8}")
+        for name, (std, fast) in res[section].items():
+            print(f"{name:28}{std:12.1f}{fast:12.1f}{std / fast if fast else 0:8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del backend Lupus")
+    parser.add_argument("--json", help="salva i risultati in questo file")
+    parser.add_argument("--seed", type=int, default=1)
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    load = sub.add_parser("load", help="giocatori simulati contro l'API")
+    load.add_argument("--games", type=int, default=10)
+    load.add_argument("--players", type=int, default=8)
+    load.add_argument("--duration", type=float, default=120, help="secondi massimi")
+    load.add_argument("--poll-interval", type=float, default=2.0,
+                      help="secondi tra due /game_state dello stesso giocatore")
+    load.add_argument("--phase-seconds", type=int, default=5,
+                      help="durata delle fasi (solo in-process)")
+    load.add_argument("--no-etag", action="store_true", help="non inviare If-None-Match")
+    load.add_argument("--url", help="server già avviato, es. http://127.0.0.1:8000")
+    load.add_argument("--db-path", action="append",
+                      help="file/cartelle del server da misurare (con --url)")
+    load.add_argument("--keep", action="store_true", help="non cancellare la cartella temporanea")
+
+    micro = sub.add_parser("micro", help="tempi delle singole funzioni")
+    micro.add_argument("--sizes", default="1000,10000,100000",
+                       type=lambda s: [int(x) for x in s.split(",")],
+                       help="righe per tabella, es. 1000,10000,100000,1000000")
+    micro.add_argument("--backend", choices=("tinydb", "sqlite"), default="tinydb")
+    micro.add_argument("--ops", type=int, default=500, help="chiamate per funzione")
+    micro.add_argument("--budget", type=float, default=2.0, help="secondi massimi per funzione")
+
+    js = sub.add_parser("json", help="json della libreria standard contro orjson")
+    js.add_argument("path", nargs="?", default=os.getenv("LUPUS_DB_PATH", "db.json"))
+    js.add_argument("--rows", type=int, default=10000,
+                    help="righe per tabella se il file non esiste")
+    js.add_argument("--page", type=int, default=200, help="righe per risposta")
+    js.add_argument("--repeat", type=int, default=5, help="ripetizioni di load e flush")
+
+    args = parser.parse_args()
+    random.seed(args.seed)
+    if args.mode == "load":
+        res = run_load(args)
+        print_load(res)
+    elif args.mode == "micro":
+        res = run_micro(args)
+        print_micro(res, args.backend)
+    else:
+        res = run_json(args)
+        print_json(res)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(res, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
@@ -0,0 +1,49 @@
+"""
+Game change notifications for the streaming endpoint.
+
+Writes happen in FastAPI's threadpool, streams wait on the event loop:
+``publish`` hops onto the loop and wakes every subscriber of that game.
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class GameBroadcaster:
+    def __init__(self):
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._waiters: dict[str, set[asyncio.Event]] = defaultdict(set)
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def publish(self, game_id: str):
+        """Thread-safe: signal that ``game_id`` changed."""
+        if self._loop is None or self._loop.is_closed():
+            return
+        if game_id in self._waiters:
+            self._loop.call_soon_threadsafe(self._wake, game_id)
+
+    def games(self) -> list[str]:
+        """Games with at least one subscriber (read on the loop thread)."""
+        return list(self._waiters)
+
+    def _wake(self, game_id: str):
+        for event in self._waiters.get(game_id, ()):
+            event.set()
+
+    @contextmanager
+    def subscribe(self, game_id: str):
+        """Yield an ``asyncio.Event`` set whenever the game changes."""
+        event = asyncio.Event()
+        self._waiters[game_id].add(event)
+        try:
+            yield event
+        finally:
+            waiters = self._waiters.get(game_id)
+            if waiters is not None:
+                waiters.discard(event)
+                if not waiters:
+                    del self._waiters[game_id]
@@ -1,27 +1,40 @@
 """
-Database layer – all TinyDB operations.
+Database layer – public data API and the TinyDB backend.
+
+The SQLite backend (``sqlite_db.SQLiteDatabase``) shares the same API.
 """
 from __future__ import annotations
 
-import hashlib
 import os
 import random
 import string
 import time
 import uuid
-from collections import Counter
-
-from tinydb import TinyDB, Query
-from tinydb.storages import JSONStorage
-from tinydb.middlewares import CachingMiddleware
-
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import Callable, Iterator
+
+from tinydb import TinyDB
+
+from archive import GameArchive
+from cache import TTLCache
+from game import ActiveGame, PlayerRecord
+from hashing import hash_password
+from leader import LeaderLock
+from eventlog import EventLog
+from locks import GameLocks
+from storage import FlushingMiddleware, ORJSONStorage
 from models import (
     GameState, Role, ActionType,
     WOLF_FACTION, NEUTRAL_FACTION,
     get_role_distribution,
 )
 
-Q = Query()
+SESSION_TTL = 7 * 24 * 3600  # seconds
+
+
+class StaleGameError(RuntimeError):
+    """save_game got an aggregate older than the stored game (another worker wrote)."""
 
 
 def _uid() -> str:
@@ -36,33 +49,314 @@ def _game_code() -> str:
     return "".join(random.choices(string.ascii_uppercase, k=5))
 
 
-def _hash_pw(password: str, salt: str | None = None) -> tuple[str, str]:
-    if salt is None:
-        salt = os.urandom(16).hex()
-    h = hashlib.pbkdf2_hmac("sha256", password.encode(), salt.encode(), 100_000).hex()
-    return h, salt
-
-
-class Database:
-    def __init__(self, path: str = "db.json"):
-        self.db = TinyDB(path, storage=CachingMiddleware(JSONStorage))
-        self.users = self.db.table("users")
-        self.sessions = self.db.table("sessions")
-        self.games = self.db.table("games")
-        self.players = self.db.table("players")
-        self.actions = self.db.table("actions")
-        self.votes = self.db.table("votes")
-        self.guesses = self.db.table("guesses")
+def _add_stats(delta: dict[str, int]) -> Callable[[dict], dict]:
+    def apply(doc: dict) -> dict:
+        stats = dict(doc.get("stats", {}))
+        for field, inc in delta.items():
+            stats[field] = stats.get(field, 0) + inc
+        return {"stats": stats}
+    return apply
+
+
+class _Index:
+    """In-memory hash index: key (tuple of field values) → doc_ids.
+
+    doc_ids are kept in insertion-ordered dicts so lookups return rows
+    in the same order as a TinyDB ``search``. Not thread-safe: ``Database``
+    only changes indexes under its write lock.
+    """
+    __slots__ = ("fields", "_map")
+
+    def __init__(self, *fields: str):
+        self.fields = fields
+        self._map: dict[tuple, dict[int, None]] = defaultdict(dict)
+
+    def key(self, doc: dict) -> tuple:
+        return tuple(doc.get(f) for f in self.fields)
+
+    def add(self, doc_id: int, doc: dict):
+        self._map[self.key(doc)][doc_id] = None
+
+    def discard(self, doc_id: int, doc: dict):
+        key = self.key(doc)
+        ids = self._map.get(key)
+        if ids is not None:
+            ids.pop(doc_id, None)
+            if not ids:
+                del self._map[key]
+
+    def lookup(self, *key) -> list[int]:
+        ids = self._map.get(key)
+        return list(ids) if ids else []
+
+    def count(self, *key) -> int:
+        ids = self._map.get(key)
+        return len(ids) if ids else 0
+
+    def clear(self):
+        self._map.clear()
+
+
+# Secondary indexes per table, maintained on insert/update/remove.
+INDEXES: dict[str, dict[str, tuple[str, ...]]] = {
+    "users": {"id": ("id",), "username": ("username",)},
+    "sessions": {"id": ("id",)},
+    "games": {"id": ("id",), "state": ("state",)},
+    "players": {
+        "id": ("id",),
+        "game_id": ("game_id",),
+        "user_id": ("user_id",),
+        "game_user": ("game_id", "user_id"),
+    },
+    "actions": {
+        "game_id": ("game_id",),
+        "game_type": ("game_id", "action_type"),
+        "game_player_type": ("game_id", "player_id", "action_type"),
+    },
+    "votes": {
+        "game_id": ("game_id",),
+        "game_player": ("game_id", "player_id"),
+    },
+    "guesses": {
+        "game_id": ("game_id",),
+        "game_player": ("game_id", "player_id"),
+        "game_player_target": ("game_id", "player_id", "target_id"),
+    },
+    # One row per (user, finished game), see add_history
+    "history": {
+        "user_id": ("user_id",),
+        "game_id": ("game_id",),
+    },
+    # The game each user is in until it ends, see find_active_game_for_user
+    "active_games": {
+        "user_id": ("user_id",),
+        "game_id": ("game_id",),
+    },
+}
+
+# Composite primary key of the tables written with _upsert (an index above).
+PRIMARY_KEYS = {
+    "actions": "game_player_type",
+    "votes": "game_player",
+    "guesses": "game_player_target",
+}
+
+# Field holding the game id in each game-scoped table.
+GAME_KEY = {
+    "games": "id",
+    "players": "game_id",
+    "actions": "game_id",
+    "votes": "game_id",
+    "guesses": "game_id",
+}
+
+
+class BaseDatabase:
+    """Public data API shared by the storage backends.
+
+    Subclasses provide the table handles (objects with a ``name``) and the
+    storage primitives ``_find``, ``_find_one``, ``_find_page``, ``_count``,
+    ``_scan``, ``_insert``, ``_insert_many``, ``_upsert`` and ``_write_batch``; returned
+    documents expose their row id as ``doc_id``.
+    """
+
+    # True when other processes write to the same store
+    shared = False
+
+    def __init__(self, events, archive: GameArchive, flush_on_transition: bool = True,
+                 session_ttl: float = SESSION_TTL, cache_size: int = 4096):
+        self.events = events
+        self.archive = archive
+        self.flush_on_transition = flush_on_transition
+        self.session_ttl = session_ttl
+        # Users and sessions by id; _touch drops entries on every write
+        self._cache = {"users": TTLCache(cache_size), "sessions": TTLCache(cache_size)}
+        # Per-game version counters, bumped on every write touching a game;
+        # they restart with the process, hence the epoch in ETags
+        self._versions: dict[str, int] = defaultdict(int)
+        self.version_epoch = uuid.uuid4().hex[:8]
+        self._listeners: list[Callable[[str], None]] = []
+        # Aggregates of running games, see load_game / save_game
+        self._active: dict[str, ActiveGame] = {}
+        # Per-game write locks (see game_lock)
+        self.locks = GameLocks()
 
     def close(self):
-        self.db.close()
+        pass
+
+    def flush(self, wait: bool = False):
+        pass
+
+    def flush_stats(self) -> dict:
+        return {}
+
+    def compact(self):
+        """Shrink the storage after rows were deleted (see archive_finished_games)."""
+        self.flush(wait=True)
+
+    # ── Storage primitives ─────────────────────────────
+
+    def _touch(self, writes: list[tuple[str, dict]], from_aggregate: bool = False):
+        """Bump versions, resync cached aggregates and notify listeners."""
+        game_ids: dict[str, set[str]] = defaultdict(set)
+        for table_name, doc in writes:
+            cache = self._cache.get(table_name)
+            if cache is not None:
+                cache.pop(doc.get("id"))
+            key = GAME_KEY.get(table_name)
+            if key is not None:
+                game_ids[doc.get(key)].add(table_name)
+        for game_id, table_names in game_ids.items():
+            self._versions[game_id] += 1
+            if not from_aggregate:
+                self._sync_active(game_id, table_names)
+            for listener in self._listeners:
+                listener(game_id)
+
+    def _get_cached(self, table, key: str) -> dict | None:
+        cache = self._cache[table.name]
+        doc = cache.get(key)
+        if doc is None:
+            generation = cache.generation()
+            doc = self._find_one(table, "id", key)
+            if doc is not None:
+                cache.put(key, doc, generation)
+        return doc
+
+    def cache_stats(self) -> dict:
+        return {name: cache.stats() for name, cache in self._cache.items()}
+
+    def game_lock(self, game_id: str):
+        """Context manager serialising the writes to one game within this process."""
+        return self.locks.hold(game_id)
+
+    def _update(self, table, docs: list[dict], data: dict):
+        self._write_batch(updates=[(table, [d.doc_id for d in docs], data)])
+
+    def _remove(self, table, docs: list[dict]):
+        self._write_batch(removes=[(table, [d.doc_id for d in docs])])
+
+    # ── Change tracking ────────────────────────────────
+
+    def game_version(self, game_id: str) -> int:
+        return self._versions.get(game_id, 0)
+
+    def game_versions(self, game_ids: list[str]) -> dict[str, int]:
+        return {game_id: self.game_version(game_id) for game_id in game_ids}
+
+    def add_listener(self, listener: Callable[[str], None]):
+        """Call ``listener(game_id)`` after every write touching that game."""
+        self._listeners.append(listener)
+
+    # ── Active games ───────────────────────────────────
+
+    def load_game(self, game_id: str) -> ActiveGame | None:
+        """Return the published aggregate of a game, loading it if needed.
+
+        The result is a read-only snapshot: writers never mutate it in place
+        (see load_game_for_update), so reading it needs no lock.
+        """
+        ag = self._active.get(game_id)
+        if ag is not None:
+            return ag
+        # Cold load under the lock, so it cannot race a save_game
+        with self.game_lock(game_id):
+            ag = self._active.get(game_id)
+            return ag if ag is not None else self._load_game(game_id)
+
+    def load_game_for_update(self, game_id: str) -> ActiveGame | None:
+        """A private copy of the aggregate to mutate and pass to save_game.
+
+        Call it while holding ``game_lock(game_id)``.
+        """
+        ag = self.load_game(game_id)
+        return ag.copy() if ag is not None else None
+
+    def _load_game(self, game_id: str) -> ActiveGame | None:
+        game = self.get_game(game_id)
+        if not game:
+            return None
+        ag = ActiveGame(
+            game,
+            [PlayerRecord.from_doc(p) for p in self.get_game_players(game_id)],
+            self.get_actions(game_id),
+            self.get_votes(game_id),
+        )
+        if game["state"] != GameState.GAME_OVER.value:
+            self._active[game_id] = ag
+        return ag
+
+    def save_game(self, ag: ActiveGame):
+        """Persist every pending change of ``ag`` with one storage write.
+
+        ``ag`` becomes the published aggregate before the write: readers may
+        see it with the previous version, never an older state with the new one.
+        Raises ``StaleGameError`` (nothing written) if ``ag`` is out of date.
+        """
+        game_changes, player_changes, clear_actions, clear_votes, events = ag.pop_changes()
+        updates = []
+        if game_changes:
+            updates.append((self.games, [ag.doc_id], game_changes))
+        for player_id, data in player_changes.items():
+            updates.append((self.players, [ag.players[player_id].doc_id], data))
+        removes = []
+        if game_changes.get("state") == GameState.GAME_OVER.value:
+            # Players are free to join another game
+            removes.append((self.active_games,
+                            [r.doc_id for r in self._find(self.active_games, "game_id", ag.id)]))
+        if clear_actions:
+            removes.append((self.actions, [a.doc_id for a in self.get_actions(ag.id)]))
+        if clear_votes:
+            removes.append((self.votes, [v.doc_id for v in self.get_votes(ag.id)]))
+        self._active[ag.id] = ag
+        try:
+            self._write_aggregate(ag.id, updates, removes, events)
+        except Exception:
+            self._active.pop(ag.id, None)
+            raise
+        if ag.state == GameState.GAME_OVER.value:
+            self._active.pop(ag.id, None)
+        if self.flush_on_transition:
+            self.flush()
+
+    def _write_aggregate(self, game_id: str, updates: list, removes: list, events: list[dict]):
+        """Append the events of a saved aggregate, then write its changes.
+
+        Events go first so a stored GAME_OVER implies its events are readable
+        (see _build_game_state); the SQLite backend does both in one transaction.
+        """
+        self.events.append(game_id, events)
+        self._write_batch(updates, removes, from_aggregate=True)
+
+    def _sync_active(self, game_id: str, table_names: set[str]):
+        """Keep a cached aggregate coherent with a write made outside it.
+
+        The published aggregate is never changed in place: a copy with the
+        new actions/votes replaces it, as save_game does.
+        """
+        ag = self._active.get(game_id)
+        if ag is None:
+            return
+        if table_names <= {"actions", "votes", "guesses"}:
+            if table_names & {"actions", "votes"}:
+                ag = ag.copy()
+                if "actions" in table_names:
+                    ag.actions = self.get_actions(game_id)
+                if "votes" in table_names:
+                    ag.votes = self.get_votes(game_id)
+                self._active[game_id] = ag
+        else:
+            del self._active[game_id]
 
     # ── Users ──────────────────────────────────────────
 
     def create_user(self, username: str, password: str) -> dict:
-        if self.users.get(Q.username == username):
+        return self.add_user(username, *hash_password(password))
+
+    def add_user(self, username: str, pw_hash: str, salt: str) -> dict:
+        """Create a user from an already computed password hash."""
+        if self.get_user_by_username(username):
             raise ValueError("Username già in uso")
-        pw_hash, salt = _hash_pw(password)
         user = {
             "id": _uid(),
             "username": username,
@@ -71,50 +365,87 @@ class Database:
             "created_at": _now(),
             "stats": {"games": 0, "wins": 0, "wolf_wins": 0, "village_wins": 0},
         }
-        self.users.insert(user)
+        self._insert(self.users, user)
         return user
 
     def verify_user(self, username: str, password: str) -> dict | None:
-        user = self.users.get(Q.username == username)
+        user = self.get_user_by_username(username)
         if not user:
             return None
-        pw_hash, _ = _hash_pw(password, user["salt"])
+        pw_hash, _ = hash_password(password, user["salt"])
         if pw_hash != user["password_hash"]:
             return None
         return user
 
     def get_user(self, user_id: str) -> dict | None:
-        return self.users.get(Q.id == user_id)
+        return self._get_cached(self.users, user_id)
 
     def get_user_by_username(self, username: str) -> dict | None:
-        return self.users.get(Q.username == username)
+        return self._find_one(self.users, "username", username)
 
     def update_user_stats(self, user_id: str, field: str, increment: int = 1):
-        user = self.get_user(user_id)
-        if user:
-            stats = user.get("stats", {})
-            stats[field] = stats.get(field, 0) + increment
-            self.users.update({"stats": stats}, Q.id == user_id)
+        self.apply_stats_delta({user_id: {field: increment}})
+
+    def apply_stats_delta(self, deltas: dict[str, dict[str, int]]):
+        """Add ``{user_id: {field: increment}}`` to user stats with one write.
+
+        Increments are applied to the stored document inside the write, so
+        concurrent deltas never overwrite each other.
+        """
+        updates = []
+        for user_id, delta in deltas.items():
+            user = self.get_user(user_id)
+            if user and delta:
+                updates.append((self.users, [user.doc_id], _add_stats(delta)))
+        self._write_batch(updates)
 
     # ── Sessions ───────────────────────────────────────
 
     def create_session(self, user_id: str) -> str:
         sid = uuid.uuid4().hex
-        self.sessions.insert({"id": sid, "user_id": user_id, "created_at": _now()})
+        now = _now()
+        self._insert(self.sessions, {
+            "id": sid, "user_id": user_id,
+            "created_at": now, "expires_at": now + self.session_ttl,
+        })
         return sid
 
+    def _session_expiry(self, sess: dict) -> float:
+        # Sessions created before expiry existed last one TTL from creation
+        return sess.get("expires_at") or sess.get("created_at", 0) + self.session_ttl
+
     def get_session(self, sid: str) -> dict | None:
-        return self.sessions.get(Q.id == sid)
+        sess = self._get_cached(self.sessions, sid)
+        if sess is None or self._session_expiry(sess) < _now():
+            return None
+        return sess
 
     def delete_session(self, sid: str):
-        self.sessions.remove(Q.id == sid)
+        self._remove(self.sessions, self._find(self.sessions, "id", sid))
+
+    def purge_expired_sessions(self, limit: int = 500) -> int:
+        """Delete up to ``limit`` expired sessions with one write.
+
+        Each row is checked against its own expiry: the TTL may have changed
+        between restarts, so expiry does not follow insertion order.
+        """
+        now = _now()
+        stale = []
+        for sess in self._scan(self.sessions):
+            if self._session_expiry(sess) >= now:
+                continue
+            stale.append(sess)
+            if len(stale) >= limit:
+                break
+        self._remove(self.sessions, stale)
+        return len(stale)
 
     # ── Games ──────────────────────────────────────────
 
     def create_game(self, creator_id: str, target_players: int) -> dict:
         game_id = _game_code()
-        # Ensure unique
-        while self.games.get(Q.id == game_id):
+        # Ensure unique, archived games included (history rows refer to them)
+        while self.get_game(game_id) or game_id in self.archive:
             game_id = _game_code()
         game = {
             "id": game_id,
@@ -130,33 +461,40 @@ class Database:
             "last_day_burned_role": "",
             "night_deaths": [],
             "day_deaths": [],
-            "events": [],
             "created_at": _now(),
         }
-        self.games.insert(game)
+        self._insert(self.games, game)
         return game
 
     def get_game(self, game_id: str) -> dict | None:
-        return self.games.get(Q.id == game_id)
+        return self._find_one(self.games, "id", game_id)
 
     def update_game(self, game_id: str, data: dict):
-        self.games.update(data, Q.id == game_id)
+        self._update(self.games, self._find(self.games, "id", game_id), data)
 
     def add_event(self, game_id: str, turn: int, phase: str, etype: str, detail: str):
-        game = self.get_game(game_id)
-        if game:
-            events = game.get("events", [])
-            events.append({
-                "turn": turn, "phase": phase, "type": etype,
-                "detail": detail, "ts": _now(),
-            })
-            self.update_game(game_id, {"events": events})
+        self.events.append(game_id, [{
+            "turn": turn, "phase": phase, "type": etype,
+            "detail": detail, "ts": _now(),
+        }])
+
+    def get_events(self, game_id: str, turn: int | None = None) -> Iterator[dict]:
+        """Stream the events of a game from its append-only log."""
+        return self.events.read(game_id, turn)
 
     def list_open_games(self) -> list[dict]:
-        return self.games.search(Q.state == GameState.LOBBY.value)
+        return self._find(self.games, "state", GameState.LOBBY.value)
+
+    def list_running_games(self) -> list[dict]:
+        """Games with a phase timer running (ROLE_REVEAL, NIGHT, DAY)."""
+        return [
+            g
+            for state in (GameState.ROLE_REVEAL, GameState.NIGHT, GameState.DAY)
+            for g in self._find(self.games, "state", state.value)
+        ]
 
     def list_finished_games_for_user(self, user_id: str) -> list[dict]:
-        players = self.players.search(Q.user_id == user_id)
+        players = self._find(self.players, "user_id", user_id)
         game_ids = {p["game_id"] for p in players}
         result = []
         for gid in game_ids:
@@ -179,109 +517,392 @@ class Database:
             "is_alive": True,
             "attributes": {},
         }
-        self.players.insert(player)
+        self._insert(self.players, player)
+        self._set_active_game(user_id, game_id)
         return player
 
     def get_player(self, player_id: str) -> dict | None:
-        return self.players.get(Q.id == player_id)
+        return self._find_one(self.players, "id", player_id)
 
     def get_player_in_game(self, game_id: str, user_id: str) -> dict | None:
-        return self.players.get((Q.game_id == game_id) & (Q.user_id == user_id))
+        return self._find_one(self.players, "game_user", game_id, user_id)
+
+    def count_players(self, game_ids: list[str]) -> dict[str, int]:
+        """Number of players in each game, in one pass."""
+        return self._count(self.players, "game_id", game_ids)
 
     def get_game_players(self, game_id: str, alive_only: bool = False) -> list[dict]:
-        ps = self.players.search(Q.game_id == game_id)
+        ps = self._find(self.players, "game_id", game_id)
         if alive_only:
             ps = [p for p in ps if p["is_alive"]]
         return ps
 
     def update_player(self, player_id: str, data: dict):
-        self.players.update(data, Q.id == player_id)
+        self._update(self.players, self._find(self.players, "id", player_id), data)
 
     def kill_player(self, player_id: str):
-        self.players.update({"is_alive": False}, Q.id == player_id)
+        self.update_player(player_id, {"is_alive": False})
 
     def find_active_game_for_user(self, user_id: str) -> str | None:
-        players = self.players.search(Q.user_id == user_id)
-        for p in players:
-            g = self.get_game(p["game_id"])
-            if g and g["state"] not in (GameState.GAME_OVER.value,):
-                return g["id"]
-        return None
+        row = self._find_one(self.active_games, "user_id", user_id)
+        return row["game_id"] if row else None
+
+    def _set_active_game(self, user_id: str, game_id: str):
+        existing = self._find(self.active_games, "user_id", user_id)
+        if existing:
+            self._update(self.active_games, existing, {"game_id": game_id})
+        else:
+            self._insert(self.active_games, {"user_id": user_id, "game_id": game_id})
+
+    def active_games_empty(self) -> bool:
+        return next(iter(self._scan(self.active_games)), None) is None
+
+    def rebuild_active_games(self) -> int:
+        """Recompute the user → game pointers from the players of unfinished games."""
+        games = sorted(self.list_open_games() + self.list_running_games(),
+                       key=lambda g: g.get("created_at", 0))
+        pointers: dict[str, str] = {}
+        for game in games:
+            for p in self.get_game_players(game["id"]):
+                pointers.setdefault(p["user_id"], game["id"])  # oldest game wins
+        self._remove(self.active_games, list(self._scan(self.active_games)))
+        self._insert_many(self.active_games, [
+            {"user_id": user_id, "game_id": game_id} for user_id, game_id in pointers.items()
+        ])
+        return len(pointers)
 
     # ── Actions ────────────────────────────────────────
 
-    def upsert_action(self, game_id: str, player_id: str, target_id: str, action_type: str):
-        existing = self.actions.get(
-            (Q.game_id == game_id) & (Q.player_id == player_id) & (Q.action_type == action_type)
-        )
-        data = {
+    def upsert_action(self, game_id: str, player_id: str, target_id: str, action_type: str,
+                      replaces: tuple[str, ...] = ()):
+        """Set the player's ``action_type`` action, dropping the ``replaces`` ones."""
+        self._upsert(self.actions, {
             "game_id": game_id, "player_id": player_id,
             "target_id": target_id, "action_type": action_type,
-        }
-        if existing:
-            self.actions.update(
-                data,
-                (Q.game_id == game_id) & (Q.player_id == player_id) & (Q.action_type == action_type),
-            )
-        else:
-            self.actions.insert(data)
+        }, [(game_id, player_id, t) for t in replaces])
 
     def get_actions(self, game_id: str, action_type: str | None = None) -> list[dict]:
         if action_type:
-            return self.actions.search(
-                (Q.game_id == game_id) & (Q.action_type == action_type)
-            )
-        return self.actions.search(Q.game_id == game_id)
+            return self._find(self.actions, "game_type", game_id, action_type)
+        return self._find(self.actions, "game_id", game_id)
 
     def get_player_action(self, game_id: str, player_id: str, action_type: str) -> dict | None:
-        return self.actions.get(
-            (Q.game_id == game_id) & (Q.player_id == player_id) & (Q.action_type == action_type)
-        )
+        return self._find_one(self.actions, "game_player_type", game_id, player_id, action_type)
+
+    def remove_player_action(self, game_id: str, player_id: str, action_type: str):
+        self._remove(self.actions,
+                     self._find(self.actions, "game_player_type", game_id, player_id, action_type))
 
     def clear_actions(self, game_id: str):
-        self.actions.remove(Q.game_id == game_id)
+        self._remove(self.actions, self._find(self.actions, "game_id", game_id))
 
     # ── Votes ──────────────────────────────────────────
 
     def upsert_vote(self, game_id: str, player_id: str, target_id: str):
-        existing = self.votes.get(
-            (Q.game_id == game_id) & (Q.player_id == player_id)
-        )
-        data = {"game_id": game_id, "player_id": player_id, "target_id": target_id}
-        if existing:
-            self.votes.update(data, (Q.game_id == game_id) & (Q.player_id == player_id))
-        else:
-            self.votes.insert(data)
+        self._upsert(self.votes, {"game_id": game_id, "player_id": player_id,
+                                  "target_id": target_id})
 
     def get_votes(self, game_id: str) -> list[dict]:
-        return self.votes.search(Q.game_id == game_id)
+        return self._find(self.votes, "game_id", game_id)
 
     def clear_votes(self, game_id: str):
-        self.votes.remove(Q.game_id == game_id)
+        self._remove(self.votes, self._find(self.votes, "game_id", game_id))
 
     # ── Guesses ────────────────────────────────────────
 
     def upsert_guess(self, game_id: str, player_id: str, target_id: str, guessed_role: str):
-        existing = self.guesses.get(
-            (Q.game_id == game_id) & (Q.player_id == player_id) & (Q.target_id == target_id)
-        )
-        data = {
+        self._upsert(self.guesses, {
             "game_id": game_id, "player_id": player_id,
             "target_id": target_id, "guessed_role": guessed_role,
-        }
-        if existing:
-            self.guesses.update(data,
-                (Q.game_id == game_id) & (Q.player_id == player_id) & (Q.target_id == target_id))
-        else:
-            self.guesses.insert(data)
+        })
 
     def get_guesses(self, game_id: str, player_id: str | None = None) -> list[dict]:
         if player_id:
-            return self.guesses.search(
-                (Q.game_id == game_id) & (Q.player_id == player_id))
-        return self.guesses.search(Q.game_id == game_id)
+            return self._find(self.guesses, "game_player", game_id, player_id)
+        return self._find(self.guesses, "game_id", game_id)
+
+    # ── History ────────────────────────────────────────
+
+    def add_history(self, rows: list[dict]):
+        """Store the per-user summaries of a finished game (one write)."""
+        self._insert_many(self.history, rows)
+
+    def get_history(self, user_id: str, before: int | None = None,
+                    limit: int = 50) -> list[dict]:
+        """A user's finished games, newest first; ``before`` is a row ``doc_id``."""
+        return self._find_page(self.history, "user_id", (user_id,), before, limit)
+
+    def history_empty(self) -> bool:
+        return next(iter(self._scan(self.history)), None) is None
+
+    def list_finished_games(self) -> list[dict]:
+        return self._find(self.games, "state", GameState.GAME_OVER.value)
+
+    def finished_at(self, game: dict) -> float:
+        """End time of a finished game.
+
+        Older rows lack ``finished_at``: it is taken from the last event (or
+        ``created_at``) once and stored, so the log is not read again.
+        """
+        if game.get("finished_at"):
+            return game["finished_at"]
+        last = None
+        for event in self.get_events(game["id"]):
+            last = event
+        finished_at = (last or {}).get("ts") or game.get("created_at", 0)
+        self.update_game(game["id"], {"finished_at": finished_at})
+        return finished_at
+
+    # ── Archive ────────────────────────────────────────
+
+    def get_game_record(self, game_id: str) -> dict | None:
+        """``{"game", "players", "events"}`` of a game, live or archived."""
+        game = self.get_game(game_id)
+        if game:
+            return {"game": game, "players": self.get_game_players(game_id),
+                    "events": self.get_events(game_id)}
+        return self.archive.get(game_id)
+
+    def archive_finished_games(self, older_than: float, limit: int = 500) -> int:
+        """Move games finished before ``older_than`` to the archive.
+
+        Each game is written to the archive first, then all its rows (and
+        its event log) leave the live tables with one write. The history
+        rows stay: /history lists them and /history/{id} reads the archive.
+        """
+        games = []
+        for g in self.list_finished_games():
+            if len(games) == limit:
+                break
+            finished_at = self.finished_at(g)
+            if finished_at < older_than:
+                games.append((g, finished_at))
+        removes = []
+        for game, finished_at in games:
+            game_id = game["id"]
+            players = self.get_game_players(game_id)
+            guesses = self.get_guesses(game_id)
+            if game_id not in self.archive:
+                self.archive.add({
+                    "game": game, "players": players, "guesses": guesses,
+                    "events": list(self.get_events(game_id)),
+                }, finished_at)
+            removes += [
+                (self.games, [game.doc_id]),
+                (self.players, [p.doc_id for p in players]),
+                (self.guesses, [g.doc_id for g in guesses]),
+                (self.actions, [a.doc_id for a in self.get_actions(game_id)]),
+                (self.votes, [v.doc_id for v in self.get_votes(game_id)]),
+            ]
+        self._write_batch(removes=removes)
+        for game, _ in games:
+            self.events.delete(game["id"])
+        return len(games)
+
+
+class Database(BaseDatabase):
+    """TinyDB backend: one JSON file kept in memory, with hash indexes."""
+
+    def __init__(self, path: str = "db.json", flush_every: int = 50,
+                 flush_interval_ms: int = 1000, flush_on_transition: bool = True,
+                 events_dir: str | None = None, session_ttl: float = SESSION_TTL,
+                 storage_cls=ORJSONStorage, archive_dir: str | None = None):
+        # One process per file: each would keep its own copy and flush over the others
+        self._owner = LeaderLock(f"{path}.lock")
+        if not self._owner.try_acquire():
+            raise RuntimeError(f"{path} è già aperto da un altro processo: "
+                               "con più worker usa LUPUS_DB=sqlite")
+        base_dir = os.path.dirname(path) or "."
+        super().__init__(
+            EventLog(events_dir or os.path.join(base_dir, "events")),
+            GameArchive(archive_dir or os.path.join(base_dir, "archive")),
+            flush_on_transition, session_ttl,
+        )
+        self._storage = FlushingMiddleware(
+            storage_cls, flush_every=flush_every, flush_interval_ms=flush_interval_ms,
+        )
+        self.db = TinyDB(path, storage=self._storage)
+        # One short db-wide lock around every change to the cache, the indexes
+        # and the doc_id counters; game_lock still orders the writes to a game
+        self._write_lock = self._storage.data_lock
+        self.users = self.db.table("users")
+        self.sessions = self.db.table("sessions")
+        self.games = self.db.table("games")
+        self.players = self.db.table("players")
+        self.actions = self.db.table("actions")
+        self.votes = self.db.table("votes")
+        self.guesses = self.db.table("guesses")
+        self.history = self.db.table("history")
+        self.active_games = self.db.table("active_games")
+        self._indexes: dict[str, dict[str, _Index]] = {
+            table: {name: _Index(*fields) for name, fields in idx.items()}
+            for table, idx in INDEXES.items()
+        }
+        self._build_indexes()
+        self._migrate_embedded_events()
+
+    def close(self):
+        self.db.close()
+        self._owner.release()
+
+    def flush(self, wait: bool = False):
+        """Write pending changes to disk from the background flush thread."""
+        self._storage.flush(wait)
+
+    def flush_stats(self) -> dict:
+        return self._storage.stats()
+
+    # ── Indexes ────────────────────────────────────────
+
+    def _build_indexes(self):
+        """Populate every index with one scan per table (startup only)."""
+        for table_name, indexes in self._indexes.items():
+            for ix in indexes.values():
+                ix.clear()
+            for doc in self.db.table(table_name):
+                for ix in indexes.values():
+                    ix.add(doc.doc_id, doc)
+
+    def _migrate_embedded_events(self):
+        """Move events stored inside game documents (old format) to the log."""
+        tables = self.db.storage.read() or {}
+        moved = False
+        for doc in tables.get("games", {}).values():
+            events = doc.pop("events", None)
+            if events is None:
+                continue
+            moved = True
+            if events and not self.events.exists(doc["id"]):
+                self.events.append(doc["id"], events)
+        if moved:
+            self.db.storage.write(tables)
+            self.games.clear_cache()
+
+    # ── Storage primitives ─────────────────────────────
+
+    def _find(self, table, index: str, *key) -> list[dict]:
+        ids = self._indexes[table.name][index].lookup(*key)
+        docs = (table.get(doc_id=i) for i in ids)
+        return [d for d in docs if d is not None]
+
+    def _find_one(self, table, index: str, *key) -> dict | None:
+        for doc_id in self._indexes[table.name][index].lookup(*key):
+            doc = table.get(doc_id=doc_id)
+            if doc is not None:
+                return doc
+        return None
+
+    def _find_page(self, table, index: str, key: tuple, before: int | None,
+                   limit: int) -> list[dict]:
+        """Up to ``limit`` rows with ``doc_id < before``, newest first."""
+        # Bucket ids ascend: TinyDB assigns increasing doc_ids
+        ids = self._indexes[table.name][index].lookup(*key)
+        end = len(ids) if before is None else bisect_left(ids, before)
+        docs = (table.get(doc_id=i) for i in reversed(ids[max(0, end - limit):end]))
+        return [d for d in docs if d is not None]
+
+    def _count(self, table, index: str, keys: list) -> dict:
+        """Rows per key of a single-field index, without loading them."""
+        ix = self._indexes[table.name][index]
+        return {k: ix.count(k) for k in keys}
+
+    def _scan(self, table) -> Iterator[dict]:
+        """Iterate a table in insertion order."""
+        return iter(table)
+
+    def _insert(self, table, doc: dict) -> int:
+        return self._insert_many(table, [doc])[0]
+
+    def _insert_many(self, table, docs: list[dict]) -> list[int]:
+        """Add rows to the raw storage data with one write.
+
+        doc_ids come from the table's own counter; unlike ``Table.insert``
+        this does not rebuild the whole table.
+        """
+        if not docs:
+            return []
+        with self._write_lock:
+            doc_ids = [table._get_next_id() for _ in docs]
+            tables = self.db.storage.read() or {}
+            raw = tables.setdefault(table.name, {})
+            indexes = self._indexes[table.name].values()
+            for doc_id, doc in zip(doc_ids, docs):
+                raw[str(doc_id)] = dict(doc)
+                for ix in indexes:
+                    ix.add(doc_id, doc)
+            self.db.storage.write(tables)
+            table.clear_cache()
+        self._touch([(table.name, doc) for doc in docs])
+        return doc_ids
+
+    def _upsert(self, table, doc: dict, alternates: list[tuple] = ()):
+        """Insert ``doc`` or overwrite the row with its primary key, with one write.
+
+        Rows with an ``alternates`` key are superseded: the first one found
+        is overwritten if no row has the key of ``doc``, the others removed.
+        """
+        index = self._indexes[table.name][PRIMARY_KEYS[table.name]]
+        with self.game_lock(doc[GAME_KEY[table.name]]):
+            ids = [i for key in (index.key(doc), *alternates) for i in index.lookup(*key)]
+            if ids:
+                self._write_batch(updates=[(table, ids[:1], doc)], removes=[(table, ids[1:])])
+            else:
+                self._insert(table, doc)
+
+    def _write_batch(self, updates=(), removes=(), from_aggregate: bool = False):
+        """Apply updates and removes to the raw storage data with one write.
+
+        ``updates`` holds ``(table, doc_ids, data)``, ``removes`` holds
+        ``(table, doc_ids)``. ``data`` may be a function of the stored
+        document returning the changes (e.g. counter increments). Unlike
+        ``Table.update`` this only touches the affected documents instead
+        of rebuilding each table.
+        """
+        # The flush thread dumps the cache under the same lock
+        with self._write_lock:
+            tables = self.db.storage.read() or {}
+            writes: list[tuple[str, dict]] = []
+            for table, doc_ids, data in updates:
+                raw = tables.get(table.name, {})
+                indexes = self._indexes[table.name].values()
+                for doc_id in doc_ids:
+                    doc = raw.get(str(doc_id))
+                    if doc is None:
+                        continue
+                    changes = data(doc) if callable(data) else data
+                    # Only indexes over a changed field need to be re-keyed
+                    rekey = [ix for ix in indexes if any(f in changes for f in ix.fields)]
+                    for ix in rekey:
+                        ix.discard(doc_id, doc)
+                    doc.update(changes)
+                    for ix in rekey:
+                        ix.add(doc_id, doc)
+                    writes.append((table.name, doc))
+            for table, doc_ids in removes:
+                raw = tables.get(table.name, {})
+                for doc_id in doc_ids:
+                    doc = raw.pop(str(doc_id), None)
+                    if doc is None:
+                        continue
+                    for ix in self._indexes[table.name].values():
+                        ix.discard(doc_id, doc)
+                    writes.append((table.name, doc))
+            if not writes:
+                return
+            self.db.storage.write(tables)
+            for name in {name for name, _ in writes}:
+                self.db.table(name).clear_cache()
+        self._touch(writes, from_aggregate)
 
     # ── Utility ────────────────────────────────────────
 
     def reset(self):
-        self.db.drop_tables()
+        for game in self.games:
+            self.events.delete(game["id"])
+        with self._write_lock:
+            self.db.drop_tables()
+            self._build_indexes()
+        self.archive.clear()
+        self._active.clear()
+        for cache in self._cache.values():
+            cache.clear()
@@ -0,0 +1,51 @@
+"""
+Append-only game event log: one JSON-lines file per game.
+
+Appending never reads or rewrites earlier events, so it costs O(1)
+regardless of how long the game has been running.
+"""
+from __future__ import annotations
+
+import json
+import os
+from typing import Iterable, Iterator
+
+
+class EventLog:
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, game_id: str) -> str:
+        return os.path.join(self.directory, f"{game_id}.jsonl")
+
+    def append(self, game_id: str, events: Iterable[dict]):
+        lines = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in events)
+        if not lines:
+            return
+        with open(self._path(game_id), "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    def read(self, game_id: str, turn: int | None = None) -> Iterator[dict]:
+        """Yield the events of a game in order, optionally of one turn only."""
+        try:
+            f = open(self._path(game_id), encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # blank or torn trailing line
+                if turn is None or event.get("turn") == turn:
+                    yield event
+
+    def exists(self, game_id: str) -> bool:
+        return os.path.exists(self._path(game_id))
+
+    def delete(self, game_id: str):
+        try:
+            os.remove(self._path(game_id))
+        except FileNotFoundError:
+            pass
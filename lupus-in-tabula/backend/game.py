@@ -0,0 +1,148 @@
+"""
+Active-game aggregate – one game with its players, actions and votes.
+
+Game logic mutates a copy of the ``ActiveGame`` in memory;
+``Database.save_game`` then publishes it and persists every pending change
+with a single storage write (plus one append to the game's event log).
+"""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field, replace
+
+
+@dataclass(slots=True)
+class PlayerRecord:
+    doc_id: int
+    id: str
+    game_id: str
+    user_id: str
+    nickname: str
+    role: str = ""
+    original_role: str = ""
+    is_alive: bool = True
+    attributes: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_doc(cls, doc) -> PlayerRecord:
+        return cls(
+            doc_id=doc.doc_id,
+            id=doc["id"],
+            game_id=doc["game_id"],
+            user_id=doc["user_id"],
+            nickname=doc["nickname"],
+            role=doc.get("role", ""),
+            original_role=doc.get("original_role", doc.get("role", "")),
+            is_alive=doc.get("is_alive", True),
+            attributes=dict(doc.get("attributes", {})),
+        )
+
+
+class ActiveGame:
+    __slots__ = (
+        "game", "doc_id", "players", "actions", "votes", "new_events",
+        "_game_changes", "_player_changes", "_clear_actions", "_clear_votes",
+    )
+
+    def __init__(self, game, players: list[PlayerRecord],
+                 actions: list[dict], votes: list[dict]):
+        self.game: dict = dict(game)
+        self.doc_id: int = game.doc_id
+        self.players: dict[str, PlayerRecord] = {p.id: p for p in players}
+        self.actions = actions
+        self.votes = votes
+        self.new_events: list[dict] = []  # not yet appended to the event log
+        self._game_changes: dict = {}
+        self._player_changes: dict[str, dict] = {}
+        self._clear_actions = False
+        self._clear_votes = False
+
+    def copy(self) -> ActiveGame:
+        """Independent copy to mutate, leaving this one a consistent snapshot."""
+        ag = ActiveGame.__new__(ActiveGame)
+        ag.game = dict(self.game)
+        ag.doc_id = self.doc_id
+        ag.players = {pid: replace(p, attributes=dict(p.attributes))
+                      for pid, p in self.players.items()}
+        ag.actions = list(self.actions)
+        ag.votes = list(self.votes)
+        ag.new_events = []
+        ag._game_changes = {}
+        ag._player_changes = {}
+        ag._clear_actions = False
+        ag._clear_votes = False
+        return ag
+
+    # ── Reads ──────────────────────────────────────────
+
+    @property
+    def id(self) -> str:
+        return self.game["id"]
+
+    @property
+    def state(self) -> str:
+        return self.game["state"]
+
+    @property
+    def turn(self) -> int:
+        return self.game.get("turn_number", 0)
+
+    def all_players(self) -> list[PlayerRecord]:
+        return list(self.players.values())
+
+    def alive(self) -> list[PlayerRecord]:
+        return [p for p in self.players.values() if p.is_alive]
+
+    def player(self, player_id: str) -> PlayerRecord | None:
+        return self.players.get(player_id)
+
+    def player_for_user(self, user_id: str) -> PlayerRecord | None:
+        for p in self.players.values():
+            if p.user_id == user_id:
+                return p
+        return None
+
+    def get_actions(self, action_type: str | None = None) -> list[dict]:
+        if action_type is None:
+            return list(self.actions)
+        return [a for a in self.actions if a["action_type"] == action_type]
+
+    # ── Pending writes ─────────────────────────────────
+
+    def update(self, data: dict):
+        self.game.update(data)
+        self._game_changes.update(data)
+
+    def update_player(self, player_id: str, data: dict):
+        p = self.players[player_id]
+        for k, v in data.items():
+            setattr(p, k, v)
+        self._player_changes.setdefault(player_id, {}).update(data)
+
+    def kill(self, player_id: str):
+        self.update_player(player_id, {"is_alive": False})
+
+    def add_event(self, turn: int, phase: str, etype: str, detail: str):
+        self.new_events.append({
+            "turn": turn, "phase": phase, "type": etype,
+            "detail": detail, "ts": time.time(),
+        })
+
+    def clear_actions(self):
+        self.actions = []
+        self._clear_actions = True
+
+    def clear_votes(self):
+        self.votes = []
+        self._clear_votes = True
+
+    def pop_changes(self) -> tuple[dict, dict[str, dict], bool, bool, list[dict]]:
+        """Return and reset (game, players, clear_actions, clear_votes, events)."""
+        changes = (self._game_changes, self._player_changes,
+                   self._clear_actions, self._clear_votes, self.new_events)
+        self.new_events = []
+        self._game_changes = {}
+        self._player_changes = {}
+        self._clear_actions = False
+        self._clear_votes = False
+        return changes
@@ -0,0 +1,124 @@
+"""
+Password hashing off the event loop.
+
+PBKDF2 with 100k iterations costs tens of milliseconds of CPU per call.
+``PasswordHasher`` runs it in a small process pool, so /register and
+/login never tie up a request thread (or the GIL), and caps how many
+hashes one username or client address can have in flight.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+
+ITERATIONS = 100_000
+
+
+def hash_password(password: str, salt: str | None = None) -> tuple[str, str]:
+    if salt is None:
+        salt = os.urandom(16).hex()
+    h = hashlib.pbkdf2_hmac("sha256", password.encode(), salt.encode(), ITERATIONS).hex()
+    return h, salt
+
+
+class HashBusy(Exception):
+    """Too many hashes in flight for this user, address or overall."""
+
+
+class PasswordHasher:
+    """Bounded async front-end to a hashing process pool.
+
+    All bookkeeping happens on the event loop thread, so it needs no locks.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 256,
+                 per_user: int = 2, per_address: int = 20):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.per_user = per_user
+        self.per_address = per_address
+        self._pool: ProcessPoolExecutor | None = None
+        self._pending = 0  # hashes queued or running
+        self._by_user: dict[str, int] = defaultdict(int)
+        self._by_address: dict[str, int] = defaultdict(int)
+        self.metrics = {
+            "hashed": 0, "rejected": 0, "max_pending": 0,
+            "last_ms": 0.0, "max_ms": 0.0, "total_ms": 0.0,
+        }
+
+    def start(self):
+        # spawn: the server process has threads running, fork is not safe
+        self._pool = ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context("spawn"))
+        # Spawn the workers now rather than on the first login
+        for _ in range(self.workers):
+            self._pool.submit(hash_password, "", "")
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    @asynccontextmanager
+    async def limit(self, username: str, address: str | None):
+        """Reserve a hashing slot for ``username`` / ``address`` or raise HashBusy."""
+        if (self._pending >= self.max_pending
+                or self._by_user[username] >= self.per_user
+                or (address and self._by_address[address] >= self.per_address)):
+            self.metrics["rejected"] += 1
+            self._drop_empty(username, address)
+            raise HashBusy()
+        self._by_user[username] += 1
+        if address:
+            self._by_address[address] += 1
+        try:
+            yield
+        finally:
+            self._by_user[username] -= 1
+            if address:
+                self._by_address[address] -= 1
+            self._drop_empty(username, address)
+
+    def _drop_empty(self, username: str, address: str | None):
+        if not self._by_user.get(username):
+            self._by_user.pop(username, None)
+        if address and not self._by_address.get(address):
+            self._by_address.pop(address, None)
+
+    async def hash(self, password: str, salt: str | None = None) -> tuple[str, str]:
+        self._pending += 1
+        m = self.metrics
+        m["max_pending"] = max(m["max_pending"], self._pending)
+        start = time.perf_counter()
+        try:
+            if self._pool is None:  # not started (scripts): use a thread
+                return await asyncio.to_thread(hash_password, password, salt)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, hash_password, password, salt)
+        finally:
+            self._pending -= 1
+            ms = (time.perf_counter() - start) * 1000
+            m["hashed"] += 1
+            m["last_ms"] = ms
+            m["max_ms"] = max(m["max_ms"], ms)
+            m["total_ms"] += ms
+
+    async def verify(self, password: str, salt: str, expected: str) -> bool:
+        h, _ = await self.hash(password, salt)
+        return hmac.compare_digest(h, expected)
+
+    def stats(self) -> dict:
+        return {
+            **self.metrics,
+            "pending": self._pending,
+            "workers": self.workers,
+            "users_in_flight": len(self._by_user),
+            "addresses_in_flight": len(self._by_address),
+        }
@@ -0,0 +1,52 @@
+"""
+Leader election between worker processes.
+
+With several uvicorn/gunicorn workers only one of them may resolve phases.
+Workers compete for an exclusive ``flock`` on a file next to the database;
+the kernel releases it when the holder exits, so a surviving worker takes
+over at its next attempt.
+"""
+from __future__ import annotations
+
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows: single worker only, always the leader
+    fcntl = None
+
+
+class LeaderLock:
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: int | None = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        """Take the lock without blocking; True if this process is the leader."""
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            self._fd = -1
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        if self._fd >= 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        self._fd = None
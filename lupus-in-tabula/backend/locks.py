@@ -0,0 +1,73 @@
+"""
+Per-game locks for the threadpool handlers.
+
+Writes to one game (joins, night actions, votes, phase changes) run one at
+a time; different games never wait on each other. Readers do not lock at
+all: they use the aggregate published by the last write (see
+``BaseDatabase.load_game``). Time spent waiting is recorded for
+/debug/locks.
+
+These locks only cover one process: with several workers,
+``SQLiteDatabase.game_lock`` adds SQLite's write lock on top.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+SLOW_WAIT = 1.0  # seconds: log waits longer than this
+
+
+class GameLocks:
+    def __init__(self):
+        # One re-entrant lock per game, dropped once nobody references it
+        self._locks: weakref.WeakValueDictionary[str, threading.RLock] = \
+            weakref.WeakValueDictionary()
+        self._guard = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _get(self, game_id: str) -> threading.RLock:
+        with self._guard:
+            lock = self._locks.get(game_id)
+            if lock is None:
+                lock = self._locks[game_id] = threading.RLock()
+            return lock
+
+    @contextmanager
+    def hold(self, game_id: str):
+        lock = self._get(game_id)
+        waited = 0.0
+        if not lock.acquire(blocking=False):
+            start = time.perf_counter()
+            lock.acquire()
+            waited = time.perf_counter() - start
+        try:
+            with self._guard:
+                self.acquisitions += 1
+                if waited:
+                    self.contended += 1
+                    self.wait_total += waited
+                    self.wait_max = max(self.wait_max, waited)
+            if waited > SLOW_WAIT:
+                log.warning("Waited %.2fs for the lock of game %s", waited, game_id)
+            yield
+        finally:
+            lock.release()
+
+    def stats(self) -> dict:
+        with self._guard:
+            return {
+                "games": len(self._locks),
+                "acquisitions": self.acquisitions,
+                "contended": self.contended,
+                "wait_total_ms": round(self.wait_total * 1000, 3),
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+            }
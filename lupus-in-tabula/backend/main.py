@@ -4,26 +4,113 @@ Auth, game logic, night resolution, history.
 """
 from __future__ import annotations
 
+import asyncio
+import logging
 import os
 import random
+import threading
 import time
 from collections import Counter
 from contextlib import asynccontextmanager
+from dataclasses import dataclass
 
-from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-
-from database import Database
+from fastapi.responses import ORJSONResponse, StreamingResponse
+import orjson
+
+from broadcast import GameBroadcaster
+from cache import TTLCache
+from database import Database, StaleGameError
+from hashing import HashBusy, PasswordHasher
+from game import ActiveGame, PlayerRecord
+from leader import LeaderLock
+import metrics
+from scheduler import PhaseScheduler
 from models import (
     ActionRequest, ActionType, CreateGameRequest, GameState, GuessRequest,
     LoginRequest, RegisterRequest, Role, VoteRequest,
-    WOLF_FACTION, EVIL_FACTION, NEUTRAL_FACTION, ROLE_ACTIONS, ROLE_EMOJI,
+    WOLF_ROLES, IDLE_ROLES, ROLE_FACTION, ROLE_ACTION_SET, ROLE_EMOJI_BY_VALUE,
     NIGHT_DURATION, DAY_DURATION, REVEAL_DURATION,
     PlayerPublic, PlayerSelf, WolfVoteInfo, UserInfo,
+    ROLES, ROLE_CODE, ACTION_CODE,
     get_role_distribution,
 )
+from night import check_win, resolve_night
+
+log = logging.getLogger(__name__)
+
+SESSION_TTL = float(os.getenv("LUPUS_SESSION_TTL_HOURS", "168")) * 3600
+if os.getenv("LUPUS_DB", "tinydb") == "sqlite":
+    from sqlite_db import SQLiteDatabase
+    DB_PATH = os.getenv("LUPUS_DB_PATH", "lupus.sqlite")
+    db = SQLiteDatabase(DB_PATH, session_ttl=SESSION_TTL)
+else:
+    DB_PATH = os.getenv("LUPUS_DB_PATH", "db.json")
+    db = Database(
+        DB_PATH,
+        # Flush policy: every N writes, every T ms, and/or at each phase transition
+        flush_every=int(os.getenv("LUPUS_FLUSH_EVERY", "50")),
+        flush_interval_ms=int(os.getenv("LUPUS_FLUSH_INTERVAL_MS", "1000")),
+        flush_on_transition=os.getenv("LUPUS_FLUSH_ON_TRANSITION", "1") == "1",
+        session_ttl=SESSION_TTL,
+    )
 
-db = Database()
+# uvicorn and gunicorn read WEB_CONCURRENCY as their worker count but do not
+# set it: --workers alone passes this check, and Database's file lock then
+# stops every worker after the first
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+if WORKERS > 1 and not db.shared:
+    raise RuntimeError("Con più worker serve un database condiviso: usa LUPUS_DB=sqlite")
+
+hasher = PasswordHasher(
+    workers=int(os.getenv("LUPUS_HASH_WORKERS", "2")),
+    max_pending=int(os.getenv("LUPUS_HASH_MAX_PENDING", "256")),
+)
+broadcaster = GameBroadcaster()
+db.add_listener(broadcaster.publish)
+scheduler = PhaseScheduler(lambda game_id: _maybe_advance(game_id))
+
+# Only the worker holding the lock resolves phases. The others retry every
+# LEADER_POLL seconds; with a shared database the leader rescans running
+# games every LEADER_RESCAN seconds to pick up deadlines set elsewhere.
+leader = LeaderLock(DB_PATH + ".leader")
+LEADER_POLL = 2
+LEADER_RESCAN = 1
+# Shared database: how often to look for other workers' writes (seconds)
+VERSION_POLL = 0.5
+
+# Streaming: keep-alive comment interval and write coalescing window (seconds)
+STREAM_KEEPALIVE = 15
+STREAM_DEBOUNCE = 0.1
+
+# ETags embed the per-game version; the epoch tells apart version counters
+# that restart from 0 (TinyDB: per process, SQLite: per database file)
+ETAG_EPOCH = db.version_epoch
+
+# Lobby list snapshot shared by every /games caller (seconds)
+LOBBY_CACHE_TTL = 2
+_lobby_cache = TTLCache(maxsize=1, ttl=LOBBY_CACHE_TTL)
+_lobby_lock = threading.Lock()
+
+# /game_state payloads. Entries are keyed by game version, so writes never
+# need to invalidate them: the public part per (game_id, version), the
+# full payload per (game_id, version, user_id). Finished games no longer
+# change and are kept by game id alone (evicted only by size).
+STATE_CACHE_TTL = 60
+_public_cache = TTLCache(maxsize=1024, ttl=STATE_CACHE_TTL)
+_state_cache = TTLCache(maxsize=8192, ttl=STATE_CACHE_TTL)
+_final_cache = TTLCache(maxsize=8192, ttl=float("inf"))
+
+# Expired-session sweep: interval (seconds) and rows deleted per write
+SESSION_SWEEP_INTERVAL = 600
+SESSION_SWEEP_BATCH = 500
+
+# Finished games older than this many days move to the archive (0 = never);
+# the leader checks every ARCHIVE_INTERVAL seconds
+ARCHIVE_AFTER_DAYS = float(os.getenv("LUPUS_ARCHIVE_DAYS", "30"))
+ARCHIVE_INTERVAL = 3600
 
 # Environment: "production" or "development"
 ENV = os.getenv("ENV", "development")
@@ -34,13 +121,105 @@ CORS_ORIGINS = (
 )
 
 
+async def _sweep_sessions():
+    """Delete expired sessions in batches, yielding to requests in between."""
+    while True:
+        try:
+            while await asyncio.to_thread(db.purge_expired_sessions, SESSION_SWEEP_BATCH) \
+                    == SESSION_SWEEP_BATCH:
+                await asyncio.sleep(0)
+        except Exception:
+            log.exception("Session sweep failed")
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+
+
+async def _archive_games():
+    """Archive old finished games and compact the database (leader only)."""
+    while True:
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+        if not leader.held:
+            continue
+        try:
+            cutoff = _now() - ARCHIVE_AFTER_DAYS * 86400
+            if await asyncio.to_thread(db.archive_finished_games, cutoff):
+                await asyncio.to_thread(db.compact)
+        except Exception:
+            log.exception("Game archival failed")
+
+
+def _take_lead() -> bool:
+    """Become the phase leader if the lock is free and arm every running game."""
+    if not leader.try_acquire():
+        return False
+    _backfill_history()
+    if db.active_games_empty():
+        # First start with the user → game index (or after a wipe)
+        db.rebuild_active_games()
+    _arm_running_games()
+    return True
+
+
+def _arm_running_games():
+    for game in db.list_running_games():
+        scheduler.schedule(game["id"], game["phase_end_time"])
+
+
+async def _lead():
+    """Wait for the leader lock, then keep the scheduler in sync with the database."""
+    while not leader.held:
+        await asyncio.sleep(LEADER_POLL)
+        if await asyncio.to_thread(_take_lead):
+            log.info("Worker %d is now the phase leader", os.getpid())
+            scheduler.start()
+    while db.shared:
+        await asyncio.sleep(LEADER_RESCAN)
+        try:
+            await asyncio.to_thread(_arm_running_games)
+        except Exception:
+            log.exception("Running games rescan failed")
+
+
+async def _watch_versions():
+    """Wake local streams on writes made by other workers."""
+    seen: dict[str, int] = {}
+    while True:
+        await asyncio.sleep(VERSION_POLL)
+        game_ids = broadcaster.games()
+        try:
+            versions = await asyncio.to_thread(db.game_versions, game_ids) if game_ids else {}
+        except Exception:
+            log.exception("Version poll failed")
+            continue
+        for game_id, version in versions.items():
+            if seen.get(game_id) != version:
+                broadcaster.publish(game_id)
+        seen = versions
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    broadcaster.bind(asyncio.get_running_loop())
+    if _take_lead():
+        scheduler.start()
+    hasher.start()
+    tasks = [asyncio.create_task(_sweep_sessions()), asyncio.create_task(_lead())]
+    if db.shared:
+        tasks.append(asyncio.create_task(_watch_versions()))
+    if ARCHIVE_AFTER_DAYS > 0:
+        tasks.append(asyncio.create_task(_archive_games()))
     yield
+    for task in tasks:
+        task.cancel()
+    hasher.stop()
+    await scheduler.stop()
+    leader.release()
     db.close()
 
 
-app = FastAPI(title="Lupus in Tabula", lifespan=lifespan)
+# orjson for every response; the large ones return ORJSONResponse directly,
+# which also skips FastAPI's jsonable_encoder pass
+app = FastAPI(title="Lupus in Tabula", lifespan=lifespan,
+              default_response_class=ORJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=CORS_ORIGINS,
@@ -48,10 +227,13 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Server-Timing, /metrics and per-method timings with LUPUS_METRICS=1
+metrics.install(app, db)
 
 
 # ── Auth helpers ───────────────────────────────────────
 
+@metrics.timed("auth")
 def _get_user(request: Request) -> dict:
     sid = request.cookies.get("session")
     if not sid:
@@ -65,6 +247,17 @@ def _get_user(request: Request) -> dict:
     return user
 
 
+@asynccontextmanager
+async def _hash_slot(username: str, request: Request):
+    """Limit concurrent password hashes per username and client address."""
+    address = request.headers.get("x-real-ip") or (request.client.host if request.client else None)
+    try:
+        async with hasher.limit(username.lower(), address):
+            yield
+    except HashBusy:
+        raise HTTPException(429, "Troppi tentativi in corso, riprova tra poco")
+
+
 def _now() -> float:
     return time.time()
 
@@ -78,22 +271,27 @@ def _seconds_left(game: dict) -> int:
 # ═══════════════════════════════════════════════════════
 
 @app.post("/register")
-def register(req: RegisterRequest, response: Response):
+async def register(req: RegisterRequest, request: Request, response: Response):
+    async with _hash_slot(req.username, request):
+        if await run_in_threadpool(db.get_user_by_username, req.username):
+            raise HTTPException(400, "Username già in uso")
+        pw_hash, salt = await hasher.hash(req.password)
     try:
-        user = db.create_user(req.username, req.password)
+        user = await run_in_threadpool(db.add_user, req.username, pw_hash, salt)
     except ValueError as e:
         raise HTTPException(400, str(e))
-    sid = db.create_session(user["id"])
+    sid = await run_in_threadpool(db.create_session, user["id"])
     response.set_cookie("session", sid, httponly=True, samesite="lax")
     return {"ok": True, "username": user["username"]}
 
 
 @app.post("/login")
-def login(req: LoginRequest, response: Response):
-    user = db.verify_user(req.username, req.password)
-    if not user:
-        raise HTTPException(401, "Credenziali errate")
-    sid = db.create_session(user["id"])
+async def login(req: LoginRequest, request: Request, response: Response):
+    async with _hash_slot(req.username, request):
+        user = await run_in_threadpool(db.get_user_by_username, req.username)
+        if not user or not await hasher.verify(req.password, user["salt"], user["password_hash"]):
+            raise HTTPException(401, "Credenziali errate")
+    sid = await run_in_threadpool(db.create_session, user["id"])
     response.set_cookie("session", sid, httponly=True, samesite="lax")
     return {"ok": True, "username": user["username"]}
 
@@ -132,13 +330,25 @@ def create_game(req: CreateGameRequest, request: Request):
         raise HTTPException(400, f"Sei già nella partita {current}")
     game = db.create_game(user["id"], req.target_players)
     db.add_player(game["id"], user["id"], user["username"])
+    _lobby_cache.clear()
     return {"game_id": game["id"]}
 
 
 @app.post("/join_game/{game_id}")
 def join_game(game_id: str, request: Request):
     user = _get_user(request)
-    game = db.get_game(game_id.upper())
+    game_id = game_id.upper()
+    # The count check, the insert and the auto-start happen as one step
+    try:
+        with db.game_lock(game_id):
+            return _join_game(game_id, user)
+    except StaleGameError:
+        # Another worker wrote the game in between: nothing was saved
+        raise HTTPException(409, "La partita è cambiata nel frattempo, riprova")
+
+
+def _join_game(game_id: str, user: dict) -> dict:
+    game = db.get_game(game_id)
     if not game:
         raise HTTPException(404, "Partita non trovata")
     if game["state"] != GameState.LOBBY.value:
@@ -158,6 +368,7 @@ def join_game(game_id: str, request: Request):
         raise HTTPException(400, "Nickname già usato")
 
     db.add_player(game["id"], user["id"], user["username"])
+    _lobby_cache.clear()
     players = db.get_game_players(game["id"])
 
     # Auto-start
@@ -167,19 +378,39 @@ def join_game(game_id: str, request: Request):
     return {"game_id": game["id"]}
 
 
+def _lobby_snapshot() -> list[dict]:
+    snapshot = _lobby_cache.get("lobbies")
+    if snapshot is not None:
+        return snapshot
+    with _lobby_lock:
+        # Only one caller rebuilds; the others wait and reuse its result
+        snapshot = _lobby_cache.get("lobbies")
+        if snapshot is None:
+            lobbies = db.list_open_games()
+            counts = db.count_players([g["id"] for g in lobbies])
+            snapshot = [
+                {
+                    "id": g["id"],
+                    "target_players": g["target_players"],
+                    "current_players": counts[g["id"]],
+                    "free_slots": max(0, g["target_players"] - counts[g["id"]]),
+                    "creator": g.get("creator_id", ""),
+                }
+                for g in lobbies
+            ]
+            _lobby_cache.put("lobbies", snapshot)
+    return snapshot
+
+
 @app.get("/games")
-def list_games():
-    lobbies = db.list_open_games()
-    result = []
-    for g in lobbies:
-        ps = db.get_game_players(g["id"])
-        result.append({
-            "id": g["id"],
-            "target_players": g["target_players"],
-            "current_players": len(ps),
-            "creator": g.get("creator_id", ""),
-        })
-    return result
+def list_games(offset: int = Query(0, ge=0),
+               limit: int = Query(50, ge=1, le=200),
+               min_free: int = Query(0, ge=0)):
+    lobbies = _lobby_snapshot()
+    if min_free:
+        lobbies = [g for g in lobbies if g["free_slots"] >= min_free]
+    return ORJSONResponse(lobbies[offset:offset + limit],
+                          headers={"X-Total-Count": str(len(lobbies))})
 
 
 # ── Game state polling ─────────────────────────────────
@@ -187,40 +418,130 @@ def list_games():
 @app.get("/game_state/{game_id}")
 def get_game_state(game_id: str, request: Request):
     user = _get_user(request)
-    game = db.get_game(game_id.upper())
-    if not game:
-        raise HTTPException(404, "Partita non trovata")
+    game_id = game_id.upper()
+    # Read the version before building: a concurrent write can only make
+    # the payload newer than its tag, never older
+    etag = f'W/"{ETAG_EPOCH}-{game_id}-{db.game_version(game_id)}-{user["id"]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in (t.strip() for t in request.headers.get("if-none-match", "").split(",")):
+        return Response(status_code=304, headers=headers)
+    return ORJSONResponse(_build_game_state(game_id, user["id"]), headers=headers)
+
+
+@app.get("/game_state/{game_id}/stream")
+async def stream_game_state(game_id: str, request: Request):
+    """Server-sent events: push the player's state only when the game changes."""
+    user = await run_in_threadpool(_get_user, request)
+    game_id = game_id.upper()
+    # Build the first payload before streaming so 404/403 are real HTTP errors
+    state = await run_in_threadpool(_build_game_state, game_id, user["id"])
+    return StreamingResponse(
+        _state_events(request, game_id, user["id"], state),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Payload fields that change with time rather than with the game
+CLOCK_FIELDS = ("timer_seconds_left", "server_time")
+
+
+async def _state_events(request: Request, game_id: str, user_id: str, state: dict):
+    sent = None
+    with broadcaster.subscribe(game_id) as changed:
+        while True:
+            # The clock alone is not a change worth pushing
+            snapshot = {k: v for k, v in state.items() if k not in CLOCK_FIELDS}
+            if snapshot != sent:
+                sent = snapshot
+                yield b"data: " + orjson.dumps(state) + b"\n\n"
+            if state["state"] == GameState.GAME_OVER.value:
+                return
+
+            try:
+                await asyncio.wait_for(changed.wait(), STREAM_KEEPALIVE)
+                # Let the rest of a multi-write transition land first
+                await asyncio.sleep(STREAM_DEBOUNCE)
+                changed.clear()
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": keepalive\n\n"
+
+            try:
+                state = await run_in_threadpool(_build_game_state, game_id, user_id)
+            except HTTPException:
+                return
+
+
+@metrics.timed("state")
+def _build_game_state(game_id: str, user_id: str) -> dict:
+    version = db.game_version(game_id)
+    resp = (_final_cache.get((game_id, user_id))
+            or _state_cache.get((game_id, version, user_id))
+            or _player_state(game_id, version, user_id))
+    return {**resp, "timer_seconds_left": _seconds_left(resp), "server_time": _now()}
+
+
+@dataclass(slots=True)
+class _PublicState:
+    ag: ActiveGame
+    payload: dict                      # what every player of the game sees
+    wolves: list[tuple[str, str]]      # (player id, nickname) of the Lupi, at night
+    wolf_votes: dict[str, str] | None  # nickname -> nickname, at night
+    final: bool = False                # game over and fully stored
+
+
+def _player_state(game_id: str, version: int, user_id: str) -> dict:
+    """Public part of the game plus what only ``user_id`` may see."""
+    public = _public_state(game_id, version)
+    ag = public.ag
+    state = public.payload["state"]
+    player = ag.player_for_user(user_id)
 
-    player = db.get_player_in_game(game["id"], user["id"])
-    
     # Allow non-players to view LOBBY state
-    if not player and game["state"] != GameState.LOBBY.value:
+    if not player and state != GameState.LOBBY.value:
         raise HTTPException(403, "Non sei in questa partita")
 
-    # Advance phase if timer expired
-    _maybe_advance(game["id"])
-    game = db.get_game(game["id"])
+    resp = dict(public.payload)
     if player:
-        player = db.get_player_in_game(game["id"], user["id"])
+        resp["me"] = PlayerSelf(
+            id=player.id, nickname=player.nickname,
+            role=player.role or "?",
+            is_alive=player.is_alive,
+            attributes=player.attributes,
+        ).model_dump()
+
+    if state == GameState.NIGHT.value:
+        if player.role in WOLF_ROLES:
+            resp["wolf_teammates"] = [nick for pid, nick in public.wolves if pid != player.id]
+            resp["wolf_votes"] = public.wolf_votes
+        resp["night_message"] = _get_night_message(ag, player)
+
+    if public.final:
+        _final_cache.put((game_id, user_id), resp)
+    else:
+        _state_cache.put((game_id, version, user_id), resp)
+    return resp
+
 
-    all_players = db.get_game_players(game["id"])
+def _public_state(game_id: str, version: int) -> _PublicState:
+    public = _final_cache.get(game_id) or _public_cache.get((game_id, version))
+    if public is not None:
+        return public
+
+    ag = db.load_game(game_id)
+    if not ag:
+        raise HTTPException(404, "Partita non trovata")
+    game = ag.game
+    all_players = ag.all_players()
     state = game["state"]
 
     players_public = [
-        PlayerPublic(id=p["id"], nickname=p["nickname"], is_alive=p["is_alive"]).model_dump()
+        PlayerPublic(id=p.id, nickname=p.nickname, is_alive=p.is_alive).model_dump()
         for p in all_players
     ]
 
-    # If not in game (lobby viewer), me is None
-    me_data = None
-    if player:
-        me_data = PlayerSelf(
-            id=player["id"], nickname=player["nickname"],
-            role=player["role"] or "?",
-            is_alive=player["is_alive"],
-            attributes=player.get("attributes", {}),
-        ).model_dump()
-
     # Role distribution (counts, not who)
     roles_in_game = game.get("roles_in_game", {})
 
@@ -228,10 +549,13 @@ def get_game_state(game_id: str, request: Request):
         "game_id": game["id"],
         "state": state,
         "turn_number": game["turn_number"],
-        "timer_seconds_left": _seconds_left(game),
+        "timer_seconds_left": 0,  # filled per request, with server_time
+        # The client counts down from these, so cached payloads stay valid
+        "phase_end_time": game["phase_end_time"],
+        "server_time": 0,
         "target_players": game["target_players"],
         "players": players_public,
-        "me": me_data,
+        "me": None,  # If not in game (lobby viewer), me is None
         "roles_in_game": roles_in_game,
         "night_deaths": [],
         "day_deaths": [],
@@ -244,84 +568,69 @@ def get_game_state(game_id: str, request: Request):
         "events": [],
         "all_roles": None,
     }
-
-    my_role = player["role"] if player else None
-
-    # ── LOBBY ──
-    if state == GameState.LOBBY.value:
-        return resp
-
-    # ── ROLE_REVEAL ──
-    if state == GameState.ROLE_REVEAL.value:
-        return resp
+    public = _PublicState(ag, resp, [], None)
 
     # ── NIGHT ──
     if state == GameState.NIGHT.value:
-        # Wolf teammates
-        if my_role in [r.value for r in WOLF_FACTION]:
-            teammates = [
-                p["nickname"] for p in all_players
-                if p["role"] in [r.value for r in WOLF_FACTION] and p["id"] != player["id"]
-            ]
-            resp["wolf_teammates"] = teammates
-
-            # Wolf kill votes
-            kill_actions = db.get_actions(game["id"], ActionType.KILL.value)
-            pid_nick = {p["id"]: p["nickname"] for p in all_players}
-            resp["wolf_votes"] = {
-                pid_nick.get(a["player_id"], "?"): pid_nick.get(a["target_id"], "?")
-                for a in kill_actions
-            }
-
-        # Night messages
-        resp["night_message"] = _get_night_message(game, player, all_players)
+        public.wolves = [(p.id, p.nickname) for p in all_players if p.role in WOLF_ROLES]
+        # Wolf kill votes
+        pid_nick = {p.id: p.nickname for p in all_players}
+        public.wolf_votes = {
+            pid_nick.get(a["player_id"], "?"): pid_nick.get(a["target_id"], "?")
+            for a in ag.get_actions(ActionType.KILL.value)
+        }
 
     # ── DAY ──
     if state == GameState.DAY.value:
         resp["night_deaths"] = game.get("night_deaths", [])
-        votes = db.get_votes(game["id"])
-        pid_nick = {p["id"]: p["nickname"] for p in all_players}
+        pid_nick = {p.id: p.nickname for p in all_players}
         resp["day_votes"] = {
             pid_nick.get(v["player_id"], "?"): pid_nick.get(v["target_id"], "?")
-            for v in votes
+            for v in ag.votes
         }
 
     # ── GAME OVER ──
     if state == GameState.GAME_OVER.value:
+        # Stored as over means its events and last changes are written too:
+        # only then is the payload final (ag may be mid-transition)
+        stored = db.get_game(game_id)
+        public.final = stored is not None and stored["state"] == GameState.GAME_OVER.value
         resp["winners"] = game.get("winners", "")
         resp["winner_detail"] = game.get("winner_detail", "")
-        resp["events"] = game.get("events", [])
+        resp["events"] = list(db.get_events(game["id"]))
         resp["all_roles"] = [
-            {"nickname": p["nickname"], "role": p.get("original_role", p["role"]),
-             "final_role": p["role"], "is_alive": p["is_alive"]}
+            {"nickname": p.nickname, "role": p.original_role,
+             "final_role": p.role, "is_alive": p.is_alive}
             for p in all_players
         ]
 
         # Build guess leaderboard
         all_guesses = db.get_guesses(game["id"])
-        pid_to_player = {p["id"]: p for p in all_players}
         guesser_scores: dict[str, dict] = {}
         for g in all_guesses:
-            guesser = pid_to_player.get(g["player_id"])
-            target = pid_to_player.get(g["target_id"])
+            guesser = ag.player(g["player_id"])
+            target = ag.player(g["target_id"])
             if not guesser or not target:
                 continue
             gid = g["player_id"]
             if gid not in guesser_scores:
                 guesser_scores[gid] = {
-                    "nickname": guesser["nickname"],
-                    "role": guesser.get("original_role", guesser["role"]),
+                    "nickname": guesser.nickname,
+                    "role": guesser.original_role,
                     "correct": 0, "total": 0,
                 }
             guesser_scores[gid]["total"] += 1
-            actual_role = target.get("original_role", target["role"])
-            if g["guessed_role"] == actual_role:
+            if g["guessed_role"] == target.original_role:
                 guesser_scores[gid]["correct"] += 1
 
         leaderboard = sorted(guesser_scores.values(), key=lambda x: -x["correct"])
         resp["guess_leaderboard"] = leaderboard
 
-    return resp
+    if public.final:
+        _final_cache.put(game_id, public)
+    else:
+        _public_cache.put((game_id, version), public)
+    return public
 
 
 # ── Night action ───────────────────────────────────────
@@ -329,21 +638,28 @@ def get_game_state(game_id: str, request: Request):
 @app.post("/action/{game_id}")
 def submit_action(game_id: str, req: ActionRequest, request: Request):
     user = _get_user(request)
-    game = db.get_game(game_id.upper())
-    if not game:
+    game_id = game_id.upper()
+    # Checked and written with no phase change in between
+    with db.game_lock(game_id):
+        return _submit_action(game_id, req, user)
+
+
+def _submit_action(game_id: str, req: ActionRequest, user: dict) -> dict:
+    ag = db.load_game(game_id)
+    if not ag:
         raise HTTPException(404, "Partita non trovata")
+    game = ag.game
     if game["state"] != GameState.NIGHT.value:
         raise HTTPException(400, "Non è notte")
 
-    player = db.get_player_in_game(game["id"], user["id"])
+    player = ag.player_for_user(user["id"])
     if not player:
         raise HTTPException(403, "Non sei in questa partita")
-    if not player["is_alive"]:
+    if not player.is_alive:
         raise HTTPException(400, "Sei morto")
 
-    role = player["role"]
-    allowed = ROLE_ACTIONS.get(role, [])
-    if req.action_type.value not in allowed:
+    role = player.role
+    if req.action_type.value not in ROLE_ACTION_SET.get(role, ()):
         raise HTTPException(400, f"Azione {req.action_type} non permessa per {role}")
 
     # Mitomane can only act on night 2
@@ -352,57 +668,44 @@ def submit_action(game_id: str, req: ActionRequest, request: Request):
 
     # Kamikaze can explode only once
     if req.action_type == ActionType.EXPLODE:
-        if player.get("attributes", {}).get("kamikaze_used"):
+        if player.attributes.get("kamikaze_used"):
             raise HTTPException(400, "Hai già usato l'esplosione")
 
     # Validate target
-    target = db.get_player(req.target_id)
-    if not target or target["game_id"] != game["id"]:
+    target = ag.player(req.target_id)
+    if not target:
         raise HTTPException(400, "Bersaglio non valido")
-    if not target["is_alive"]:
+    if not target.is_alive:
         raise HTTPException(400, "Il bersaglio è morto")
     # Protettore can't protect self
-    if req.action_type == ActionType.PROTECT and req.target_id == player["id"]:
+    if req.action_type == ActionType.PROTECT and req.target_id == player.id:
         raise HTTPException(400, "Non puoi proteggere te stesso")
     # Wolves can't kill themselves
-    if req.action_type == ActionType.KILL and req.target_id == player["id"]:
+    if req.action_type == ActionType.KILL and req.target_id == player.id:
         raise HTTPException(400, "Non puoi bersagliare te stesso")
 
-    # If kamikaze switches to EXPLODE, remove old KILL; if switches to KILL, remove EXPLODE
+    # A Kamikaze switching between KILL and EXPLODE replaces the other action
+    replaces = ()
     if role == Role.KAMIKAZE.value:
-        if req.action_type == ActionType.EXPLODE:
-            # Remove existing KILL vote
-            existing_kill = db.get_player_action(game["id"], player["id"], ActionType.KILL.value)
-            if existing_kill:
-                db.actions.remove(
-                    (db.actions._query_cache.clear() or True) and
-                    (Q.game_id == game["id"]) & (Q.player_id == player["id"]) & (Q.action_type == ActionType.KILL.value)
-                ) if False else None
-                # Simpler approach
-                db.actions.remove(
-                    (Q.game_id == game["id"]) & (Q.player_id == player["id"]) & (Q.action_type == ActionType.KILL.value)
-                )
-        elif req.action_type == ActionType.KILL:
-            db.actions.remove(
-                (Q.game_id == game["id"]) & (Q.player_id == player["id"]) & (Q.action_type == ActionType.EXPLODE.value)
-            )
-
-    db.upsert_action(game["id"], player["id"], req.target_id, req.action_type.value)
+        replaces = tuple({ActionType.KILL.value, ActionType.EXPLODE.value}
+                         - {req.action_type.value})
+
+    db.upsert_action(game["id"], player.id, req.target_id, req.action_type.value, replaces)
 
     # Immediate feedback for inspection roles
     result = None
     if req.action_type == ActionType.INSPECT:
-        if target["role"] in [r.value for r in WOLF_FACTION]:
+        if target.role in WOLF_ROLES:
             # Criceto is seen as "Non Lupo"
-            if target["role"] == Role.CRICETO.value:
-                result = f"{target['nickname']} NON è un Lupo ✅"
+            if target.role == Role.CRICETO.value:
+                result = f"{target.nickname} NON è un Lupo ✅"
             else:
-                result = f"{target['nickname']} è un LUPO 🐺"
+                result = f"{target.nickname} è un LUPO 🐺"
         else:
-            result = f"{target['nickname']} NON è un Lupo ✅"
+            result = f"{target.nickname} NON è un Lupo ✅"
 
     if req.action_type == ActionType.INSPECT_ROLE:
-        result = f"{target['nickname']} è: {target['role']} {ROLE_EMOJI.get(Role(target['role']), '')}"
+        result = f"{target.nickname} è: {target.role} {ROLE_EMOJI_BY_VALUE.get(target.role, '')}"
 
     return {"ok": True, "result": result}
 
@@ -412,21 +715,27 @@ def submit_action(game_id: str, req: ActionRequest, request: Request):
 @app.post("/vote/{game_id}")
 def submit_vote(game_id: str, req: VoteRequest, request: Request):
     user = _get_user(request)
-    game = db.get_game(game_id.upper())
-    if not game:
+    game_id = game_id.upper()
+    with db.game_lock(game_id):
+        return _submit_vote(game_id, req, user)
+
+
+def _submit_vote(game_id: str, req: VoteRequest, user: dict) -> dict:
+    ag = db.load_game(game_id)
+    if not ag:
         raise HTTPException(404)
-    if game["state"] != GameState.DAY.value:
+    if ag.state != GameState.DAY.value:
         raise HTTPException(400, "Non è giorno")
-    player = db.get_player_in_game(game["id"], user["id"])
-    if not player or not player["is_alive"]:
+    player = ag.player_for_user(user["id"])
+    if not player or not player.is_alive:
         raise HTTPException(400, "Non puoi votare")
-    target = db.get_player(req.target_id)
-    if not target or target["game_id"] != game["id"] or not target["is_alive"]:
+    target = ag.player(req.target_id)
+    if not target or not target.is_alive:
         raise HTTPException(400, "Bersaglio non valido")
-    if req.target_id == player["id"]:
+    if req.target_id == player.id:
         raise HTTPException(400, "Non puoi votare te stesso")
 
-    db.upsert_vote(game["id"], player["id"], req.target_id)
+    db.upsert_vote(ag.id, player.id, req.target_id)
     return {"ok": True}
 
 
@@ -435,83 +744,63 @@ def submit_vote(game_id: str, req: VoteRequest, request: Request):
 @app.post("/guess/{game_id}")
 def submit_guess(game_id: str, req: GuessRequest, request: Request):
     user = _get_user(request)
-    game = db.get_game(game_id.upper())
-    if not game:
+    game_id = game_id.upper()
+    with db.game_lock(game_id):
+        return _submit_guess(game_id, req, user)
+
+
+def _submit_guess(game_id: str, req: GuessRequest, user: dict) -> dict:
+    ag = db.load_game(game_id)
+    if not ag:
         raise HTTPException(404)
-    if game["state"] not in (GameState.NIGHT.value, GameState.DAY.value):
+    if ag.state not in (GameState.NIGHT.value, GameState.DAY.value):
         raise HTTPException(400, "Non puoi indovinare ora")
-    player = db.get_player_in_game(game["id"], user["id"])
-    if not player or not player["is_alive"]:
+    player = ag.player_for_user(user["id"])
+    if not player or not player.is_alive:
         raise HTTPException(400, "Non puoi giocare")
     # Only idle roles can play
-    idle_roles = [Role.VILLICO.value, Role.INDEMONIATO.value, Role.MASSONE.value]
-    if player["role"] not in idle_roles:
+    if player.role not in IDLE_ROLES:
         raise HTTPException(400, "Solo ruoli senza azione notturna possono giocare")
-    target = db.get_player(req.target_id)
-    if not target or target["game_id"] != game["id"]:
+    if not ag.player(req.target_id):
         raise HTTPException(400, "Bersaglio non valido")
-    db.upsert_guess(game["id"], player["id"], req.target_id, req.guessed_role)
+    db.upsert_guess(ag.id, player.id, req.target_id, req.guessed_role)
     return {"ok": True}
 
 
 # ── History ────────────────────────────────────────────
 
 @app.get("/history")
-def get_history(request: Request):
+def get_history(request: Request,
+                cursor: int | None = Query(None, ge=1),
+                limit: int = Query(50, ge=1, le=200)):
+    """Finished games, newest first; pass the last item's ``cursor`` for more."""
     user = _get_user(request)
-    games = db.list_finished_games_for_user(user["id"])
-    result = []
-    for g in games:
-        ps = db.get_game_players(g["id"])
-        # Find current user's player
-        me = next((p for p in ps if p["user_id"] == user["id"]), None)
-        player_role = me.get("original_role", me["role"]) if me else ""
-        
-        # Determine if player won
-        winners = g.get("winners", "")
-        player_won = False
-        if me:
-            wolf_roles = ["Lupo"]
-            evil_roles = ["Lupo", "Oracolo", "Kamikaze", "Indemoniato"]
-            if winners == "Lupi" and player_role in evil_roles:
-                player_won = True
-            elif winners == "Villaggio" and player_role not in evil_roles:
-                player_won = True
-            elif winners == "Criceto":
-                player_won = (player_role == "Criceto Mannaro")
-        
-        result.append({
-            "game_id": g["id"],
-            "winners": winners,
-            "target_players": g["target_players"],
-            "created_at": g.get("created_at", 0),
-            "turns": g.get("turn_number", 0),
-            "player_role": player_role,
-            "player_won": player_won,
-            "players": [{"nickname": p["nickname"], "role": p.get("original_role", p["role"])} for p in ps],
-        })
-    return result
+    return ORJSONResponse([
+        {**{k: v for k, v in row.items() if k != "user_id"}, "cursor": row.doc_id}
+        for row in db.get_history(user["id"], before=cursor, limit=limit)
+    ])
 
 
 @app.get("/history/{game_id}")
 def get_game_history(game_id: str, request: Request):
     user = _get_user(request)
-    game = db.get_game(game_id.upper())
-    if not game:
+    # Live tables first, then the monthly archive
+    record = db.get_game_record(game_id.upper())
+    if not record:
         raise HTTPException(404)
-    players = db.get_game_players(game["id"])
-    return {
+    game = record["game"]
+    return ORJSONResponse({
         "game_id": game["id"],
         "winners": game.get("winners", ""),
         "winner_detail": game.get("winner_detail", ""),
         "turns": game.get("turn_number", 0),
-        "events": game.get("events", []),
+        "events": list(record["events"]),
         "players": [
             {"nickname": p["nickname"], "role": p.get("original_role", p["role"]),
              "final_role": p["role"], "is_alive": p["is_alive"]}
-            for p in players
+            for p in record["players"]
         ],
-    }
+    })
 
 
 # ═══════════════════════════════════════════════════════
@@ -519,7 +808,9 @@ def get_game_history(game_id: str, request: Request):
 # ═══════════════════════════════════════════════════════
 
 def _start_game(game_id: str):
-    players = db.get_game_players(game_id)
+    """Deal the roles (the caller holds the game lock)."""
+    ag = db.load_game_for_update(game_id)
+    players = ag.all_players()
     n = len(players)
     roles = get_role_distribution(n)
     random.shuffle(roles)
@@ -529,354 +820,220 @@ def _start_game(game_id: str):
         role_counts[r.value] = role_counts.get(r.value, 0) + 1
 
     for player, role in zip(players, roles):
-        db.update_player(player["id"], {
+        ag.update_player(player.id, {
             "role": role.value,
             "original_role": role.value,
             "attributes": {},
         })
 
-    db.update_game(game_id, {
+    ag.update({
         "state": GameState.ROLE_REVEAL.value,
         "roles_in_game": role_counts,
         "phase_end_time": _now() + REVEAL_DURATION,
     })
-    db.add_event(game_id, 0, "SETUP", "game_start",
-                 f"Partita iniziata con {n} giocatori")
+    ag.add_event(0, "SETUP", "game_start", f"Partita iniziata con {n} giocatori")
+    _save(ag)
 
 
+@metrics.timed("advance")
 def _maybe_advance(game_id: str):
-    game = db.get_game(game_id)
-    if not game:
+    """Advance the game if its phase timer expired (run by the scheduler)."""
+    try:
+        with db.game_lock(game_id):
+            _advance(game_id)
+    except StaleGameError:
+        # Written by another worker since it was loaded: reload and retry once
+        with db.game_lock(game_id):
+            _advance(game_id)
+
+
+def _advance(game_id: str):
+    ag = db.load_game_for_update(game_id)
+    if not ag:
         return
-    state = game["state"]
+    state = ag.state
     if state in (GameState.LOBBY.value, GameState.GAME_OVER.value):
         return
-    if _now() < game.get("phase_end_time", 0):
+    if _now() < ag.game.get("phase_end_time", 0):
+        # Deadline moved: re-arm instead of dropping the game
+        scheduler.schedule(game_id, ag.game["phase_end_time"])
         return
 
     if state == GameState.ROLE_REVEAL.value:
-        _transition_to_night(game_id)
+        _transition_to_night(ag)
     elif state == GameState.NIGHT.value:
-        _resolve_night(game_id)
+        _resolve_night(ag)
     elif state == GameState.DAY.value:
-        _resolve_day(game_id)
+        _resolve_day(ag)
+    _save(ag)
+
+
+def _save(ag: ActiveGame):
+    """Persist a transition with one write, then arm the next deadline."""
+    db.save_game(ag)
+    if ag.state == GameState.GAME_OVER.value:
+        _record_game_over(ag)
+    if not leader.held:
+        return  # the leader picks the deadline up at its next rescan
+    if ag.state == GameState.GAME_OVER.value:
+        scheduler.cancel(ag.id)
+    else:
+        scheduler.schedule(ag.id, ag.game["phase_end_time"])
 
 
-def _transition_to_night(game_id: str):
-    game = db.get_game(game_id)
-    turn = game.get("turn_number", 0) + 1
-    db.clear_actions(game_id)
-    db.clear_votes(game_id)
-    db.update_game(game_id, {
+def _transition_to_night(ag: ActiveGame):
+    turn = ag.turn + 1
+    ag.clear_actions()
+    ag.clear_votes()
+    ag.update({
         "state": GameState.NIGHT.value,
         "turn_number": turn,
         "phase_end_time": _now() + NIGHT_DURATION,
         "night_deaths": [],
     })
-    db.add_event(game_id, turn, "NIGHT", "night_start", f"Notte {turn}")
+    ag.add_event(turn, "NIGHT", "night_start", f"Notte {turn}")
 
 
-def _transition_to_day(game_id: str, night_deaths: list[str]):
-    db.clear_votes(game_id)
-    game = db.get_game(game_id)
-    db.update_game(game_id, {
+def _transition_to_day(ag: ActiveGame, night_deaths: list[str]):
+    ag.clear_votes()
+    ag.update({
         "state": GameState.DAY.value,
         "phase_end_time": _now() + DAY_DURATION,
         "night_deaths": night_deaths,
         "day_deaths": [],
     })
-    db.add_event(game_id, game["turn_number"], "DAY", "day_start",
-                 f"Giorno {game['turn_number']}")
+    ag.add_event(ag.turn, "DAY", "day_start", f"Giorno {ag.turn}")
 
 
-def _transition_to_game_over(game_id: str, winners: str, detail: str = ""):
-    game = db.get_game(game_id)
-    db.update_game(game_id, {
+def _transition_to_game_over(ag: ActiveGame, winners: str, detail: str = ""):
+    ag.update({
         "state": GameState.GAME_OVER.value,
         "winners": winners,
         "winner_detail": detail,
         "phase_end_time": 0,
+        "finished_at": _now(),
     })
-    db.add_event(game_id, game["turn_number"], "GAME_OVER", "game_end",
-                 f"Vincitore: {winners}. {detail}")
+    ag.add_event(ag.turn, "GAME_OVER", "game_end", f"Vincitore: {winners}. {detail}")
 
-    # Update user stats
-    players = db.get_game_players(game_id)
-    for p in players:
-        db.update_user_stats(p["user_id"], "games")
-        role_val = p.get("original_role", p["role"])
-        player_won = _did_player_win(role_val, p["role"], winners, p["is_alive"])
-        if player_won:
-            db.update_user_stats(p["user_id"], "wins")
-            if winners == "Lupi":
-                db.update_user_stats(p["user_id"], "wolf_wins")
-            elif winners == "Villaggio":
-                db.update_user_stats(p["user_id"], "village_wins")
 
+def _record_game_over(ag: ActiveGame):
+    """History rows and user stats of a game once saved as over.
 
-def _did_player_win(original_role: str, current_role: str, winners: str, is_alive: bool) -> bool:
-    if winners == "Criceto Mannaro":
-        return current_role == Role.CRICETO.value and is_alive
-    if winners == "Lupi":
-        # Evil faction wins (Lupo, Kamikaze, Oracolo, Indemoniato)
-        if current_role in [r.value for r in EVIL_FACTION]:
-            return True
-        # Mitomane that became evil
-        if original_role == Role.MITOMANE.value and current_role in [r.value for r in EVIL_FACTION]:
-            return True
-        return False
-    if winners == "Villaggio":
-        if current_role in [r.value for r in EVIL_FACTION]:
-            return False
-        if current_role == Role.CRICETO.value:
-            return False
-        return True
-    return False
-
-
-def _check_win(game_id: str) -> tuple[str, str] | None:
-    alive = db.get_game_players(game_id, alive_only=True)
-    # Count Lupo, Kamikaze, Oracolo for win condition (not Indemoniato)
-    evil_alive = [p for p in alive if p["role"] in [Role.LUPO.value, Role.KAMIKAZE.value, Role.ORACOLO.value]]
-    non_evil_alive = [p for p in alive if p["role"] not in [Role.LUPO.value, Role.KAMIKAZE.value, Role.ORACOLO.value]]
-    criceto_alive = any(p["role"] == Role.CRICETO.value for p in alive)
-
-    if not evil_alive:
-        if criceto_alive:
-            return ("Criceto Mannaro", "Il Criceto Mannaro è sopravvissuto e vince da solo!")
-        return ("Villaggio", "Tutti i lupi sono stati eliminati!")
-
-    if len(evil_alive) >= len(non_evil_alive):
-        if criceto_alive:
-            return ("Criceto Mannaro", "Il Criceto Mannaro è sopravvissuto e vince da solo!")
-        return ("Lupi", "I lupi hanno preso il controllo del villaggio!")
-
-    return None
+    Run after save_game: a failed or retried save cannot count a game twice.
+    """
+    winners = ag.game.get("winners", "")
+    history = _history_rows(ag, winners, ag.game["finished_at"])
+    db.add_history(history)
 
+    # Update user stats
+    deltas: dict[str, dict[str, int]] = {}
+    for row in history:
+        delta = deltas[row["user_id"]] = {"games": 1}
+        if row["player_won"]:
+            delta["wins"] = 1
+            if winners == "Lupi":
+                delta["wolf_wins"] = 1
+            elif winners == "Villaggio":
+                delta["village_wins"] = 1
+    db.apply_stats_delta(deltas)
+
+
+def _history_rows(ag: ActiveGame, winners: str, finished_at: float) -> list[dict]:
+    """One /history entry per player, in ``ag.all_players()`` order."""
+    players = ag.all_players()
+    roster = [{"nickname": p.nickname, "role": p.original_role} for p in players]
+    return [
+        {
+            "user_id": p.user_id,
+            "game_id": ag.id,
+            "winners": winners,
+            "target_players": ag.game["target_players"],
+            "created_at": ag.game.get("created_at", 0),
+            "finished_at": finished_at,
+            "turns": ag.turn,
+            "player_role": p.original_role,
+            "player_won": _did_player_win(p.role, winners, p.is_alive),
+            "players": roster,
+        }
+        for p in players
+    ]
 
-# ── Night resolution (action stack) ───────────────────
 
-def _resolve_night(game_id: str):
-    game = db.get_game(game_id)
-    turn = game["turn_number"]
-    all_players = {p["id"]: p for p in db.get_game_players(game_id)}
-    deaths: list[str] = []
-    death_ids: set[str] = set()
-
-    # ── 1. MITOMANE (night 2 only) ──
-    if turn == 2:
-        copy_actions = db.get_actions(game_id, ActionType.COPY.value)
-        for ca in copy_actions:
-            mitomane = all_players.get(ca["player_id"])
-            target = all_players.get(ca["target_id"])
-            if mitomane and target and mitomane["is_alive"]:
-                target_role = target["role"]
-                if target_role in [r.value for r in WOLF_FACTION]:
-                    db.update_player(mitomane["id"], {"role": Role.LUPO.value})
-                    db.add_event(game_id, turn, "NIGHT", "mitomane_copy",
-                                 f"{mitomane['nickname']} ha copiato un Lupo e diventa Lupo!")
-                elif target_role == Role.VEGGENTE.value:
-                    db.update_player(mitomane["id"], {"role": Role.VEGGENTE.value})
-                    db.add_event(game_id, turn, "NIGHT", "mitomane_copy",
-                                 f"{mitomane['nickname']} ha copiato il Veggente e diventa Veggente!")
-                else:
-                    db.add_event(game_id, turn, "NIGHT", "mitomane_copy",
-                                 f"{mitomane['nickname']} ha copiato un ruolo senza effetto, resta Villico.")
-                    db.update_player(mitomane["id"], {"role": Role.VILLICO.value})
-
-    # Refresh players after mitomane
-    all_players = {p["id"]: p for p in db.get_game_players(game_id)}
-
-    # ── 2. PROTETTORE ──
-    protect_actions = db.get_actions(game_id, ActionType.PROTECT.value)
-    protected_ids: set[str] = set()
-    protector_map: dict[str, str] = {}  # protected_id -> protector_id
-    for pa in protect_actions:
-        if all_players.get(pa["player_id"], {}).get("is_alive"):
-            protected_ids.add(pa["target_id"])
-            protector_map[pa["target_id"]] = pa["player_id"]
-            target_p = all_players.get(pa["target_id"])
-            if target_p:
-                db.add_event(game_id, turn, "NIGHT", "protect",
-                             f"Il Protettore protegge {target_p['nickname']}")
-
-    # ── 3. LUPI (wolf kill vote) ──
-    kill_actions = db.get_actions(game_id, ActionType.KILL.value)
-    if kill_actions:
-        target_counts = Counter(a["target_id"] for a in kill_actions)
-        max_votes = max(target_counts.values())
-        top_targets = [tid for tid, c in target_counts.items() if c == max_votes]
+def _backfill_history():
+    """Write history rows for games finished before the projection existed."""
+    if not db.history_empty():
+        return
+    games = sorted((db.finished_at(g), g["id"], g) for g in db.list_finished_games())
+    for finished_at, _, game in games:
+        ag = db.load_game(game["id"])
+        db.add_history(_history_rows(ag, game.get("winners", ""), finished_at))
 
-        # Determine how many kills (1 normally, 2 if >=19 players)
-        total_players = len(all_players)
-        num_kills = 2 if total_players >= 19 else 1
-        targets_to_kill = top_targets[:num_kills] if len(top_targets) <= num_kills else []
-        # Tie with more candidates than kill slots -> nobody dies
-        if len(top_targets) > num_kills:
-            targets_to_kill = []
-            db.add_event(game_id, turn, "NIGHT", "wolf_tie",
-                         "I lupi non si sono accordati, nessuno muore.")
-
-        for victim_id in targets_to_kill:
-            victim = all_players.get(victim_id)
-            if not victim or not victim["is_alive"]:
-                continue
 
-            # Check: Criceto immune
-            if victim["role"] == Role.CRICETO.value:
-                db.add_event(game_id, turn, "NIGHT", "criceto_immune",
-                             f"I lupi hanno attaccato {victim['nickname']} (Criceto Mannaro) ma non muore!")
-                continue
+def _did_player_win(current_role: str, winners: str, is_alive: bool) -> bool:
+    # The current role decides: a Mitomane that copied a Lupo wins with the wolves
+    faction = ROLE_FACTION.get(current_role, "Villaggio")
+    if winners == "Criceto Mannaro":
+        return faction == winners and is_alive
+    return faction == winners
 
-            # Check: Protected
-            if victim_id in protected_ids:
-                db.add_event(game_id, turn, "NIGHT", "protected",
-                             f"I lupi hanno attaccato {victim['nickname']} ma era protetto!")
-                continue
 
-            # Kill the target
-            db.kill_player(victim_id)
-            death_ids.add(victim_id)
-            deaths.append(victim["nickname"])
-            db.add_event(game_id, turn, "NIGHT", "wolf_kill",
-                         f"I lupi hanno ucciso {victim['nickname']}")
-
-            # If target is Massone, kill the other mason too
-            if victim["role"] == Role.MASSONE.value:
-                other_mason = _find_other_mason(game_id, victim_id, all_players)
-                if other_mason and other_mason["is_alive"]:
-                    # Check if other mason is protected
-                    if other_mason["id"] in protected_ids:
-                        db.add_event(game_id, turn, "NIGHT", "mason_protected",
-                                     f"L'altro massone {other_mason['nickname']} era protetto e sopravvive.")
-                    else:
-                        db.kill_player(other_mason["id"])
-                        death_ids.add(other_mason["id"])
-                        if other_mason["nickname"] not in deaths:
-                            deaths.append(other_mason["nickname"])
-                        db.add_event(game_id, turn, "NIGHT", "mason_chain",
-                                     f"Anche il massone {other_mason['nickname']} muore insieme al compagno!")
-
-    # ── 4. KAMIKAZE ──
-    explode_actions = db.get_actions(game_id, ActionType.EXPLODE.value)
-    for ea in explode_actions:
-        kamikaze_p = all_players.get(ea["player_id"])
-        target_p = all_players.get(ea["target_id"])
-        if not kamikaze_p or not kamikaze_p["is_alive"]:
-            continue
-        if kamikaze_p["id"] in death_ids:
-            continue
+def _check_win(ag: ActiveGame) -> tuple[str, str] | None:
+    players = ag.all_players()
+    return check_win([ROLE_CODE[p.role] for p in players], [p.is_alive for p in players])
 
-        # Mark kamikaze as used
-        attrs = kamikaze_p.get("attributes", {})
-        attrs["kamikaze_used"] = True
-        db.update_player(kamikaze_p["id"], {"attributes": attrs})
-
-        # Kamikaze always dies
-        explosion_deaths: list[str] = []
-        explosion_ids: set[str] = set()
-
-        db.kill_player(kamikaze_p["id"])
-        explosion_ids.add(kamikaze_p["id"])
-        explosion_deaths.append(kamikaze_p["nickname"])
-
-        if target_p and target_p["is_alive"] and target_p["id"] not in death_ids:
-            # Case A: target is Protettore
-            if target_p["role"] == Role.PROTETTORE.value:
-                db.kill_player(target_p["id"])
-                explosion_ids.add(target_p["id"])
-                explosion_deaths.append(target_p["nickname"])
-                # Also kill whoever was protected
-                for pid, protector_id in protector_map.items():
-                    if protector_id == target_p["id"]:
-                        prot_target = all_players.get(pid)
-                        if prot_target and prot_target["is_alive"] and prot_target["id"] not in death_ids and prot_target["id"] not in explosion_ids:
-                            db.kill_player(prot_target["id"])
-                            explosion_ids.add(prot_target["id"])
-                            explosion_deaths.append(prot_target["nickname"])
-
-            # Case B: target is protected
-            elif target_p["id"] in protected_ids:
-                db.kill_player(target_p["id"])
-                explosion_ids.add(target_p["id"])
-                explosion_deaths.append(target_p["nickname"])
-                # Kill protector too
-                protector_id = protector_map.get(target_p["id"])
-                if protector_id:
-                    protector = all_players.get(protector_id)
-                    if protector and protector["is_alive"] and protector["id"] not in death_ids and protector["id"] not in explosion_ids:
-                        db.kill_player(protector["id"])
-                        explosion_ids.add(protector["id"])
-                        explosion_deaths.append(protector["nickname"])
-
-            # Case C: target is Massone
-            elif target_p["role"] == Role.MASSONE.value:
-                db.kill_player(target_p["id"])
-                explosion_ids.add(target_p["id"])
-                explosion_deaths.append(target_p["nickname"])
-                # Kill other mason
-                other_mason = _find_other_mason(game_id, target_p["id"], all_players)
-                if other_mason and other_mason["is_alive"] and other_mason["id"] not in death_ids and other_mason["id"] not in explosion_ids:
-                    db.kill_player(other_mason["id"])
-                    explosion_ids.add(other_mason["id"])
-                    explosion_deaths.append(other_mason["nickname"])
-                    # If a mason was protected, kill protector too
-                    if target_p["id"] in protected_ids:
-                        prot_id = protector_map.get(target_p["id"])
-                        if prot_id:
-                            prot_p = all_players.get(prot_id)
-                            if prot_p and prot_p["is_alive"] and prot_p["id"] not in death_ids and prot_p["id"] not in explosion_ids:
-                                db.kill_player(prot_p["id"])
-                                explosion_ids.add(prot_p["id"])
-                                explosion_deaths.append(prot_p["nickname"])
-                    if other_mason and other_mason["id"] in protected_ids:
-                        prot_id = protector_map.get(other_mason["id"])
-                        if prot_id:
-                            prot_p = all_players.get(prot_id)
-                            if prot_p and prot_p["is_alive"] and prot_p["id"] not in death_ids and prot_p["id"] not in explosion_ids:
-                                db.kill_player(prot_p["id"])
-                                explosion_ids.add(prot_p["id"])
-                                explosion_deaths.append(prot_p["nickname"])
-
-            # Case D: normal target
-            else:
-                db.kill_player(target_p["id"])
-                explosion_ids.add(target_p["id"])
-                explosion_deaths.append(target_p["nickname"])
 
-        db.add_event(game_id, turn, "NIGHT", "kamikaze_explode",
-                     f"💥 Il Kamikaze esplode! Morti: {', '.join(explosion_deaths)}")
-        death_ids.update(explosion_ids)
-        for nick in explosion_deaths:
-            if nick not in deaths:
-                deaths.append(nick)
+# ── Night resolution (action stack) ───────────────────
 
-    # ── 5. VEGGENTE / ORACOLO (info only, already handled in submit_action) ──
-    # ── 6. MEDIUM (info stored for night_message) ──
-    # ── 7. MASSONI (night 1, info via night_message) ──
+def _resolve_night(ag: ActiveGame):
+    turn = ag.turn
+    players = ag.all_players()
+    index = {p.id: i for i, p in enumerate(players)}
+
+    def code(player_id) -> int:
+        # Ids not in the game get their own index past the last player
+        if player_id not in index:
+            index[player_id] = len(index)
+        return index[player_id]
+
+    outcome = resolve_night(
+        turn,
+        [ROLE_CODE[p.role] for p in players],
+        [p.is_alive for p in players],
+        [p.nickname for p in players],
+        [(code(a["player_id"]), code(a["target_id"]), ACTION_CODE[a["action_type"]])
+         for a in ag.actions if a["action_type"] in ACTION_CODE],
+    )
 
-    # Remove duplicates from deaths
-    deaths = list(dict.fromkeys(deaths))
+    # Apply the diff
+    for i, role in outcome.role_changes.items():
+        ag.update_player(players[i].id, {"role": ROLES[role].value})
+    for i in outcome.kamikaze_used:
+        p = players[i]
+        ag.update_player(p.id, {"attributes": {**p.attributes, "kamikaze_used": True}})
+    for i in outcome.deaths:
+        ag.kill(players[i].id)
+    for etype, detail in outcome.events:
+        ag.add_event(turn, "NIGHT", etype, detail)
+    deaths = [players[i].nickname for i in outcome.deaths]
 
     # Check win condition
-    winner = _check_win(game_id)
+    winner = _check_win(ag)
     if winner:
-        _transition_to_game_over(game_id, winner[0], winner[1])
+        _transition_to_game_over(ag, winner[0], winner[1])
     else:
-        _transition_to_day(game_id, deaths)
+        _transition_to_day(ag, deaths)
 
 
-def _find_other_mason(game_id: str, mason_id: str, all_players: dict) -> dict | None:
-    for pid, p in all_players.items():
-        if p["role"] == Role.MASSONE.value and p["id"] != mason_id:
+def _find_other_mason(mason_id: str, all_players: dict[str, PlayerRecord]) -> PlayerRecord | None:
+    for p in all_players.values():
+        if p.role == Role.MASSONE.value and p.id != mason_id:
             return p
     return None
 
 
-def _resolve_day(game_id: str):
-    game = db.get_game(game_id)
-    turn = game["turn_number"]
-    votes = db.get_votes(game_id)
+def _resolve_day(ag: ActiveGame):
+    turn = ag.turn
+    votes = ag.votes
     day_deaths: list[str] = []
 
     if votes:
@@ -885,46 +1042,44 @@ def _resolve_day(game_id: str):
         top_targets = [tid for tid, c in target_counts.items() if c == max_votes]
 
         # Tie → all tied die
-        all_players = {p["id"]: p for p in db.get_game_players(game_id)}
         for tid in top_targets:
-            victim = all_players.get(tid)
-            if victim and victim["is_alive"]:
-                db.kill_player(tid)
-                day_deaths.append(victim["nickname"])
-                db.add_event(game_id, turn, "DAY", "burned",
-                             f"{victim['nickname']} mandato al rogo (era {victim['role']})")
+            victim = ag.player(tid)
+            if victim and victim.is_alive:
+                ag.kill(tid)
+                day_deaths.append(victim.nickname)
+                ag.add_event(turn, "DAY", "burned",
+                             f"{victim.nickname} mandato al rogo (era {victim.role})")
 
         # Store last burned for Medium (first death)
         if day_deaths:
-            first_burned = top_targets[0]
-            burned_p = all_players.get(first_burned)
+            burned_p = ag.player(top_targets[0])
             if burned_p:
-                db.update_game(game_id, {
-                    "last_day_burned_nick": burned_p["nickname"],
-                    "last_day_burned_role": burned_p["role"],
+                ag.update({
+                    "last_day_burned_nick": burned_p.nickname,
+                    "last_day_burned_role": burned_p.role,
                 })
 
-    db.update_game(game_id, {"day_deaths": day_deaths})
+    ag.update({"day_deaths": day_deaths})
 
-    winner = _check_win(game_id)
+    winner = _check_win(ag)
     if winner:
-        _transition_to_game_over(game_id, winner[0], winner[1])
+        _transition_to_game_over(ag, winner[0], winner[1])
     else:
-        _transition_to_night(game_id)
+        _transition_to_night(ag)
 
 
 # ── Night messages ─────────────────────────────────────
 
-def _get_night_message(game: dict, player: dict, all_players: list[dict]) -> str | None:
-    role = player["role"]
-    turn = game["turn_number"]
+def _get_night_message(ag: ActiveGame, player: PlayerRecord) -> str | None:
+    role = player.role
+    turn = ag.turn
 
     # Medium: from night 2+, info about last day's burned
     if role == Role.MEDIUM.value and turn >= 2:
-        nick = game.get("last_day_burned_nick", "")
-        burned_role = game.get("last_day_burned_role", "")
+        nick = ag.game.get("last_day_burned_nick", "")
+        burned_role = ag.game.get("last_day_burned_role", "")
         if nick and burned_role:
-            if burned_role in [r.value for r in WOLF_FACTION]:
+            if burned_role in WOLF_ROLES:
                 return f"👻 Il morto al rogo ({nick}) ERA un Lupo 🐺"
             else:
                 return f"👻 Il morto al rogo ({nick}) NON era un Lupo ✅"
@@ -932,22 +1087,50 @@ def _get_night_message(game: dict, player: dict, all_players: list[dict]) -> str
 
     # Massoni: night 1, see each other
     if role == Role.MASSONE.value and turn == 1:
-        other = None
-        for p in all_players:
-            if p["role"] == Role.MASSONE.value and p["id"] != player["id"]:
-                other = p
-                break
+        other = _find_other_mason(player.id, ag.players)
         if other:
-            return f"🤝 L'altro Massone è: {other['nickname']}"
+            return f"🤝 L'altro Massone è: {other.nickname}"
 
     return None
 
 
 # ── Debug ──────────────────────────────────────────────
 
+@app.get("/debug/storage")
+def storage_stats():
+    return db.flush_stats()
+
+
+@app.get("/debug/hashing")
+def hashing_stats():
+    return hasher.stats()
+
+
+@app.get("/debug/archive")
+def archive_stats():
+    return db.archive.stats()
+
+
+@app.get("/debug/locks")
+def lock_stats():
+    return db.locks.stats()
+
+
+@app.get("/debug/cache")
+def cache_stats():
+    return {
+        **db.cache_stats(),
+        "game_state_public": _public_cache.stats(),
+        "game_state": _state_cache.stats(),
+        "game_state_final": _final_cache.stats(),
+    }
+
+
 @app.post("/reset")
 def reset_all():
     db.reset()
+    for cache in (_lobby_cache, _public_cache, _state_cache, _final_cache):
+        cache.clear()
     return {"ok": True}
 
 
@@ -0,0 +1,311 @@
+"""
+Opt-in request instrumentation (``LUPUS_METRICS=1``).
+
+Records per-route latency histograms, the time spent in each Database
+method and in named spans (auth, state building, phase advance), and the
+TinyDB table scans with the rows they visit. Each response carries a
+``Server-Timing`` header with the figures of that request; /metrics serves
+the totals in Prometheus text format.
+
+When disabled nothing is patched, wrapped or mounted.
+"""
+from __future__ import annotations
+
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+ENABLED = os.getenv("LUPUS_METRICS", "0") == "1"
+
+# Latency histogram buckets (seconds)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class _RequestStats:
+    """Figures of the current request, reported in Server-Timing."""
+    __slots__ = ("scope", "spans", "db_time", "db_calls", "scans", "rows")
+
+    def __init__(self, scope: dict):
+        self.scope = scope  # the router adds the matched route to it
+        self.spans: dict[str, float] = defaultdict(float)
+        self.db_time = 0.0
+        self.db_calls = 0
+        self.scans = 0
+        self.rows = 0
+
+
+_current: ContextVar[_RequestStats | None] = ContextVar("metrics_request", default=None)
+_local = threading.local()  # database call depth: nested calls count once
+_lock = threading.Lock()
+
+# Totals since startup
+_latency: dict[tuple[str, str], list] = {}           # (method, route) -> [buckets..., sum, count]
+_responses: dict[tuple[str, str, int], int] = defaultdict(int)
+_db: dict[str, list] = defaultdict(lambda: [0, 0.0])  # method -> [calls, seconds]
+_spans: dict[str, list] = defaultdict(lambda: [0, 0.0])
+_scans: dict[tuple[str, str], list] = defaultdict(lambda: [0, 0])  # (route, table) -> [scans, rows]
+
+
+# ── Recording ──────────────────────────────────────────
+
+def _observe(method: str, route: str, status: int, seconds: float):
+    with _lock:
+        h = _latency.get((method, route))
+        if h is None:
+            h = _latency[(method, route)] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                h[i] += 1
+        h[-2] += seconds
+        h[-1] += 1
+        _responses[(method, route, status)] += 1
+
+
+def _record_span(name: str, seconds: float):
+    stats = _current.get()
+    if stats is not None:
+        stats.spans[name] += seconds
+    with _lock:
+        total = _spans[name]
+        total[0] += 1
+        total[1] += seconds
+
+
+def _record_scan(table: str, rows: int):
+    stats = _current.get()
+    route = ""
+    if stats is not None:
+        stats.scans += 1
+        stats.rows += rows
+        route = _route(stats.scope)
+    with _lock:
+        total = _scans[(route, table)]
+        total[0] += 1
+        total[1] += rows
+
+
+def timed(name: str):
+    """Decorator adding the time spent in a function to span ``name``."""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    _record_span(name, time.perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _record_span(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def _timed_call(name: str, fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        depth = getattr(_local, "depth", 0)
+        _local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            _local.depth = depth
+            with _lock:
+                total = _db[name]
+                total[0] += 1
+                total[1] += elapsed
+            stats = _current.get()
+            if stats is not None and depth == 0:
+                stats.db_calls += 1
+                stats.db_time += elapsed
+    return wrapper
+
+
+def instrument_methods(db):
+    """Time every public method of ``db`` (inclusive of nested calls)."""
+    for name in dir(type(db)):
+        if not name.startswith("_") and callable(getattr(type(db), name)):
+            setattr(db, name, _timed_call(name, getattr(db, name)))
+
+
+# ── TinyDB scans ───────────────────────────────────────
+
+_tinydb_patched = False
+
+
+def _patch_tinydb():
+    """Count full-table passes: searches missing the query cache, iteration,
+    lookups by condition and the table rebuild behind every TinyDB write."""
+    global _tinydb_patched
+    if _tinydb_patched:
+        return
+    _tinydb_patched = True
+    from tinydb.table import Table
+
+    read_table, search, iterate, get, update_table = (
+        Table._read_table, Table.search, Table.__iter__, Table.get, Table._update_table)
+
+    def _read_table(self):
+        table = read_table(self)
+        _local.reads = getattr(_local, "reads", 0) + 1
+        _local.size = len(table)
+        return table
+
+    def _search(self, cond):
+        reads = getattr(_local, "reads", 0)
+        result = search(self, cond)
+        if getattr(_local, "reads", 0) != reads:  # not served by the query cache
+            _record_scan(self.name, _local.size)
+        return result
+
+    def _iter(self):
+        rows = 0
+        try:
+            for doc in iterate(self):
+                rows += 1
+                yield doc
+        finally:
+            _record_scan(self.name, rows)
+
+    def _get(self, cond=None, doc_id=None, doc_ids=None):
+        result = get(self, cond, doc_id, doc_ids)
+        if cond is not None and doc_id is None and doc_ids is None:
+            _record_scan(self.name, _local.size)
+        return result
+
+    def _update_table(self, updater):
+        def counted(table: dict):
+            _record_scan(self.name, len(table))
+            updater(table)
+        update_table(self, counted)
+
+    Table._read_table = _read_table
+    Table.search = _search
+    Table.__iter__ = _iter
+    Table.get = _get
+    Table._update_table = _update_table
+
+
+# ── Middleware and endpoint ────────────────────────────
+
+class MetricsMiddleware:
+    """ASGI middleware: per-request stats, Server-Timing and latency histograms."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = _RequestStats(scope)
+        token = _current.set(stats)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", _server_timing(stats, start).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            _observe(scope["method"], _route(scope) or "<unmatched>", status,
+                     time.perf_counter() - start)
+
+
+def _route(scope: dict) -> str:
+    """Path template of the matched route ("/game_state/{game_id}"), or ""."""
+    route = scope.get("route")
+    return route.path if route else ""
+
+
+def _server_timing(stats: _RequestStats, start: float) -> str:
+    parts = [f"app;dur={(time.perf_counter() - start) * 1000:.2f}"]
+    parts += [f"{name};dur={seconds * 1000:.2f}" for name, seconds in stats.spans.items()]
+    if stats.db_calls:
+        parts.append(f'db;dur={stats.db_time * 1000:.2f};desc="{stats.db_calls} calls"')
+    if stats.scans:
+        parts.append(f'tinydb;desc="{stats.scans} scans, {stats.rows} rows"')
+    return ", ".join(parts)
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render() -> str:
+    """All totals in Prometheus text exposition format."""
+    out = [
+        "# HELP http_request_duration_seconds Request latency by route.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    with _lock:
+        for (method, route), h in sorted(_latency.items()):
+            labels = f'method="{method}",route="{_label(route)}"'
+            for bound, count in zip(BUCKETS, h):
+                out.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            out.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {h[-1]}')
+            out.append(f"http_request_duration_seconds_sum{{{labels}}} {h[-2]:.6f}")
+            out.append(f"http_request_duration_seconds_count{{{labels}}} {h[-1]}")
+        out += ["# HELP http_responses_total Responses by route and status.",
+                "# TYPE http_responses_total counter"]
+        for (method, route, status), n in sorted(_responses.items()):
+            out.append(f'http_responses_total{{method="{method}",route="{_label(route)}",'
+                       f'status="{status}"}} {n}')
+        out += ["# HELP db_calls_total Database method calls.",
+                "# TYPE db_calls_total counter"]
+        out += [f'db_calls_total{{method="{m}"}} {c}' for m, (c, _) in sorted(_db.items())]
+        out += ["# HELP db_call_seconds_total Time spent in each Database method.",
+                "# TYPE db_call_seconds_total counter"]
+        out += [f'db_call_seconds_total{{method="{m}"}} {s:.6f}' for m, (_, s) in sorted(_db.items())]
+        out += ["# HELP span_seconds_total Time spent in named spans.",
+                "# TYPE span_seconds_total counter"]
+        out += [f'span_seconds_total{{span="{n}"}} {s:.6f}' for n, (_, s) in sorted(_spans.items())]
+        out += ["# HELP tinydb_scans_total Full TinyDB table passes by route and table.",
+                "# TYPE tinydb_scans_total counter"]
+        out += [f'tinydb_scans_total{{route="{_label(r)}",table="{t}"}} {n}'
+                for (r, t), (n, _) in sorted(_scans.items())]
+        out += ["# HELP tinydb_rows_scanned_total Rows visited by those passes.",
+                "# TYPE tinydb_rows_scanned_total counter"]
+        out += [f'tinydb_rows_scanned_total{{route="{_label(r)}",table="{t}"}} {rows}'
+                for (r, t), (_, rows) in sorted(_scans.items())]
+    return "\n".join(out) + "\n"
+
+
+def install(app: FastAPI, db=None):
+    """Instrument ``app`` (and ``db``'s methods) if enabled; otherwise do nothing."""
+    if not ENABLED:
+        return
+    _patch_tinydb()
+    if db is not None:
+        instrument_methods(db)
+    app.add_middleware(MetricsMiddleware)
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+
+
+def metrics_endpoint() -> PlainTextResponse:
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,59 @@
+"""
+One-shot migration of a TinyDB ``db.json`` to the SQLite backend.
+
+    python migrate_to_sqlite.py [db.json] [lupus.sqlite]
+
+Document ids are preserved. Game events are imported both from the
+per-game logs in ``events/`` and from games still in the old format
+(events embedded in the game document).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+
+from eventlog import EventLog
+from sqlite_db import SQLiteDatabase
+
+
+def migrate(src: str, dst: str, events_dir: str | None = None) -> dict[str, int]:
+    with open(src, encoding="utf-8") as f:
+        tables = json.load(f)
+    log = EventLog(events_dir or os.path.join(os.path.dirname(src) or ".", "events"))
+    db = SQLiteDatabase(dst)
+    try:
+        embedded = {}
+        for doc in tables.get("games", {}).values():
+            events = doc.pop("events", None)
+            if events:
+                embedded[doc["id"]] = events
+        counts = db.import_tables(tables)
+        n_events = 0
+        for doc in tables.get("games", {}).values():
+            game_id = doc["id"]
+            events = list(log.read(game_id)) if log.exists(game_id) else embedded.get(game_id, [])
+            db.events.append(game_id, events)
+            n_events += len(events)
+        counts["events"] = n_events
+    finally:
+        db.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra db.json verso SQLite")
+    parser.add_argument("src", nargs="?", default="db.json")
+    parser.add_argument("dst", nargs="?", default="lupus.sqlite")
+    parser.add_argument("--events-dir", default=None,
+                        help="cartella dei log eventi (default: events/ accanto a src)")
+    args = parser.parse_args()
+    if os.path.exists(args.dst):
+        sys.exit(f"{args.dst} esiste già: rimuovilo o scegli un altro percorso")
+    for table, n in migrate(args.src, args.dst, args.events_dir).items():
+        print(f"{table:10} {n}")
+
+
+if __name__ == "__main__":
+    main()
@@ -67,6 +67,39 @@ ROLE_ACTIONS: dict[str, list[str]] = {
     Role.MITOMANE.value: [ActionType.COPY.value],
 }
 
+# ── Precomputed lookups (by role value) ────────────────
+
+WOLF_ROLES: frozenset[str] = frozenset(r.value for r in WOLF_FACTION)
+EVIL_ROLES: frozenset[str] = frozenset(r.value for r in EVIL_FACTION)
+VILLAGE_ROLES: frozenset[str] = frozenset(r.value for r in VILLAGE_FACTION)
+NEUTRAL_ROLES: frozenset[str] = frozenset(r.value for r in NEUTRAL_FACTION)
+# Count as wolves for the win condition (the Indemoniato does not)
+WIN_EVIL_ROLES: frozenset[str] = frozenset(
+    r.value for r in (Role.LUPO, Role.KAMIKAZE, Role.ORACOLO))
+# Roles without a night action (they can play the guessing game)
+IDLE_ROLES: frozenset[str] = frozenset(
+    r.value for r in (Role.VILLICO, Role.INDEMONIATO, Role.MASSONE))
+
+# Role -> winning faction, as stored in game["winners"]
+ROLE_FACTION: dict[str, str] = {
+    r.value: ("Lupi" if r in EVIL_FACTION
+              else "Criceto Mannaro" if r in NEUTRAL_FACTION
+              else "Villaggio")
+    for r in Role
+}
+ROLE_ACTION_SET: dict[str, frozenset[str]] = {
+    r.value: frozenset(ROLE_ACTIONS.get(r.value, ())) for r in Role
+}
+ROLE_EMOJI_BY_VALUE: dict[str, str] = {r.value: e for r, e in ROLE_EMOJI.items()}
+
+# Integer codes for roles and actions (compact arrays, see night.py)
+ROLES: tuple[Role, ...] = tuple(Role)
+ROLE_CODE: dict[str, int] = {r.value: i for i, r in enumerate(ROLES)}
+ACTION_TYPES: tuple[ActionType, ...] = tuple(ActionType)
+ACTION_CODE: dict[str, int] = {a.value: i for i, a in enumerate(ACTION_TYPES)}
+WOLF_CODES: frozenset[int] = frozenset(ROLE_CODE[v] for v in WOLF_ROLES)
+WIN_EVIL_CODES: frozenset[int] = frozenset(ROLE_CODE[v] for v in WIN_EVIL_ROLES)
+
 NIGHT_DURATION = 180   # 3 min
 DAY_DURATION = 180     # 3 min
 REVEAL_DURATION = 120  # 2 min
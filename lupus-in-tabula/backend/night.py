@@ -0,0 +1,209 @@
+"""
+Pure night resolver and win check.
+
+``resolve_night`` works on players indexed 0..n-1, with roles and
+actions as small integers (``models.ROLE_CODE`` / ``ACTION_CODE``), and
+returns a ``NightOutcome`` diff instead of mutating anything. The caller
+(``main._resolve_night``) applies it to the game in one batch.
+"""
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Sequence
+
+from models import ACTION_CODE, ROLE_CODE, WIN_EVIL_CODES, WOLF_CODES, ActionType, Role
+
+LUPO = ROLE_CODE[Role.LUPO.value]
+VEGGENTE = ROLE_CODE[Role.VEGGENTE.value]
+VILLICO = ROLE_CODE[Role.VILLICO.value]
+PROTETTORE = ROLE_CODE[Role.PROTETTORE.value]
+MASSONE = ROLE_CODE[Role.MASSONE.value]
+CRICETO = ROLE_CODE[Role.CRICETO.value]
+
+KILL = ACTION_CODE[ActionType.KILL.value]
+PROTECT = ACTION_CODE[ActionType.PROTECT.value]
+EXPLODE = ACTION_CODE[ActionType.EXPLODE.value]
+COPY = ACTION_CODE[ActionType.COPY.value]
+
+# Two wolf kills per night from this many players (dead ones included)
+DOUBLE_KILL_PLAYERS = 19
+
+NOBODY = -1
+
+
+@dataclass(slots=True)
+class NightOutcome:
+    deaths: list[int] = field(default_factory=list)           # in order, unique
+    role_changes: dict[int, int] = field(default_factory=dict)
+    kamikaze_used: list[int] = field(default_factory=list)
+    events: list[tuple[str, str]] = field(default_factory=list)  # (type, detail)
+
+
+def resolve_night(turn: int, roles: Sequence[int], alive: Sequence[bool],
+                  nicknames: Sequence[str],
+                  actions: Sequence[tuple[int, int, int]]) -> NightOutcome:
+    """Resolve one night.
+
+    ``actions`` holds ``(actor, target, action_code)`` in submission order;
+    an index outside ``0..n-1`` stands for a player not in the game.
+    """
+    n = len(roles)
+    roles = list(roles)
+    alive = list(alive)
+    out = NightOutcome()
+    events = out.events
+    dead = [False] * n  # died this night
+    by_type: dict[int, list[tuple[int, int]]] = {}
+    for actor, target, code in actions:
+        by_type.setdefault(code, []).append((actor, target))
+
+    def valid(i: int) -> bool:
+        return 0 <= i < n
+
+    def other_mason(i: int) -> int:
+        for j in range(n):
+            if roles[j] == MASSONE and j != i:
+                return j
+        return NOBODY
+
+    # ── 1. MITOMANE (night 2 only) ──
+    if turn == 2:
+        for m, t in by_type.get(COPY, ()):
+            if not (valid(m) and valid(t) and alive[m]):
+                continue
+            if roles[t] in WOLF_CODES:
+                new, detail = LUPO, f"{nicknames[m]} ha copiato un Lupo e diventa Lupo!"
+            elif roles[t] == VEGGENTE:
+                new, detail = VEGGENTE, f"{nicknames[m]} ha copiato il Veggente e diventa Veggente!"
+            else:
+                new, detail = VILLICO, (f"{nicknames[m]} ha copiato un ruolo senza effetto, "
+                                        f"resta Villico.")
+            roles[m] = new
+            out.role_changes[m] = new
+            events.append(("mitomane_copy", detail))
+
+    # ── 2. PROTETTORE ──
+    protector = [NOBODY] * n  # protected -> protector (last action wins)
+    protected_order: list[int] = []  # first protection order, for explosions
+    for p, t in by_type.get(PROTECT, ()):
+        if not (valid(p) and alive[p]) or not valid(t):
+            continue
+        if protector[t] == NOBODY:
+            protected_order.append(t)
+        protector[t] = p
+        events.append(("protect", f"Il Protettore protegge {nicknames[t]}"))
+
+    # ── 3. LUPI (wolf kill vote) ──
+    kills = by_type.get(KILL, ())
+    if kills:
+        counts = Counter(t for _, t in kills)
+        top = max(counts.values())
+        top_targets = [t for t, c in counts.items() if c == top]
+        num_kills = 2 if n >= DOUBLE_KILL_PLAYERS else 1
+        if len(top_targets) > num_kills:
+            # Tie with more candidates than kill slots -> nobody dies
+            top_targets = []
+            events.append(("wolf_tie", "I lupi non si sono accordati, nessuno muore."))
+
+        for v in top_targets:
+            if not valid(v) or not alive[v]:
+                continue
+            if roles[v] == CRICETO:
+                events.append(("criceto_immune", f"I lupi hanno attaccato {nicknames[v]} "
+                                                 f"(Criceto Mannaro) ma non muore!"))
+                continue
+            if protector[v] != NOBODY:
+                events.append(("protected", f"I lupi hanno attaccato {nicknames[v]} "
+                                            f"ma era protetto!"))
+                continue
+
+            alive[v] = False
+            dead[v] = True
+            out.deaths.append(v)
+            events.append(("wolf_kill", f"I lupi hanno ucciso {nicknames[v]}"))
+
+            # A dead Massone takes the other one along
+            if roles[v] == MASSONE:
+                o = other_mason(v)
+                if o != NOBODY and alive[o]:
+                    if protector[o] != NOBODY:
+                        events.append(("mason_protected", f"L'altro massone {nicknames[o]} "
+                                                          f"era protetto e sopravvive."))
+                    else:
+                        alive[o] = False
+                        dead[o] = True
+                        out.deaths.append(o)
+                        events.append(("mason_chain", f"Anche il massone {nicknames[o]} "
+                                                      f"muore insieme al compagno!"))
+
+    # ── 4. KAMIKAZE ──
+    for k, t in by_type.get(EXPLODE, ()):
+        if not valid(k) or not alive[k] or dead[k]:
+            continue
+        out.kamikaze_used.append(k)
+        blown: list[int] = []
+
+        def explode(i: int):
+            alive[i] = False
+            blown.append(i)
+
+        def can_die(i: int) -> bool:
+            return alive[i] and not dead[i]  # exploded players are no longer alive
+
+        explode(k)  # the Kamikaze always dies
+        if valid(t) and alive[t] and not dead[t]:
+            if roles[t] == PROTETTORE:
+                # The Protettore and whoever it protected
+                explode(t)
+                for pt in protected_order:
+                    if protector[pt] == t and can_die(pt):
+                        explode(pt)
+            elif protector[t] != NOBODY:
+                # A protected target takes its protector along
+                explode(t)
+                if can_die(protector[t]):
+                    explode(protector[t])
+            elif roles[t] == MASSONE:
+                explode(t)
+                o = other_mason(t)
+                if o != NOBODY and can_die(o):
+                    explode(o)
+                    for mason in (t, o):
+                        p = protector[mason]
+                        if p != NOBODY and can_die(p):
+                            explode(p)
+            else:
+                explode(t)
+
+        events.append(("kamikaze_explode",
+                       f"💥 Il Kamikaze esplode! Morti: {', '.join(nicknames[i] for i in blown)}"))
+        for i in blown:
+            if not dead[i]:
+                dead[i] = True
+                out.deaths.append(i)
+
+    return out
+
+
+def check_win(roles: Sequence[int], alive: Sequence[bool]) -> tuple[str, str] | None:
+    """``(winner, message)`` if the game is over, else None."""
+    evil = others = 0
+    criceto_alive = False
+    for role, is_alive in zip(roles, alive):
+        if not is_alive:
+            continue
+        if role in WIN_EVIL_CODES:
+            evil += 1
+        else:
+            others += 1
+            if role == CRICETO:
+                criceto_alive = True
+
+    if not evil or evil >= others:
+        if criceto_alive:
+            return ("Criceto Mannaro", "Il Criceto Mannaro è sopravvissuto e vince da solo!")
+        if not evil:
+            return ("Villaggio", "Tutti i lupi sono stati eliminati!")
+        return ("Lupi", "I lupi hanno preso il controllo del villaggio!")
+    return None
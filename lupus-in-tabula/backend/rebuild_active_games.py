@@ -0,0 +1,40 @@
+"""
+Rebuild the user → active game index from scratch.
+
+    python rebuild_active_games.py [--sqlite] [path]
+
+``add_player`` sets the pointer and the end of a game clears it; run this
+if it ever drifts (e.g. a crash between the two writes of a join). With
+TinyDB run it only while the backend is stopped.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+
+from database import Database
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ricostruisce l'indice utente → partita in corso")
+    parser.add_argument("path", nargs="?", default=None,
+                        help="database (default: db.json, o lupus.sqlite con --sqlite)")
+    parser.add_argument("--sqlite", action="store_true",
+                        default=os.getenv("LUPUS_DB", "tinydb") == "sqlite",
+                        help="usa il backend SQLite (default: da LUPUS_DB)")
+    args = parser.parse_args()
+
+    if args.sqlite:
+        from sqlite_db import SQLiteDatabase
+        db = SQLiteDatabase(args.path or "lupus.sqlite")
+    else:
+        db = Database(args.path or "db.json", flush_every=0, flush_interval_ms=0)
+    try:
+        print(f"{db.rebuild_active_games()} giocatori in partita")
+        db.flush(wait=True)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Server-side phase scheduler.
+
+Keeps a min-heap of ``phase_end_time`` deadlines, one live entry per game,
+and calls ``advance(game_id)`` in a worker thread when a deadline expires.
+Advances run one at a time, so each phase is resolved exactly once and
+never on a client's request path.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import time
+from typing import Callable
+
+log = logging.getLogger(__name__)
+
+RETRY_DELAY = 5  # seconds before retrying a failed advance
+
+
+class PhaseScheduler:
+    def __init__(self, advance: Callable[[str], None]):
+        self._advance = advance
+        self._heap: list[tuple[float, str]] = []
+        self._deadlines: dict[str, float] = {}  # game_id -> live deadline
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    # ── Lifecycle ──────────────────────────────────────
+
+    def start(self):
+        """Start the loop task (call from within the running event loop)."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._loop = None
+
+    # ── Scheduling ─────────────────────────────────────
+
+    def schedule(self, game_id: str, deadline: float):
+        """Thread-safe: (re)arm the deadline of ``game_id``."""
+        if self._loop is None:
+            self._push(game_id, deadline)
+        else:
+            self._loop.call_soon_threadsafe(self._push, game_id, deadline)
+
+    def cancel(self, game_id: str):
+        """Thread-safe: drop the pending deadline of ``game_id``."""
+        if self._loop is None:
+            self._deadlines.pop(game_id, None)
+        else:
+            self._loop.call_soon_threadsafe(self._deadlines.pop, game_id, None)
+
+    def pending(self) -> int:
+        return len(self._deadlines)
+
+    def _push(self, game_id: str, deadline: float):
+        if self._deadlines.get(game_id) == deadline:
+            return  # already armed (e.g. the leader rescanning running games)
+        # Older heap entries for the game become stale and are skipped
+        self._deadlines[game_id] = deadline
+        heapq.heappush(self._heap, (deadline, game_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            if not self._heap:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            deadline, game_id = self._heap[0]
+            if self._deadlines.get(game_id) != deadline:
+                heapq.heappop(self._heap)
+                continue
+
+            delay = deadline - time.time()
+            if delay > 0:
+                # Sleep until the deadline, or until an earlier one is pushed
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            heapq.heappop(self._heap)
+            del self._deadlines[game_id]
+            try:
+                await asyncio.to_thread(self._advance, game_id)
+            except Exception:
+                log.exception("Phase advance failed for game %s", game_id)
+                if game_id not in self._deadlines:
+                    self._push(game_id, time.time() + RETRY_DELAY)
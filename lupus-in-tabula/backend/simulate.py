@@ -0,0 +1,345 @@
+"""
+Monte Carlo balance simulator.
+
+    python simulate.py --games 100000
+    python simulate.py --min 6 --max 12 --bots veggente --distributions attuale
+
+Plays whole games between bots using the real night resolver and win
+check (``night.resolve_night`` / ``night.check_win``), for every player
+count and role distribution, and prints the win rate of each faction.
+Games are split in chunks over a process pool (one worker per core by
+default).
+
+Distributions: ``attuale`` is ``models.get_role_distribution``;
+``alternativa`` is the commented-out version kept in models.py.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+
+from models import EVIL_ROLES, ROLE_CODE, Role, get_role_distribution
+from night import (
+    COPY, EXPLODE, KILL, LUPO, PROTECT, PROTETTORE, VEGGENTE, WOLF_CODES,
+    check_win, resolve_night,
+)
+
+KAMIKAZE = ROLE_CODE[Role.KAMIKAZE.value]
+MITOMANE = ROLE_CODE[Role.MITOMANE.value]
+EVIL_CODES = frozenset(ROLE_CODE[v] for v in EVIL_ROLES)
+
+MAX_TURNS = 40
+STALEMATE = "Stallo"
+FACTIONS = ("Lupi", "Villaggio", "Criceto Mannaro", STALEMATE)
+
+
+# ── Role distributions ─────────────────────────────────
+
+def alternative_role_distribution(n: int) -> list[Role]:
+    """The commented-out alternative in models.py."""
+    if n < 6:
+        raise ValueError("Minimo 6 giocatori")
+    roles: list[Role] = [Role.VEGGENTE, Role.PROTETTORE, Role.VILLICO, Role.VILLICO]
+    remaining_wolves = max(1, n // 4)
+    if remaining_wolves >= 3:
+        roles.extend([Role.ORACOLO, Role.KAMIKAZE])
+        remaining_wolves -= 2
+    elif remaining_wolves >= 2:
+        roles.append(Role.KAMIKAZE)
+        remaining_wolves -= 1
+    roles.extend([Role.LUPO] * remaining_wolves)
+    remaining = n - len(roles)
+    optional = [Role.MEDIUM, Role.INDEMONIATO, Role.MITOMANE, Role.CRICETO,
+                Role.MASSONE, Role.MASSONE]
+    for role in optional:
+        if remaining <= 0:
+            break
+        roles.append(role)
+        remaining -= 1
+    roles.extend([Role.VILLICO] * max(0, remaining))
+    return roles
+
+
+DISTRIBUTIONS: dict[str, Callable[[int], list[Role]]] = {
+    "attuale": get_role_distribution,
+    "alternativa": alternative_role_distribution,
+}
+
+
+# ── Bots ───────────────────────────────────────────────
+
+class RandomBots:
+    """Everyone plays at random; the wolf pack agrees on one victim."""
+
+    explode_chance = 0.2
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.random = rng.random
+
+    def new_game(self, roles: list[int]):
+        pass
+
+    def pick(self, seq: list[int]) -> int:
+        return seq[int(self.random() * len(seq))]
+
+    def pick_other(self, living: list[int], me: int) -> int:
+        """A living player other than ``me`` (needs two living players)."""
+        t = me
+        while t == me:
+            t = living[int(self.random() * len(living))]
+        return t
+
+    def night(self, turn: int, roles: list[int], alive: list[bool],
+              kamikaze_used: list[bool]) -> list[tuple[int, int, int]]:
+        living = [i for i, a in enumerate(alive) if a]
+        if len(living) < 2:
+            return []
+        actions = []
+        prey = [i for i in living if roles[i] not in WOLF_CODES]
+        victim = self.wolf_target(roles, prey) if prey else None
+        for i in living:
+            role = roles[i]
+            if role == LUPO:
+                if victim is not None:
+                    actions.append((i, victim, KILL))
+            elif role == KAMIKAZE:
+                if not kamikaze_used[i] and self.random() < self.explode_chance:
+                    actions.append((i, self.pick_other(living, i), EXPLODE))
+                elif victim is not None and victim != i:
+                    actions.append((i, victim, KILL))
+            elif role == PROTETTORE:
+                actions.append((i, self.protect_target(roles, living, i), PROTECT))
+            elif role == VEGGENTE:
+                self.inspect(i, self.inspect_target(roles, living, i), roles)
+            elif role == MITOMANE and turn == 2:
+                actions.append((i, self.pick_other(living, i), COPY))
+        return actions
+
+    def wolf_target(self, roles: list[int], prey: list[int]) -> int:
+        return self.pick(prey)
+
+    def protect_target(self, roles: list[int], living: list[int], me: int) -> int:
+        return self.pick_other(living, me)
+
+    def inspect_target(self, roles: list[int], living: list[int], me: int) -> int:
+        return self.pick_other(living, me)
+
+    def inspect(self, seer: int, target: int, roles: list[int]):
+        """Result of a Veggente inspection (known at once, as in submit_action)."""
+
+    def day(self, turn: int, roles: list[int], alive: list[bool]) -> list[int]:
+        """One vote target per living player."""
+        living = [i for i, a in enumerate(alive) if a]
+        if len(living) < 2:
+            return []
+        return [self.pick_other(living, i) for i in living]
+
+
+class SeerBots(RandomBots):
+    """The Veggente inspects unknown players and names the wolves it finds;
+    the village votes them, the Protettore guards a Veggente that spoke,
+    and the wolves hunt it."""
+
+    def new_game(self, roles: list[int]):
+        self.checked: set[int] = set()
+        self.exposed: list[int] = []      # wolves named by a Veggente
+        self.seers_out: set[int] = set()  # Veggenti that have spoken
+
+    def wolf_target(self, roles, prey):
+        if self.seers_out:
+            out = [i for i in prey if i in self.seers_out]
+            if out:
+                return self.pick(out)
+        return self.pick(prey)
+
+    def protect_target(self, roles, living, me):
+        if self.seers_out:
+            out = [i for i in living if i != me and i in self.seers_out]
+            if out:
+                return self.pick(out)
+        return self.pick_other(living, me)
+
+    def inspect_target(self, roles, living, me):
+        unknown = [i for i in living if i != me and i not in self.checked]
+        return self.pick(unknown) if unknown else self.pick_other(living, me)
+
+    def inspect(self, seer, target, roles):
+        if target in self.checked:
+            return
+        self.checked.add(target)
+        if roles[target] in WOLF_CODES:
+            self.exposed.append(target)
+            self.seers_out.add(seer)
+
+    def day(self, turn, roles, alive):
+        suspects = [i for i in self.exposed if alive[i]]
+        if not suspects:
+            return super().day(turn, roles, alive)
+        living = [i for i, a in enumerate(alive) if a]
+        innocents = [i for i in living if roles[i] not in WOLF_CODES]
+        votes = []
+        for i in living:
+            # Evil players push an innocent, everyone else a named wolf
+            choices = innocents if roles[i] in EVIL_CODES else suspects
+            if len(choices) > 1 or (choices and choices[0] != i):
+                votes.append(self.pick_other(choices, i) if i in choices else self.pick(choices))
+        return votes
+
+
+BOTS: dict[str, type[RandomBots]] = {
+    "casuali": RandomBots,
+    "veggente": SeerBots,
+}
+
+
+# ── Simulation core ────────────────────────────────────
+
+_NICKS = [str(i) for i in range(64)]
+
+
+def play(roles: list[int], bots: RandomBots) -> tuple[str, int]:
+    """Play one game to the end; return (winner, turns)."""
+    n = len(roles)
+    roles = list(roles)
+    alive = [True] * n
+    kamikaze_used = [False] * n
+    nicknames = _NICKS[:n]
+    bots.new_game(roles)
+    for turn in range(1, MAX_TURNS + 1):
+        out = resolve_night(turn, roles, alive, nicknames,
+                            bots.night(turn, roles, alive, kamikaze_used))
+        for i, role in out.role_changes.items():
+            roles[i] = role
+        for i in out.kamikaze_used:
+            kamikaze_used[i] = True
+        for i in out.deaths:
+            alive[i] = False
+        winner = check_win(roles, alive)
+        if winner:
+            return winner[0], turn
+
+        votes = bots.day(turn, roles, alive)
+        if votes:
+            counts = Counter(votes)
+            top = max(counts.values())
+            for t, c in counts.items():
+                if c == top:  # tie -> all tied die
+                    alive[t] = False
+        winner = check_win(roles, alive)
+        if winner:
+            return winner[0], turn
+    return STALEMATE, MAX_TURNS
+
+
+def simulate_chunk(distribution: str, n: int, bots: str, games: int, seed: str) -> dict:
+    rng = random.Random(seed)
+    base = [ROLE_CODE[r.value] for r in DISTRIBUTIONS[distribution](n)]
+    players = BOTS[bots](rng)
+    wins: Counter[str] = Counter()
+    turns = 0
+    for _ in range(games):
+        roles = base[:]
+        rng.shuffle(roles)
+        winner, t = play(roles, players)
+        wins[winner] += 1
+        turns += t
+    return {"wins": dict(wins), "turns": turns, "games": games}
+
+
+def run(args) -> dict:
+    keys = [(d, b, n) for b in args.bots for d in args.distributions
+            for n in range(args.min, args.max + 1)]
+    results = {k: {"wins": Counter(), "turns": 0, "games": 0} for k in keys}
+    started = time.perf_counter()
+    with ProcessPoolExecutor(args.workers) as pool:
+        futures = {}
+        for d, b, n in keys:
+            for k, start in enumerate(range(0, args.games, args.chunk)):
+                games = min(args.chunk, args.games - start)
+                seed = f"{args.seed}-{d}-{b}-{n}-{k}"
+                futures[pool.submit(simulate_chunk, d, n, b, games, seed)] = (d, b, n)
+        for fut, key in futures.items():
+            part = fut.result()
+            acc = results[key]
+            acc["wins"].update(part["wins"])
+            acc["turns"] += part["turns"]
+            acc["games"] += part["games"]
+    elapsed = time.perf_counter() - started
+    return {
+        "elapsed_s": elapsed,
+        "games": sum(r["games"] for r in results.values()),
+        "results": [
+            {"distribution": d, "bots": b, "players": n, "games": r["games"],
+             "avg_turns": r["turns"] / r["games"],
+             "win_rate": {f: r["wins"].get(f, 0) / r["games"] for f in FACTIONS}}
+            for (d, b, n), r in results.items()
+        ],
+    }
+
+
+def print_tables(res: dict, args):
+    rows = {(r["distribution"], r["bots"], r["players"]): r for r in res["results"]}
+    short = {"Lupi": "Lupi", "Villaggio": "Vill.", "Criceto Mannaro": "Cric.", STALEMATE: "Stallo"}
+    for b in args.bots:
+        print(f"\nbot: {b} — % vittorie su {args.games} partite per riga")
+        header = f"{'n':>3}"
+        for d in args.distributions:
+            header += f"  │ {d:^30}"
+        print(header)
+        sub = f"{'':>3}"
+        for _ in args.distributions:
+            sub += "  │ " + "".join(f"{short[f]:>6}" for f in FACTIONS) + f"{'turni':>6}"
+        print(sub)
+        for n in range(args.min, args.max + 1):
+            line = f"{n:>3}"
+            for d in args.distributions:
+                r = rows[(d, b, n)]
+                line += "  │ " + "".join(f"{r['win_rate'][f] * 100:6.1f}" for f in FACTIONS)
+                line += f"{r['avg_turns']:6.1f}"
+            print(line)
+    rate = res["games"] / res["elapsed_s"] if res["elapsed_s"] else 0
+    print(f"\n{res['games']} partite in {res['elapsed_s']:.1f}s ({rate:.0f}/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulatore Monte Carlo del bilanciamento dei ruoli")
+    parser.add_argument("--games", type=int, default=10_000,
+                        help="partite per distribuzione, bot e numero di giocatori")
+    parser.add_argument("--min", type=int, default=6, help="giocatori minimi")
+    parser.add_argument("--max", type=int, default=30, help="giocatori massimi")
+    parser.add_argument("--distributions", default=",".join(DISTRIBUTIONS),
+                        type=lambda s: s.split(","),
+                        help=f"distribuzioni dei ruoli ({', '.join(DISTRIBUTIONS)})")
+    parser.add_argument("--bots", default=",".join(BOTS), type=lambda s: s.split(","),
+                        help=f"strategie dei bot ({', '.join(BOTS)})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk", type=int, default=2_000, help="partite per task del pool")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="salva i risultati in questo file")
+    args = parser.parse_args()
+
+    for d in args.distributions:
+        if d not in DISTRIBUTIONS:
+            parser.error(f"distribuzione sconosciuta: {d}")
+    for b in args.bots:
+        if b not in BOTS:
+            parser.error(f"bot sconosciuti: {b}")
+    if not 6 <= args.min <= args.max:
+        parser.error("serve 6 <= --min <= --max")
+
+    res = run(args)
+    print_tables(res, args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(res, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+"""
+SQLite backend – same public API as ``database.Database``.
+
+Each table stores the document as JSON plus one real column per indexed
+field (see ``database.INDEXES``), so every lookup is an indexed query.
+The database runs in WAL mode: readers never block the writer, and each
+write batch is a single ``BEGIN IMMEDIATE`` transaction.
+
+The file can be shared by several worker processes. Per-game versions
+live in a ``versions`` table, bumped in the same transaction as the
+write, so ETags, the /game_state caches and the in-memory game
+aggregates see writes made by any worker. ``game_lock`` holds the write
+lock for a whole check-and-write section, so the rules of a game (e.g.
+its player limit) hold across workers too.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+from archive import GameArchive
+from database import (
+    BaseDatabase, GAME_KEY, INDEXES, PRIMARY_KEYS, SESSION_TTL, StaleGameError,
+)
+from game import ActiveGame
+
+
+class Row(dict):
+    """A decoded document, with its row id as ``doc_id`` like TinyDB's."""
+    __slots__ = ("doc_id",)
+
+    def __init__(self, data: dict, doc_id: int):
+        super().__init__(data)
+        self.doc_id = doc_id
+
+
+class _Table:
+    """Table handle with its SQL prepared once (sqlite3 caches statements)."""
+
+    def __init__(self, name: str, indexes: dict[str, tuple[str, ...]]):
+        self.name = name
+        self.indexes = indexes
+        self.columns = tuple(dict.fromkeys(f for fields in indexes.values() for f in fields))
+        cols = ", ".join(self.columns)
+        marks = ", ".join("?" for _ in self.columns)
+        sets = ", ".join(f"{c} = ?" for c in self.columns)
+        self.schema = [
+            f"CREATE TABLE IF NOT EXISTS {name} "
+            f"(doc_id INTEGER PRIMARY KEY, {', '.join(f'{c} TEXT' for c in self.columns)}, "
+            f"data TEXT NOT NULL)",
+            *(f"CREATE INDEX IF NOT EXISTS ix_{name}_{ix} ON {name} ({', '.join(fields)})"
+              for ix, fields in indexes.items()),
+        ]
+        self.select = {
+            ix: f"SELECT doc_id, data FROM {name} WHERE "
+                + " AND ".join(f"{f} = ?" for f in fields) + " ORDER BY doc_id"
+            for ix, fields in indexes.items()
+        }
+        self.select_one = {ix: sql + " LIMIT 1" for ix, sql in self.select.items()}
+        self.page = {
+            ix: f"SELECT doc_id, data FROM {name} WHERE "
+                + " AND ".join(f"{f} = ?" for f in fields)
+                + " AND doc_id < ? ORDER BY doc_id DESC LIMIT ?"
+            for ix, fields in indexes.items()
+        }
+        self.scan = f"SELECT doc_id, data FROM {name} ORDER BY doc_id"
+        self.get = f"SELECT data FROM {name} WHERE doc_id = ?"
+        self.insert = f"INSERT INTO {name} ({cols}, data) VALUES ({marks}, ?)"
+        self.insert_with_id = f"INSERT INTO {name} (doc_id, {cols}, data) VALUES (?, {marks}, ?)"
+        self.update = f"UPDATE {name} SET {sets}, data = ? WHERE doc_id = ?"
+        self.delete = f"DELETE FROM {name} WHERE doc_id = ?"
+        self.clear = f"DELETE FROM {name}"
+
+    def values(self, doc: dict) -> list:
+        return [doc.get(c) for c in self.columns]
+
+
+class SQLiteEventLog:
+    """Event log stored in an ``events`` table, same interface as ``EventLog``."""
+
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS events "
+        "(id INTEGER PRIMARY KEY, game_id TEXT NOT NULL, turn INTEGER, data TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_events_game_turn ON events (game_id, turn)",
+    ]
+
+    def __init__(self, db: SQLiteDatabase):
+        self._db = db
+
+    def append(self, game_id: str, events: Iterable[dict]):
+        rows = [(game_id, e.get("turn"), json.dumps(e, ensure_ascii=False)) for e in events]
+        if rows:
+            with self._db._transaction() as conn:
+                conn.executemany(
+                    "INSERT INTO events (game_id, turn, data) VALUES (?, ?, ?)", rows)
+
+    def read(self, game_id: str, turn: int | None = None) -> Iterator[dict]:
+        conn = self._db._conn()
+        if turn is None:
+            cur = conn.execute(
+                "SELECT data FROM events WHERE game_id = ? ORDER BY id", (game_id,))
+        else:
+            cur = conn.execute(
+                "SELECT data FROM events WHERE game_id = ? AND turn = ? ORDER BY id",
+                (game_id, turn))
+        for (data,) in cur.fetchall():
+            yield json.loads(data)
+
+    def exists(self, game_id: str) -> bool:
+        cur = self._db._conn().execute(
+            "SELECT 1 FROM events WHERE game_id = ? LIMIT 1", (game_id,))
+        return cur.fetchone() is not None
+
+    def delete(self, game_id: str):
+        with self._db._transaction() as conn:
+            conn.execute("DELETE FROM events WHERE game_id = ?", (game_id,))
+
+
+class _Transaction:
+    """``BEGIN IMMEDIATE`` … ``COMMIT``; a savepoint when one is already open."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.nested = False
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.nested = self.conn.in_transaction
+        self.conn.execute("SAVEPOINT nested" if self.nested else "BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.nested:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+            return
+        if exc_type:
+            self.conn.execute("ROLLBACK TO nested")
+        self.conn.execute("RELEASE nested")
+
+
+class SQLiteDatabase(BaseDatabase):
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS versions "
+        "(game_id TEXT PRIMARY KEY, version INTEGER NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    ]
+    BUMP_VERSION = (
+        "INSERT INTO versions (game_id, version) VALUES (?, 1) "
+        "ON CONFLICT (game_id) DO UPDATE SET version = version + 1 RETURNING version"
+    )
+
+    # Other processes write too: no users/sessions caches, shared versions
+    shared = True
+
+    def __init__(self, path: str = "lupus.sqlite", flush_on_transition: bool = True,
+                 busy_timeout_ms: int = 5000, session_ttl: float = SESSION_TTL,
+                 archive_dir: str | None = None):
+        archive = GameArchive(archive_dir or os.path.join(os.path.dirname(path) or ".", "archive"))
+        super().__init__(None, archive, flush_on_transition, session_ttl, cache_size=0)
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._conns: list[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
+        self._tables = {name: _Table(name, idx) for name, idx in INDEXES.items()}
+        self.users = self._tables["users"]
+        self.sessions = self._tables["sessions"]
+        self.games = self._tables["games"]
+        self.players = self._tables["players"]
+        self.actions = self._tables["actions"]
+        self.votes = self._tables["votes"]
+        self.guesses = self._tables["guesses"]
+        self.history = self._tables["history"]
+        self.active_games = self._tables["active_games"]
+        self.events = SQLiteEventLog(self)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode = WAL")
+        for table in self._tables.values():
+            for sql in table.schema:
+                conn.execute(sql)
+        for sql in SQLiteEventLog.SCHEMA + self.SCHEMA:
+            conn.execute(sql)
+        with self._transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version_epoch', ?)",
+                         (uuid.uuid4().hex[:8],))
+            self.version_epoch = conn.execute(
+                "SELECT value FROM meta WHERE key = 'version_epoch'").fetchone()[0]
+        # Version of each cached aggregate when it was loaded (see load_game)
+        self._loaded_at: dict[str, int] = {}
+
+    # ── Connections ────────────────────────────────────
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread (FastAPI runs handlers in a pool)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    def _transaction(self) -> _Transaction:
+        return _Transaction(self._conn())
+
+    def close(self):
+        with self._conns_lock:
+            for conn in self._conns:
+                conn.close()
+            self._conns.clear()
+        self._local = threading.local()
+
+    def flush(self, wait: bool = False):
+        """Nothing to do: every write batch is committed on return."""
+
+    def compact(self):
+        """Rewrite the file without the free pages left by deleted rows."""
+        conn = self._conn()
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def flush_stats(self) -> dict:
+        conn = self._conn()
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "journal_mode": conn.execute("PRAGMA journal_mode").fetchone()[0],
+            "page_count": conn.execute("PRAGMA page_count").fetchone()[0],
+        }
+
+    # ── Versions ───────────────────────────────────────
+
+    def game_version(self, game_id: str) -> int:
+        row = self._conn().execute(
+            "SELECT version FROM versions WHERE game_id = ?", (game_id,)).fetchone()
+        return row[0] if row else 0
+
+    def game_versions(self, game_ids: list[str]) -> dict[str, int]:
+        versions = dict.fromkeys(game_ids, 0)
+        for i in range(0, len(game_ids), 500):
+            chunk = game_ids[i:i + 500]
+            versions.update(self._conn().execute(
+                f"SELECT game_id, version FROM versions "
+                f"WHERE game_id IN ({', '.join('?' * len(chunk))})", chunk).fetchall())
+        return versions
+
+    def _bump_versions(self, conn: sqlite3.Connection, writes: list[tuple[str, dict]]):
+        """Bump the version of every game touched by ``writes`` (inside the transaction)."""
+        game_ids = {doc.get(GAME_KEY[name]) for name, doc in writes if name in GAME_KEY}
+        for game_id in game_ids:
+            (version,) = conn.execute(self.BUMP_VERSION, (game_id,)).fetchone()
+            if self._loaded_at.get(game_id) == version - 1:
+                # Only this process wrote since the load: _touch keeps it in sync
+                self._loaded_at[game_id] = version
+            else:
+                self._loaded_at.pop(game_id, None)
+
+    @contextmanager
+    def game_lock(self, game_id: str):
+        """Serialise the writes to one game across every worker.
+
+        The process-local lock comes first, then a ``BEGIN IMMEDIATE``
+        transaction holding SQLite's write lock: checks and writes made
+        inside (e.g. the player count, the insert and the start of a join)
+        commit together, and no other worker writes in between.
+        """
+        with self.locks.hold(game_id):
+            conn = self._conn()
+            before = conn.total_changes
+            try:
+                with self._transaction():
+                    yield
+            except BaseException:
+                if conn.total_changes != before:
+                    # Rolled back: drop what this process cached of the game
+                    self._active.pop(game_id, None)
+                    self._loaded_at.pop(game_id, None)
+                raise
+
+    def load_game(self, game_id: str) -> ActiveGame | None:
+        ag = self._active.get(game_id)
+        if ag is not None and self._loaded_at.get(game_id) == self.game_version(game_id):
+            return ag
+        # Not cached, or written by another worker since: load it again.
+        # The version is read first, so the data is at least that new.
+        with self.locks.hold(game_id):
+            version = self.game_version(game_id)
+            ag = self._active.get(game_id)
+            if ag is not None and self._loaded_at.get(game_id) == version:
+                return ag
+            self._active.pop(game_id, None)
+            ag = self._load_game(game_id)
+            if game_id in self._active:
+                self._loaded_at[game_id] = version
+            return ag
+
+    def _write_aggregate(self, game_id: str, updates: list, removes: list, events: list[dict]):
+        """The changes of a saved aggregate and its events, in one transaction.
+
+        A compare-and-swap on the game's version: the write only goes
+        through if nobody wrote since the aggregate was loaded.
+        """
+        loaded_at = self._loaded_at.get(game_id)
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT version FROM versions WHERE game_id = ?", (game_id,)).fetchone()
+            if loaded_at is None or (row[0] if row else 0) != loaded_at:
+                self._loaded_at.pop(game_id, None)
+                raise StaleGameError(game_id)
+            self._write_batch(updates, removes, from_aggregate=True)
+            self.events.append(game_id, events)
+
+    # ── Storage primitives ─────────────────────────────
+
+    def _find(self, table: _Table, index: str, *key) -> list[dict]:
+        cur = self._conn().execute(table.select[index], key)
+        return [Row(json.loads(data), doc_id) for doc_id, data in cur.fetchall()]
+
+    def _find_one(self, table: _Table, index: str, *key) -> dict | None:
+        row = self._conn().execute(table.select_one[index], key).fetchone()
+        return Row(json.loads(row[1]), row[0]) if row else None
+
+    def _find_page(self, table: _Table, index: str, key: tuple, before: int | None,
+                   limit: int) -> list[dict]:
+        before = (1 << 63) - 1 if before is None else before
+        cur = self._conn().execute(table.page[index], (*key, before, limit))
+        return [Row(json.loads(data), doc_id) for doc_id, data in cur.fetchall()]
+
+    def _count(self, table: _Table, index: str, keys: list) -> dict:
+        counts = dict.fromkeys(keys, 0)
+        field = table.indexes[index][0]
+        # Chunked to stay under SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            cur = self._conn().execute(
+                f"SELECT {field}, COUNT(*) FROM {table.name} "
+                f"WHERE {field} IN ({', '.join('?' * len(chunk))}) GROUP BY {field}", chunk)
+            counts.update(cur.fetchall())
+        return counts
+
+    def _scan(self, table: _Table) -> Iterator[dict]:
+        for doc_id, data in self._conn().execute(table.scan):
+            yield Row(json.loads(data), doc_id)
+
+    def _insert(self, table: _Table, doc: dict) -> int:
+        with self._transaction() as conn:
+            cur = conn.execute(table.insert, (*table.values(doc), json.dumps(doc)))
+            self._bump_versions(conn, [(table.name, doc)])
+        self._touch([(table.name, doc)])
+        return cur.lastrowid
+
+    def _insert_many(self, table: _Table, docs: list[dict]):
+        if not docs:
+            return
+        with self._transaction() as conn:
+            conn.executemany(table.insert, [(*table.values(d), json.dumps(d)) for d in docs])
+            self._bump_versions(conn, [(table.name, doc) for doc in docs])
+        self._touch([(table.name, doc) for doc in docs])
+
+    def _upsert(self, table: _Table, doc: dict, alternates: list[tuple] = ()):
+        """Insert ``doc`` or overwrite the row with its primary key, in one transaction."""
+        index = PRIMARY_KEYS[table.name]
+        keys = [tuple(doc.get(f) for f in table.indexes[index]), *alternates]
+        with self.game_lock(doc[GAME_KEY[table.name]]):
+            with self._transaction() as conn:
+                ids = [doc_id for key in keys
+                       for doc_id, _ in conn.execute(table.select[index], key)]
+                if ids:
+                    conn.execute(table.update, (*table.values(doc), json.dumps(doc), ids[0]))
+                    conn.executemany(table.delete, [(doc_id,) for doc_id in ids[1:]])
+                else:
+                    conn.execute(table.insert, (*table.values(doc), json.dumps(doc)))
+                self._bump_versions(conn, [(table.name, doc)])
+            self._touch([(table.name, doc)])
+
+    def _write_batch(self, updates=(), removes=(), from_aggregate: bool = False):
+        """Apply updates and removes in one transaction.
+
+        ``updates`` holds ``(table, doc_ids, data)``, ``removes`` holds
+        ``(table, doc_ids)``, as for the TinyDB backend (``data`` may be a
+        function of the stored document).
+        """
+        writes: list[tuple[str, dict]] = []
+        with self._transaction() as conn:
+            for table, doc_ids, data in updates:
+                for doc_id in doc_ids:
+                    row = conn.execute(table.get, (doc_id,)).fetchone()
+                    if row is None:
+                        continue
+                    doc = json.loads(row[0])
+                    doc.update(data(doc) if callable(data) else data)
+                    conn.execute(table.update, (*table.values(doc), json.dumps(doc), doc_id))
+                    writes.append((table.name, doc))
+            for table, doc_ids in removes:
+                for doc_id in doc_ids:
+                    row = conn.execute(table.get, (doc_id,)).fetchone()
+                    if row is None:
+                        continue
+                    conn.execute(table.delete, (doc_id,))
+                    writes.append((table.name, json.loads(row[0])))
+            self._bump_versions(conn, writes)
+        if writes:
+            self._touch(writes, from_aggregate)
+
+    # ── Import ─────────────────────────────────────────
+
+    def import_tables(self, tables: dict[str, dict[str, dict]]) -> dict[str, int]:
+        """Insert raw TinyDB tables (``{table: {doc_id: doc}}``) keeping their ids."""
+        counts = {}
+        with self._transaction() as conn:
+            for name, docs in tables.items():
+                table = self._tables.get(name)
+                if table is None:
+                    continue
+                conn.executemany(table.insert_with_id, [
+                    (int(doc_id), *table.values(doc), json.dumps(doc))
+                    for doc_id, doc in docs.items()
+                ])
+                counts[name] = len(docs)
+        return counts
+
+    # ── Utility ────────────────────────────────────────
+
+    def reset(self):
+        # versions survive: a new game must never reuse an old (id, version) ETag
+        with self._transaction() as conn:
+            for table in self._tables.values():
+                conn.execute(table.clear)
+            conn.execute("DELETE FROM events")
+        self.archive.clear()
+        self._active.clear()
+        self._loaded_at.clear()
+        for cache in self._cache.values():
+            cache.clear()
+
@@ -0,0 +1,161 @@
+"""
+TinyDB storage with a durable, bounded flush policy.
+
+``FlushingMiddleware`` keeps the whole database in memory like TinyDB's
+``CachingMiddleware``, but writes it back from a background thread:
+every N writes, every T milliseconds, or when explicitly requested
+(e.g. at a phase transition). ``ORJSONStorage`` writes through a
+temporary file and ``os.replace`` so a crash never leaves a torn db.json.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+
+import orjson
+from tinydb.middlewares import Middleware
+from tinydb.storages import Storage
+
+log = logging.getLogger(__name__)
+
+
+class ORJSONStorage(Storage):
+    def __init__(self, path: str):
+        self.path = path
+
+    def read(self) -> dict | None:
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return None
+        if not raw:
+            return None
+        return self._loads(raw)
+
+    def write(self, data: dict):
+        self.write_payload(self.dumps(data))
+
+    def write_payload(self, payload: bytes):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def close(self):
+        pass
+
+    def _loads(self, raw: bytes) -> dict:
+        return orjson.loads(raw)
+
+    def dumps(self, data: dict) -> bytes:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FlushingMiddleware(Middleware):
+    def __init__(self, storage_cls=ORJSONStorage,
+                 flush_every: int = 50, flush_interval_ms: int = 1000):
+        super().__init__(storage_cls)
+        self.cache: dict | None = None
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval_ms / 1000 if flush_interval_ms > 0 else None
+        # Held for a whole batch mutation of the cache and while dumping it,
+        # so a flush never sees half a write (see Database._write_batch)
+        self.data_lock = threading.RLock()
+        self._lock = threading.Lock()
+        self._pending = 0       # writes not yet on disk
+        self._wanted = threading.Event()
+        self._done = threading.Condition(self._lock)
+        self._flushes = 0       # completed flushes, for flush(wait=True)
+        self._closed = False
+        self._thread: threading.Thread | None = None
+        self.metrics = {
+            "flushes": 0, "errors": 0, "last_ms": 0.0, "max_ms": 0.0,
+            "total_ms": 0.0, "last_at": 0.0, "last_writes": 0,
+        }
+
+    def __call__(self, *args, **kwargs):
+        self.storage = self._storage_cls(*args, **kwargs)
+        self._thread = threading.Thread(target=self._run, name="db-flush", daemon=True)
+        self._thread.start()
+        return self
+
+    # ── Storage API ────────────────────────────────────
+
+    def read(self):
+        if self.cache is None:
+            self.cache = self.storage.read()
+        return self.cache
+
+    def write(self, data):
+        self.cache = data
+        with self._lock:
+            self._pending += 1
+            due = self.flush_every > 0 and self._pending >= self.flush_every
+        if due:
+            self._wanted.set()
+
+    def close(self):
+        self._closed = True
+        self._wanted.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._flush()
+        self.storage.close()
+
+    # ── Flushing ───────────────────────────────────────
+
+    def flush(self, wait: bool = False, timeout: float = 10):
+        """Ask the background thread to flush; optionally block until done."""
+        with self._lock:
+            if not self._pending:
+                return
+            target = self._flushes + 1
+        self._wanted.set()
+        if wait:
+            with self._done:
+                self._done.wait_for(lambda: self._flushes >= target or self._closed, timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self.metrics, "pending_writes": self._pending}
+
+    def _run(self):
+        while not self._closed:
+            self._wanted.wait(self.flush_interval)
+            self._wanted.clear()
+            if not self._closed:
+                self._flush()
+
+    def _flush(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = 0
+        if not pending or self.cache is None:
+            return
+        start = time.perf_counter()
+        try:
+            with self.data_lock:
+                payload = self.storage.dumps(self.cache)
+            self.storage.write_payload(payload)  # fsync and rename outside the lock
+        except Exception:
+            log.exception("db flush failed, %d writes kept pending", pending)
+            with self._lock:
+                self._pending += pending
+                self.metrics["errors"] += 1
+            return
+        ms = (time.perf_counter() - start) * 1000
+        with self._done:
+            m = self.metrics
+            m["flushes"] += 1
+            m["last_ms"] = ms
+            m["max_ms"] = max(m["max_ms"], ms)
+            m["total_ms"] += ms
+            m["last_at"] = time.time()
+            m["last_writes"] = pending
+            self._flushes += 1
+            self._done.notify_all()
@@ -29,8 +29,9 @@ export const api = {
 
   createGame: (target_players) => request('POST', '/create_game', { target_players }),
   joinGame: (gameId) => request('POST', `/join_game/${gameId}`),
-  listGames: () => request('GET', '/games'),
+  listGames: () => request('GET', '/games?min_free=1'),
   gameState: (gameId) => request('GET', `/game_state/${gameId}`),
+  gameStateStreamUrl: (gameId) => `${BASE}/game_state/${gameId}/stream`,
 
   submitAction: (gameId, target_id, action_type) =>
     request('POST', `/action/${gameId}`, { target_id, action_type }),
@@ -39,6 +40,6 @@ export const api = {
   submitGuess: (gameId, target_id, guessed_role) =>
     request('POST', `/guess/${gameId}`, { target_id, guessed_role }),
 
-  history: () => request('GET', '/history'),
+  history: (cursor) => request('GET', cursor ? `/history?cursor=${cursor}` : '/history'),
   gameHistory: (gameId) => request('GET', `/history/${gameId}`),
 };
@@ -1,21 +1,16 @@
 import { useState, useEffect } from 'react';
 
-export default function Timer({ secondsLeft }) {
-  const [localSeconds, setLocalSeconds] = useState(secondsLeft);
+// Counts down locally to the server's phase_end_time (epoch seconds);
+// offset is the server clock minus the local one
+export default function Timer({ endTime, offset = 0 }) {
+  const [now, setNow] = useState(() => Date.now());
 
-  // Sync with server time when it changes
   useEffect(() => {
-    setLocalSeconds(secondsLeft);
-  }, [secondsLeft]);
-
-  // Local countdown every second
-  useEffect(() => {
-    const id = setInterval(() => {
-      setLocalSeconds(prev => Math.max(0, prev - 1));
-    }, 1000);
+    const id = setInterval(() => setNow(Date.now()), 1000);
     return () => clearInterval(id);
   }, []);
 
+  const localSeconds = Math.max(0, Math.ceil(endTime - (now / 1000 + offset)));
   const mins = Math.floor(localSeconds / 60);
   const secs = localSeconds % 60;
   const urgent = localSeconds <= 30;
@@ -78,7 +78,7 @@ export default function GamePage() {
     );
   }
 
-  const { state, me, players, turn_number, timer_seconds_left, roles_in_game, events } = gs;
+  const { state, me, players, turn_number, phase_end_time, clock_offset, roles_in_game, events } = gs;
   const myRole = me?.role;
   const isWolf = myRole === 'Lupo';
   const allPlayers = players || [];
@@ -211,7 +211,7 @@ export default function GamePage() {
         <Navbar />
         <div className="max-w-lg mx-auto px-4 py-10">
           <div className="text-center mb-6">
-            <Timer secondsLeft={timer_seconds_left} />
+            <Timer endTime={phase_end_time} offset={clock_offset} />
             <p className="text-[var(--text-dim)] text-sm mt-2">Fase di rivelazione ruoli</p>
           </div>
 
@@ -370,7 +370,7 @@ export default function GamePage() {
                 </p>
               </div>
             </div>
-            <Timer secondsLeft={timer_seconds_left} />
+            <Timer endTime={phase_end_time} offset={clock_offset} />
           </div>
         </div>
 
@@ -541,7 +541,7 @@ export default function GamePage() {
               </div>
             </div>
             <div className="text-gray-900">
-              <Timer secondsLeft={timer_seconds_left} />
+              <Timer endTime={phase_end_time} offset={clock_offset} />
             </div>
           </div>
         </div>
@@ -9,14 +9,26 @@ const ROLE_EMOJI = {
   'Criceto Mannaro': '🐹', Mitomane: '🎭', Oracolo: '🔮', Villico: '🏘️',
 };
 
+const PAGE_SIZE = 50;  // server default for /history
+
 function HistoryList() {
   const [games, setGames] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [hasMore, setHasMore] = useState(false);
 
   useEffect(() => {
-    api.history().then(setGames).catch(() => {}).finally(() => setLoading(false));
+    api.history()
+      .then(page => { setGames(page); setHasMore(page.length === PAGE_SIZE); })
+      .catch(() => {})
+      .finally(() => setLoading(false));
   }, []);
 
+  const loadMore = () => {
+    api.history(games[games.length - 1].cursor)
+      .then(page => { setGames(prev => [...prev, ...page]); setHasMore(page.length === PAGE_SIZE); })
+      .catch(() => setHasMore(false));
+  };
+
   if (loading) return (
     <div className="flex justify-center pt-20">
       <span className="text-4xl animate-pulse">📜</span>
@@ -58,6 +70,12 @@ function HistoryList() {
           <span className="text-[var(--text-dim)] text-sm">→</span>
         </Link>
       ))}
+      {hasMore && (
+        <button onClick={loadMore}
+          className="w-full py-3 text-sm text-[var(--text-dim)] hover:text-[var(--accent)] transition">
+          Carica altre partite
+        </button>
+      )}
     </div>
   );
 }
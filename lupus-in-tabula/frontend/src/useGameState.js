@@ -5,6 +5,19 @@ export function useGameState(gameId) {
   const [state, setState] = useState(null);
   const [error, setError] = useState(null);
   const intervalRef = useRef(null);
+  const sourceRef = useRef(null);
+  const clockRef = useRef({ serverTime: null, offset: 0 });
+
+  // Server clock minus local clock, measured only on fresh payloads: a 304
+  // served from the browser cache repeats the old server_time
+  const withClock = useCallback((data) => {
+    const clock = clockRef.current;
+    if (data.server_time != null && data.server_time !== clock.serverTime) {
+      clock.serverTime = data.server_time;
+      clock.offset = data.server_time - Date.now() / 1000;
+    }
+    return { ...data, clock_offset: clock.offset };
+  }, []);
 
   const stopPolling = useCallback(() => {
     if (intervalRef.current) {
@@ -13,10 +26,17 @@ export function useGameState(gameId) {
     }
   }, []);
 
+  const stopStream = useCallback(() => {
+    if (sourceRef.current) {
+      sourceRef.current.close();
+      sourceRef.current = null;
+    }
+  }, []);
+
   const poll = useCallback(async () => {
     if (!gameId) return;
     try {
-      const data = await api.gameState(gameId);
+      const data = withClock(await api.gameState(gameId));
       setState(data);
       setError(null);
       if (data.state === 'GAME_OVER') {
@@ -25,16 +45,45 @@ export function useGameState(gameId) {
     } catch (e) {
       setError(e.message);
     }
-  }, [gameId, stopPolling]);
+  }, [gameId, stopPolling, withClock]);
+
+  const startPolling = useCallback(() => {
+    stopPolling();
+    poll();
+    intervalRef.current = setInterval(poll, 5000);
+  }, [poll, stopPolling]);
 
   useEffect(() => {
     stopPolling();
+    stopStream();
     if (!gameId) return;
-    poll();
-    const id = setInterval(poll, 5000);
-    intervalRef.current = id;
-    return () => stopPolling();
-  }, [gameId, poll, stopPolling]);
+
+    // Push updates via SSE; fall back to polling if the stream is unavailable
+    if (typeof EventSource === 'undefined') {
+      startPolling();
+      return () => stopPolling();
+    }
+    const source = new EventSource(api.gameStateStreamUrl(gameId), { withCredentials: true });
+    sourceRef.current = source;
+    source.onmessage = (ev) => {
+      const data = withClock(JSON.parse(ev.data));
+      setState(data);
+      setError(null);
+      if (data.state === 'GAME_OVER') {
+        stopStream();
+      }
+    };
+    source.onerror = () => {
+      // Stream closed by the server after GAME_OVER, or broken: poll instead
+      if (sourceRef.current !== source) return;
+      stopStream();
+      startPolling();
+    };
+    return () => {
+      stopStream();
+      stopPolling();
+    };
+  }, [gameId, startPolling, stopPolling, stopStream, withClock]);
 
   return { state, error, refresh: poll };
 }